@@ -0,0 +1,27 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from copy import deepcopy
+
+import pytest
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+@pytest.fixture
+def gitlab_api():
+    with FakeGitlabAPI(n_pending=1) as gitlab_api:
+        yield gitlab_api
+
+
+@pytest.fixture
+def runner(gitlab_api):
+    return Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+
+
+@pytest.fixture
+def job_info(runner):
+    """Description of a job as returned by GitLab"""
+    return deepcopy(runner.request_job()._job_info)
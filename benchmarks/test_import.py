@@ -0,0 +1,23 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import subprocess
+import sys
+import timeit
+
+# Maximum time in seconds which importing the package may add to the
+# interpreter's startup time
+IMPORT_THRESHOLD = 0.05
+
+
+def run_python(statement):
+    subprocess.check_call([sys.executable, "-c", statement])
+
+
+def test_import_package(benchmark):
+    baseline = min(timeit.repeat(lambda: run_python("pass"), number=1, repeat=10))
+    benchmark.pedantic(
+        run_python, args=("import gitlab_runner_api",), rounds=20, warmup_rounds=2
+    )
+    assert benchmark.stats.stats.min - baseline < IMPORT_THRESHOLD
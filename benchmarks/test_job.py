@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor
+import tracemalloc
+
+import pytest
+
+from gitlab_runner_api import Job, Runner, transport
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+@pytest.mark.parametrize("n_variables", [10, 100, 1000])
+def test_parse(benchmark, runner, job_info, n_variables):
+    job_info["variables"] += [
+        {"key": "VAR_" + str(i), "value": "value" + str(i), "public": False}
+        for i in range(n_variables)
+    ]
+    benchmark(Job, runner, job_info)
+
+
+@pytest.mark.parametrize("trace_size", [0, 1024**2, 16 * 1024**2])
+def test_dumps_loads(benchmark, runner, job_info, trace_size):
+    job = Job(runner, job_info, log="x" * trace_size)
+
+    def round_trip():
+        return Job.loads(job.dumps())
+
+    assert benchmark(round_trip) == job
+
+
+def test_request_job(benchmark, gitlab_api, runner):
+    rounds = 200
+    for _ in range(rounds):
+        gitlab_api.add_pending_job({"name": "MyJob"})
+    benchmark.pedantic(runner.request_job, rounds=rounds)
+
+
+def test_memory_per_job(benchmark, runner, job_info):
+    jobs = []
+
+    def create_job():
+        jobs.append(Job(runner, job_info))
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        benchmark.pedantic(create_job, rounds=100)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["bytes_per_job"] = (after - before) / len(jobs)
+
+
+@pytest.mark.parametrize("n_threads", [1, 8])
+def test_served_request_job(benchmark, n_threads):
+    rounds = 10
+    n_jobs = 100
+    with FakeGitlabAPI(serve=True) as gitlab_api:
+        runner = Runner.register(gitlab_api.url, gitlab_api.token)
+
+        def setup():
+            for _ in range(n_jobs):
+                gitlab_api.add_pending_job({"name": "MyJob"})
+
+        def run_jobs():
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                jobs = [executor.submit(runner.request_job) for _ in range(n_jobs)]
+            return [job.result() for job in jobs]
+
+        benchmark.pedantic(run_jobs, setup=setup, rounds=rounds)
+    benchmark.extra_info["requests_per_second"] = n_jobs / benchmark.stats["mean"]
+
+
+@pytest.mark.parametrize("name", ["requests", "session", "httpx", "in-process"])
+def test_transport_request_job(benchmark, name):
+    rounds = 200
+    if name == "in-process":
+        api, client = FakeGitlabAPI(in_process=True), None
+    else:
+        api = FakeGitlabAPI(serve=True)
+        if name == "requests":
+            client = transport.RequestsTransport()
+        elif name == "session":
+            client = transport.SessionTransport()
+        else:
+            pytest.importorskip("httpx")
+            client = transport.HTTPXTransport()
+    with api as gitlab_api:
+        runner = Runner.register(gitlab_api.url, gitlab_api.token, transport=client)
+        for _ in range(rounds):
+            gitlab_api.add_pending_job({"name": "MyJob"})
+        benchmark.pedantic(runner.request_job, rounds=rounds)
+    if client is not None:
+        client.close()
+
+
+@pytest.mark.parametrize("name", ["session", "http2"])
+def test_concurrent_trace_patches(benchmark, name):
+    rounds = 5
+    n_jobs = 50
+    if name == "session":
+        client = transport.SessionTransport(pool_maxsize=n_jobs)
+    else:
+        pytest.importorskip("httpx")
+        pytest.importorskip("h2")
+        client = transport.HTTPXTransport(http2=True, http1=False)
+    with FakeGitlabAPI(serve=True) as gitlab_api:
+        runner = Runner.register(gitlab_api.url, gitlab_api.token, transport=client)
+
+        def setup():
+            for _ in range(n_jobs):
+                gitlab_api.add_pending_job({"name": "MyJob"})
+
+        def run_job(_):
+            job = runner.request_job()
+            for i in range(10):
+                job.log += "Line " + str(i) + "\n"
+            job.set_success()
+
+        def run_jobs():
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(run_job, range(n_jobs)))
+
+        benchmark.pedantic(run_jobs, setup=setup, rounds=rounds)
+        benchmark.extra_info["connections"] = gitlab_api._rsps.connections
+    client.close()
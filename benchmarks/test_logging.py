@@ -0,0 +1,33 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import logging
+
+import pytest
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.logging import configure, logger
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+@pytest.fixture(params=[logging.INFO, logging.DEBUG], ids=["info", "debug"])
+def log_level(request):
+    handler = configure(level=request.param, stream=io.StringIO())
+    yield request.param
+    logger.removeHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+@pytest.mark.parametrize("size", [80, 64 * 1024])
+def test_log_append(benchmark, log_level, size):
+    line = "x" * (size - 1) + "\n"
+    with FakeGitlabAPI(n_pending=1) as gitlab_api:
+        runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+        job = runner.request_job()
+
+        def append():
+            job.log += line
+
+        benchmark(append)
@@ -0,0 +1,43 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.testing import FakeGitlabAPI, Workload
+
+
+def run_job(runner):
+    job = runner.request_job()
+    if job is None:
+        return
+    variables = {v.key: v.value for v in job.variables}
+    job.log += "x" * int(variables["WORKLOAD_LOG_SIZE"])
+    job.set_success()
+
+
+@pytest.mark.parametrize("n_runners", [1, 8])
+def test_dispatch(benchmark, n_runners):
+    n_jobs = 200
+    with FakeGitlabAPI(serve=True) as gitlab_api:
+        runners = [
+            Runner.register(gitlab_api.url, gitlab_api.token) for _ in range(n_runners)
+        ]
+
+        def setup():
+            Workload(n_jobs=n_jobs, seed=1, log_size=4096).run(gitlab_api)
+
+        def run_jobs():
+            with ThreadPoolExecutor(max_workers=n_runners) as executor:
+                for i in range(n_jobs):
+                    executor.submit(run_job, runners[i % n_runners])
+
+        benchmark.pedantic(run_jobs, setup=setup, rounds=3)
+        latencies = sorted(Workload.pickup_latencies(gitlab_api))
+
+    benchmark.extra_info["jobs_per_second"] = n_jobs / benchmark.stats["mean"]
+    benchmark.extra_info["pickup_latency_p50"] = latencies[len(latencies) // 2]
+    benchmark.extra_info["pickup_latency_p99"] = latencies[len(latencies) * 99 // 100]
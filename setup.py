@@ -21,9 +21,23 @@ setup(
     long_description=readme_text,
     url="https://github.com/chrisburr/gitlab-runner-api/",
     setup_requires=["setuptools_scm"],
-    install_requires=["setuptools", "colorlog", "requests", "six"],
+    install_requires=[
+        "setuptools",
+        "colorlog",
+        "requests",
+        "six",
+        'futures; python_version < "3"',
+        'importlib_metadata; python_version >= "3" and python_version < "3.8"',
+    ],
     tests_require=test_requires,
-    extras_require={"testing": test_requires},
+    extras_require={
+        "testing": test_requires,
+        "benchmark": test_requires + ["pytest-benchmark"],
+        "zstd": ["zstandard"],
+        # HTTPXTransport patches httpcore's connection pool for HTTP/2
+        "httpx": ["httpx>=0.23,<0.29"],
+        "http2": ["httpx[http2]>=0.23,<0.29", "httpcore>=0.15,<2"],
+    },
     entry_points={
         "console_scripts": ["register-runner=gitlab_runner_api:cli.register_runner"]
     },
@@ -2,30 +2,84 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from . import failure_reasons
-from . import utils
-from . import cli
+import importlib
+import sys
+
 from .exceptions import (
     AlreadyFinishedExcpetion,
     APIExcpetion,
+    ArtifactIntegrityException,
     AuthException,
     JobCancelledException,
+    MissingArtifactsException,
 )
-from .job import Job
-from .runner import Runner
-from .version import package_version
 
 
 __all__ = [
     "Runner",
     "Job",
+    "ArtifactCache",
+    "CacheSpec",
+    "LocalCacheStore",
     "cli",
     "failure_reasons",
+    "metrics",
+    "recording",
+    "tracing",
+    "transport",
     "utils",
     "AlreadyFinishedExcpetion",
     "APIExcpetion",
+    "ArtifactIntegrityException",
     "AuthException",
     "JobCancelledException",
+    "MissingArtifactsException",
+]
+
+# Attributes which are only imported when first used to keep importing the
+# package fast, mapped to the submodule which defines them
+_lazy_attributes = {
+    "Runner": "runner",
+    "Job": "job",
+    "ArtifactCache": "artifacts",
+    "CacheSpec": "cache",
+    "LocalCacheStore": "cache",
+    "__version__": "version",
+}
+_lazy_submodules = [
+    "cli",
+    "failure_reasons",
+    "metrics",
+    "recording",
+    "testing",
+    "tracing",
+    "transport",
+    "utils",
 ]
+# Submodules which are never imported eagerly, as testing needs the optional
+# responses package and cli is only used by the entry point
+_optional_submodules = ["cli", "testing"]
+
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        value = importlib.import_module("." + name, __name__)
+    elif name in _lazy_attributes:
+        module = importlib.import_module("." + _lazy_attributes[name], __name__)
+        value = getattr(module, "package_version" if name == "__version__" else name)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | {"__version__"})
+
 
-__version__ = package_version
+if sys.version_info < (3, 7):
+    # Module level __getattr__ requires PEP 562. Submodules can still be
+    # imported explicitly, so skip those which need optional dependencies.
+    for _name in _lazy_submodules + list(_lazy_attributes):
+        if _name not in _optional_submodules:
+            __getattr__(_name)
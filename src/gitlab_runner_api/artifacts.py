@@ -0,0 +1,761 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = [
+    "ArtifactCache",
+    "CHUNK_SIZE",
+    "build_archive",
+    "collect_paths",
+    "download_file",
+    "extract_archive",
+]
+
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import errno
+import glob
+import hashlib
+from io import BytesIO
+import multiprocessing
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import tempfile
+import time
+from uuid import uuid4
+import zipfile
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+try:
+    # Python 3
+    from urllib.parse import urlparse
+except ImportError:
+    # Python 2
+    from urlparse import urlparse
+
+import requests
+import six
+
+from . import metrics
+from .exceptions import (
+    APIExcpetion,
+    ArtifactIntegrityException,
+    AuthException,
+    MissingArtifactsException,
+)
+from .logging import logger
+
+CHUNK_SIZE = 1024 * 1024
+
+# os.replace is only available in Python 3
+_replace = getattr(os, "replace", os.rename)
+
+
+def _hash_file(filename, hasher, chunk_size=CHUNK_SIZE):
+    """Feed the contents of filename to hasher and return the number of bytes"""
+    size = 0
+    with open(filename, "rb") as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b""):
+            hasher.update(chunk)
+            size += len(chunk)
+    return size
+
+
+def download_file(
+    url,
+    headers,
+    dest,
+    sha256=None,
+    chunk_size=CHUNK_SIZE,
+    n_retries=3,
+    transport=None,
+):
+    """Stream a file from the GitLab API to disk.
+
+    Data is written to ``dest + ".part"`` as it arrives and the partial file
+    is only moved to ``dest`` once the download is complete. If a partial
+    file already exists the download is resumed using a HTTP Range request.
+
+    Parameters
+    ----------
+    url : :obj:`str`
+        URL to download
+    headers : :obj:`dict`
+        Headers to include in the request, typically containing ``JOB-TOKEN``
+    dest : :obj:`str`
+        Path to write the downloaded file to
+    sha256 : :obj:`str`, optional
+        Expected SHA-256 hex digest of the file
+    chunk_size : :obj:`int`, optional
+        Maximum number of bytes to hold in memory at once
+    n_retries : :obj:`int`, optional
+        Number of times to try resuming the download if the connection fails
+    transport : `gitlab_runner_api.transport.Transport`, optional
+        Transport to send the requests with, defaults to the current transport
+
+    Returns
+    -------
+    :obj:`str`
+        SHA-256 hex digest of the downloaded file
+    """
+    partial_fn = dest + ".part"
+    hasher = hashlib.sha256()
+    offset = 0
+    if os.path.isfile(partial_fn):
+        offset = _hash_file(partial_fn, hasher, chunk_size)
+
+    for i in range(1, n_retries + 1):
+        request_headers = dict(headers)
+        if offset:
+            request_headers["Range"] = "bytes=" + str(offset) + "-"
+        try:
+            response = metrics.request(
+                "GET",
+                url,
+                "jobs/:id/artifacts",
+                transport=transport,
+                headers=request_headers,
+                stream=True,
+            )
+            netloc = urlparse(response.url).netloc
+            if response.status_code == 200:
+                if offset:
+                    logger.info(
+                        "%s: Server ignored range request, restarting download of %s",
+                        netloc,
+                        url,
+                    )
+                hasher = hashlib.sha256()
+                offset = 0
+                mode = "wb"
+            elif response.status_code == 206:
+                logger.info("%s: Resuming download of %s at %d", netloc, url, offset)
+                mode = "ab"
+            elif response.status_code == 416:
+                # Either the partial file is already complete or it is corrupt
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                if total == str(offset):
+                    response.close()
+                    break
+                logger.warning(
+                    "%s: Invalid partial download of %s, restarting", netloc, url
+                )
+                os.remove(partial_fn)
+                hasher = hashlib.sha256()
+                offset = 0
+                response.close()
+                metrics.retry("jobs/:id/artifacts")
+                continue
+            elif response.status_code == 403:
+                logger.error("%s: Failed to authenticate to download %s", netloc, url)
+                response.close()
+                raise AuthException()
+            elif response.status_code == 404:
+                logger.error("%s: No artifacts found at %s", netloc, url)
+                response.close()
+                raise MissingArtifactsException(url)
+            else:
+                raise NotImplementedError(
+                    "Unrecognised status code from request", response, response.content
+                )
+
+            with open(partial_fn, mode) as fp:
+                for chunk in response.iter_content(chunk_size):
+                    fp.write(chunk)
+                    hasher.update(chunk)
+                    offset += len(chunk)
+            response.close()
+            break
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+        ) as e:
+            if i == n_retries:
+                raise
+            logger.warning(
+                "Caught error downloading %s on try %d of %d after %d bytes. %r",
+                url,
+                i,
+                n_retries,
+                offset,
+                e,
+            )
+            metrics.retry("jobs/:id/artifacts")
+    else:
+        raise APIExcpetion("Failed to download " + url + " after retrying")
+
+    digest = hasher.hexdigest()
+    if sha256 is not None and digest != sha256:
+        os.remove(partial_fn)
+        raise ArtifactIntegrityException(
+            "Expected SHA-256 " + sha256 + " for " + url + " but got " + digest
+        )
+    if os.path.exists(dest):
+        os.remove(dest)
+    os.rename(partial_fn, dest)
+    return digest
+
+
+def extract_archive(filename, dest):
+    """Extract a zip archive of artifacts into dest.
+
+    Parameters
+    ----------
+    filename : :obj:`str`
+        Path to the zip archive
+    dest : :obj:`str`
+        Directory to extract the archive into
+
+    Returns
+    -------
+    :obj:`list` of :obj:`str`
+        Names of the extracted members
+    """
+    with zipfile.ZipFile(filename) as zf:
+        zf.extractall(dest)
+        return zf.namelist()
+
+
+def _tmp_name(dirname):
+    return os.path.join(dirname, ".tmp-" + uuid4().hex)
+
+
+@contextmanager
+def _file_lock(filename):
+    """Exclusive lock which is shared between processes where supported"""
+    with open(filename, "a") as fp:
+        if fcntl is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+
+class ArtifactCache(object):
+    """Content addressed cache of artifacts archives which can be shared by jobs.
+
+    Archives are stored in ``blobs/<sha256>`` and ``jobs/<job_id>`` records
+    the hash of each job's archive. Archives are copied rather than linked
+    so that modifying a downloaded file can't corrupt the cache, and files
+    are only ever renamed into place so the cache can be used by multiple
+    processes at once. Once the cache grows beyond ``max_size`` bytes the
+    least recently used archives are removed along with the records of the
+    jobs which produced them.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        Directory in which to store the cache
+    max_size : :obj:`int`, optional
+        Maximum total size of the cached archives in bytes
+    """
+
+    def __init__(self, path, max_size=10 * 1024**3):
+        self._path = os.path.abspath(path)
+        self._max_size = max_size
+        for dirname in ["blobs", "jobs"]:
+            try:
+                os.makedirs(os.path.join(self._path, dirname))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def __repr__(self):
+        return "ArtifactCache(path={path}, max_size={max_size})".format(
+            path=self.path, max_size=self.max_size
+        )
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def _blob_fn(self, sha256):
+        return os.path.join(self._path, "blobs", sha256)
+
+    def _job_fn(self, job_id):
+        return os.path.join(self._path, "jobs", str(job_id))
+
+    def get(self, job_id, dest, sha256=None):
+        """Copy the cached archive for a job to dest.
+
+        Parameters
+        ----------
+        job_id : :obj:`int`
+            ID of the job which produced the artifacts
+        dest : :obj:`str`
+            Path to write the artifacts archive to
+        sha256 : :obj:`str`, optional
+            Expected SHA-256 hex digest of the archive
+
+        Returns
+        -------
+        :obj:`str` or None
+            SHA-256 hex digest of the archive or None if it is not cached
+        """
+        try:
+            with open(self._job_fn(job_id), "rt") as fp:
+                cached_sha256 = fp.read().strip()
+        except IOError:
+            return None
+        if sha256 is not None and cached_sha256 != sha256:
+            return None
+
+        blob_fn = self._blob_fn(cached_sha256)
+        # Don't use dest + ".part" as it may be a download which can be resumed
+        tmp_fn = _tmp_name(os.path.dirname(os.path.abspath(dest)))
+        try:
+            shutil.copyfile(blob_fn, tmp_fn)
+            # Mark as recently used for the eviction policy
+            os.utime(blob_fn, None)
+        except EnvironmentError:
+            # The archive was removed by another process
+            if os.path.exists(tmp_fn):
+                os.remove(tmp_fn)
+            return None
+        _replace(tmp_fn, dest)
+        logger.debug("Found artifacts of job %s in %r", job_id, self)
+        return cached_sha256
+
+    def put(self, job_id, filename, sha256=None):
+        """Add an artifacts archive to the cache.
+
+        Parameters
+        ----------
+        job_id : :obj:`int`
+            ID of the job which produced the artifacts
+        filename : :obj:`str`
+            Path to the artifacts archive
+        sha256 : :obj:`str`, optional
+            SHA-256 hex digest of the archive, computed if not given
+
+        Returns
+        -------
+        :obj:`str`
+            SHA-256 hex digest of the archive
+        """
+        if sha256 is None:
+            hasher = hashlib.sha256()
+            _hash_file(filename, hasher)
+            sha256 = hasher.hexdigest()
+
+        blob_fn = self._blob_fn(sha256)
+        job_fn = self._job_fn(job_id)
+        # Hold the lock so the blob can't be evicted before the job refers to it
+        with _file_lock(os.path.join(self._path, "lock")):
+            if os.path.exists(blob_fn):
+                os.utime(blob_fn, None)
+            else:
+                tmp_fn = _tmp_name(os.path.dirname(blob_fn))
+                shutil.copyfile(filename, tmp_fn)
+                _replace(tmp_fn, blob_fn)
+
+            tmp_fn = _tmp_name(os.path.dirname(job_fn))
+            with open(tmp_fn, "wt") as fp:
+                fp.write(sha256)
+            _replace(tmp_fn, job_fn)
+
+        self.evict()
+        return sha256
+
+    def evict(self, max_size=None):
+        """Remove the least recently used archives until the cache is small enough.
+
+        The records of jobs whose archive was removed are also removed.
+
+        Parameters
+        ----------
+        max_size : :obj:`int`, optional
+            Size to shrink the cache to, defaults to the cache's ``max_size``
+        """
+        if max_size is None:
+            max_size = self.max_size
+        blobs_dir = os.path.join(self._path, "blobs")
+        jobs_dir = os.path.join(self._path, "jobs")
+        with _file_lock(os.path.join(self._path, "lock")):
+            blobs = []
+            for name in os.listdir(blobs_dir):
+                if name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(blobs_dir, name))
+                except OSError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, name))
+            total_size = sum(size for _, size, _ in blobs)
+            evicted = set()
+            for _, size, name in sorted(blobs):
+                if total_size <= max_size:
+                    break
+                logger.debug("Evicting %s from %r", name, self)
+                try:
+                    os.remove(os.path.join(blobs_dir, name))
+                except OSError:
+                    continue
+                evicted.add(name)
+                total_size -= size
+            if not evicted:
+                return
+
+            for name in os.listdir(jobs_dir):
+                if name.startswith("."):
+                    continue
+                job_fn = os.path.join(jobs_dir, name)
+                try:
+                    with open(job_fn, "rt") as fp:
+                        if fp.read().strip() not in evicted:
+                            continue
+                    os.remove(job_fn)
+                except EnvironmentError:
+                    continue
+
+
+def collect_paths(root, patterns, untracked=False):
+    """Find the files and directories to include in an artifacts archive.
+
+    Parameters
+    ----------
+    root : :obj:`str`
+        Directory the patterns are relative to
+    patterns : :obj:`list` of :obj:`str`
+        Glob patterns to match, matched directories are included recursively
+    untracked : :obj:`bool`, optional
+        Also include all files which are not tracked by git
+
+    Returns
+    -------
+    :obj:`list` of :obj:`str`
+        Paths relative to root using "/" as the separator
+    """
+    root = os.path.abspath(root)
+    found = OrderedDict()
+
+    def add(path):
+        relpath = os.path.relpath(path, root)
+        if relpath.split(os.sep)[0] == os.pardir:
+            logger.warning("Skipping %s as it is outside of %s", path, root)
+            return False
+        if relpath != os.curdir:
+            found[relpath.replace(os.sep, "/")] = None
+        return True
+
+    for pattern in patterns:
+        full_pattern = os.path.join(root, pattern)
+        matches = (
+            glob.glob(full_pattern)
+            if six.PY2
+            else glob.glob(full_pattern, recursive=True)
+        )
+        if not matches:
+            logger.warning("No files found matching %s", pattern)
+        for match in sorted(matches):
+            if not add(match):
+                continue
+            if not os.path.isdir(match) or os.path.islink(match):
+                continue
+            for dirpath, dirnames, filenames in os.walk(match):
+                dirnames.sort()
+                for name in dirnames + sorted(filenames):
+                    add(os.path.join(dirpath, name))
+
+    if untracked:
+        try:
+            output = subprocess.check_output(
+                ["git", "ls-files", "--others", "--exclude-standard", "-z"], cwd=root
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("Failed to list untracked files in %s: %r", root, e)
+        else:
+            for name in output.decode("utf-8").split("\0"):
+                if name:
+                    add(os.path.join(root, name))
+
+    return list(found)
+
+
+def _compress_file(filename, compresslevel):
+    """Deflate a file into a temporary file, returning it with its zip metadata"""
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    spool = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+    crc = 0
+    size = 0
+    with open(filename, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    compressed_size = spool.tell()
+    spool.seek(0)
+    return spool, crc & 0xFFFFFFFF, size, compressed_size
+
+
+class _ZipWriter(object):
+    """Minimal zip writer for entries which have already been compressed"""
+
+    zip64_limit = 0xFFFFFFFF
+    count_limit = 0xFFFF
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._offset = 0
+        self._central_directory = []
+
+    def _write(self, data):
+        self._fp.write(data)
+        self._offset += len(data)
+
+    def add(self, name, st, method, crc, size, compressed_size, fp=None):
+        year, month, day, hour, minute, second = time.localtime(st.st_mtime)[:6]
+        if year < 1980:
+            year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+        dos_date = (year - 1980) << 9 | month << 5 | day
+        dos_time = hour << 11 | minute << 5 | second // 2
+        external_attr = (st.st_mode & 0xFFFF) << 16
+        if stat.S_ISDIR(st.st_mode):
+            external_attr |= 0x10
+        encoded_name = name.encode("utf-8")
+        header_offset = self._offset
+
+        extra = b""
+        version = 20
+        header_sizes = (compressed_size, size)
+        if size >= self.zip64_limit or compressed_size >= self.zip64_limit:
+            extra = struct.pack("<HHQQ", 1, 16, size, compressed_size)
+            version = 45
+            header_sizes = (0xFFFFFFFF, 0xFFFFFFFF)
+        self._write(
+            struct.pack(
+                "<4sHHHHHLLLHH",
+                b"PK\x03\x04",
+                version,
+                0x800,  # UTF-8 file names
+                method,
+                dos_time,
+                dos_date,
+                crc,
+                header_sizes[0],
+                header_sizes[1],
+                len(encoded_name),
+                len(extra),
+            )
+        )
+        self._write(encoded_name)
+        self._write(extra)
+        if fp is not None:
+            for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+                self._write(chunk)
+
+        self._central_directory.append(
+            (
+                encoded_name,
+                method,
+                dos_time,
+                dos_date,
+                crc,
+                size,
+                compressed_size,
+                external_attr,
+                header_offset,
+            )
+        )
+
+    def close(self):
+        cd_offset = self._offset
+        for entry in self._central_directory:
+            name, method, dos_time, dos_date, crc, size, compressed_size = entry[:7]
+            external_attr, header_offset = entry[7:]
+            zip64_fields = []
+            if size >= self.zip64_limit:
+                zip64_fields.append(size)
+                size = 0xFFFFFFFF
+            if compressed_size >= self.zip64_limit:
+                zip64_fields.append(compressed_size)
+                compressed_size = 0xFFFFFFFF
+            if header_offset >= self.zip64_limit:
+                zip64_fields.append(header_offset)
+                header_offset = 0xFFFFFFFF
+            extra = b""
+            version = 20
+            if zip64_fields:
+                extra = struct.pack(
+                    "<HH" + "Q" * len(zip64_fields),
+                    1,
+                    8 * len(zip64_fields),
+                    *zip64_fields
+                )
+                version = 45
+            self._write(
+                struct.pack(
+                    "<4sHHHHHHLLLHHHHHLL",
+                    b"PK\x01\x02",
+                    3 << 8 | version,  # Created on unix
+                    version,
+                    0x800,
+                    method,
+                    dos_time,
+                    dos_date,
+                    crc,
+                    compressed_size,
+                    size,
+                    len(name),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    external_attr,
+                    header_offset,
+                )
+            )
+            self._write(name)
+            self._write(extra)
+
+        n_entries = len(self._central_directory)
+        cd_size = self._offset - cd_offset
+        if (
+            n_entries >= self.count_limit
+            or cd_size >= self.zip64_limit
+            or cd_offset >= self.zip64_limit
+        ):
+            zip64_offset = self._offset
+            self._write(
+                struct.pack(
+                    "<4sQHHLLQQQQ",
+                    b"PK\x06\x06",
+                    44,
+                    45,
+                    45,
+                    0,
+                    0,
+                    n_entries,
+                    n_entries,
+                    cd_size,
+                    cd_offset,
+                )
+            )
+            self._write(struct.pack("<4sLQL", b"PK\x06\x07", 0, zip64_offset, 1))
+        self._write(
+            struct.pack(
+                "<4sHHHHLLH",
+                b"PK\x05\x06",
+                0,
+                0,
+                min(n_entries, 0xFFFF),
+                min(n_entries, 0xFFFF),
+                min(cd_size, 0xFFFFFFFF),
+                min(cd_offset, 0xFFFFFFFF),
+                0,
+            )
+        )
+        return n_entries
+
+
+def build_archive(fp, paths, root=".", max_workers=None, compresslevel=6):
+    """Write a zip archive to fp, compressing the files in parallel.
+
+    Files are deflated concurrently into temporary buffers and written to
+    fp in order as soon as they are ready, so fp does not need to be
+    seekable.
+
+    Parameters
+    ----------
+    fp : file object
+        Binary file object to write the archive to
+    paths : :obj:`list` of :obj:`str`
+        Paths relative to root to include, see `collect_paths`
+    root : :obj:`str`, optional
+        Directory containing the files to archive
+    max_workers : :obj:`int`, optional
+        Number of files to compress in parallel, defaults to the number of CPUs
+    compresslevel : :obj:`int`, optional
+        zlib compression level
+
+    Returns
+    -------
+    :obj:`int`
+        Number of entries in the archive
+    """
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    writer = _ZipWriter(fp)
+    pending = deque()
+
+    def write_pending(max_pending):
+        while len(pending) > max_pending:
+            name, st, future = pending.popleft()
+            if future is None:
+                writer.add(name + "/", st, zipfile.ZIP_STORED, 0, 0, 0)
+                continue
+            spool, crc, size, compressed_size = future.result()
+            with spool:
+                writer.add(
+                    name, st, zipfile.ZIP_DEFLATED, crc, size, compressed_size, spool
+                )
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for name in paths:
+            filename = os.path.join(root, name)
+            st = os.stat(filename)
+            if stat.S_ISDIR(st.st_mode):
+                pending.append((name, st, None))
+            else:
+                future = executor.submit(_compress_file, filename, compresslevel)
+                pending.append((name, st, future))
+            # Bound the number of compressed files waiting to be written
+            write_pending(2 * max_workers)
+        write_pending(0)
+    finally:
+        executor.shutdown(wait=True)
+    return writer.close()
+
+
+class _MultipartBody(object):
+    """File-like multipart/form-data request body which streams a file from disk"""
+
+    def __init__(self, fields, name, filename, fp):
+        boundary = uuid4().hex
+        self.content_type = "multipart/form-data; boundary=" + boundary
+        preamble = ""
+        for key, value in sorted(fields.items()):
+            preamble += "--" + boundary + "\r\n"
+            preamble += 'Content-Disposition: form-data; name="' + key + '"\r\n\r\n'
+            preamble += value + "\r\n"
+        preamble += "--" + boundary + "\r\n"
+        preamble += 'Content-Disposition: form-data; name="' + name + '"; '
+        preamble += 'filename="' + filename + '"\r\n'
+        preamble += "Content-Type: application/zip\r\n\r\n"
+        preamble = preamble.encode("utf-8")
+        epilogue = ("\r\n--" + boundary + "--\r\n").encode("utf-8")
+
+        fp.seek(0, os.SEEK_END)
+        self._length = len(preamble) + fp.tell() + len(epilogue)
+        fp.seek(0)
+        self._parts = deque([BytesIO(preamble), fp, BytesIO(epilogue)])
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        data = b""
+        while self._parts and (size < 0 or len(data) < size):
+            chunk = self._parts[0].read(size - len(data) if size >= 0 else -1)
+            if not chunk:
+                self._parts.popleft()
+            data += chunk
+        return data
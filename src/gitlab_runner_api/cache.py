@@ -0,0 +1,380 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["CacheSpec", "LocalCacheStore"]
+
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import tarfile
+
+import six
+
+from .artifacts import _file_lock, _replace, _tmp_name, collect_paths
+from .logging import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CacheSpec(object):
+    """Cache definition from a job's configuration"""
+
+    def __init__(
+        self,
+        key="default",
+        paths=None,
+        untracked=False,
+        policy="pull-push",
+        when="on_success",
+        **kwargs
+    ):
+        """
+
+        Raises
+        ------
+        ValueError: One of the properties are invalid
+        """
+        if not isinstance(key, six.string_types) or not key:
+            raise ValueError('Property "key" of CacheSpec must be a non-empty string')
+        self._key = key
+
+        self._paths = list(paths or [])
+
+        if not isinstance(untracked, bool):
+            raise ValueError('Property "untracked" of CacheSpec must be of type bool')
+        self._untracked = untracked
+
+        if policy not in ["pull-push", "pull", "push"]:
+            raise ValueError("Invalid cache policy " + repr(policy))
+        self._policy = policy
+
+        if when not in ["on_success", "on_failure", "always"]:
+            raise ValueError("Invalid cache when " + repr(when))
+        self._when = when
+
+        if kwargs:
+            logger.debug("Unrecognised CacheSpec arguments %s", repr(kwargs))
+
+    def __repr__(self):
+        return "CacheSpec(key={key}, policy={policy})".format(
+            key=self.key, policy=self.policy
+        )
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def paths(self):
+        return list(self._paths)
+
+    @property
+    def untracked(self):
+        return self._untracked
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def when(self):
+        return self._when
+
+    @property
+    def pull(self):
+        """True if the cache should be restored before the job runs"""
+        return self.policy in ["pull-push", "pull"]
+
+    def push(self, state):
+        """True if the cache should be saved after the job finished as state"""
+        if self.policy not in ["pull-push", "push"]:
+            return False
+        expected_when = "on_success" if state == "success" else "on_failure"
+        return self.when in ["always", expected_when]
+
+
+def _extractall(tf, dest):
+    if hasattr(tarfile, "data_filter"):
+        tf.extractall(dest, filter="data")
+    else:
+        tf.extractall(dest)
+
+
+class LocalCacheStore(object):
+    """Store of compressed job caches on the local disk.
+
+    Caches are stored as ``archives/<hash of key>.tar.zst`` when the
+    ``zstandard`` package is available, falling back to gzip otherwise.
+    Restoring with ``hardlink=True`` unpacks each archive once into
+    ``trees/`` and hard links the read-only files into the destination, so
+    restored files must be replaced rather than modified in place. Once the
+    archives and unpacked trees exceed ``max_size`` bytes the least recently
+    used caches are removed.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        Directory in which to store the caches
+    max_size : :obj:`int`, optional
+        Maximum total size of the cache archives and trees in bytes
+    compresslevel : :obj:`int`, optional
+        Compression level to use, defaults to a fast level
+    """
+
+    def __init__(self, path, max_size=10 * 1024**3, compresslevel=None):
+        self._path = os.path.abspath(path)
+        self._max_size = max_size
+        self._compresslevel = compresslevel
+        for dirname in ["archives", "trees"]:
+            try:
+                os.makedirs(os.path.join(self._path, dirname))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def __repr__(self):
+        return "LocalCacheStore(path={path}, max_size={max_size})".format(
+            path=self.path, max_size=self.max_size
+        )
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def _name(self, key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _archive_fn(self, key):
+        """Path to the existing archive for key or None"""
+        for extension in [".tar.zst", ".tar.gz"]:
+            filename = os.path.join(self._path, "archives", self._name(key) + extension)
+            if os.path.exists(filename):
+                return filename
+        return None
+
+    def _tree_size(self, name):
+        size = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self._path, "trees", name)):
+            for filename in filenames:
+                try:
+                    size += os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    continue
+        return size
+
+    def _remove_tree(self, name):
+        tree_dir = os.path.join(self._path, "trees", name)
+        tmp_dir = _tmp_name(os.path.dirname(tree_dir))
+        try:
+            os.rename(tree_dir, tmp_dir)
+        except OSError:
+            return
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def save(self, key, paths, root=".", untracked=False):
+        """Save files to the cache.
+
+        Parameters
+        ----------
+        key : :obj:`str`
+            Key of the cache
+        paths : :obj:`list` of :obj:`str`
+            Glob patterns relative to root, see `artifacts.collect_paths`
+        root : :obj:`str`, optional
+            Directory containing the files to cache
+        untracked : :obj:`bool`, optional
+            Also include all files which are not tracked by git
+
+        Returns
+        -------
+        :obj:`bool`
+            True if anything was saved
+        """
+        members = collect_paths(root, paths, untracked=untracked)
+        if not members:
+            logger.info("Not saving cache %s as no files were found", key)
+            return False
+
+        name = self._name(key)
+        archives_dir = os.path.join(self._path, "archives")
+        tmp_fn = _tmp_name(archives_dir)
+        try:
+            if zstandard is None:
+                extension = ".tar.gz"
+                with tarfile.open(
+                    tmp_fn, "w:gz", compresslevel=self._compresslevel or 1
+                ) as tf:
+                    for member in members:
+                        tf.add(os.path.join(root, member), member, recursive=False)
+            else:
+                extension = ".tar.zst"
+                cctx = zstandard.ZstdCompressor(level=self._compresslevel or 3)
+                with open(tmp_fn, "wb") as fp:
+                    with cctx.stream_writer(fp) as writer:
+                        with tarfile.open(fileobj=writer, mode="w|") as tf:
+                            for member in members:
+                                tf.add(
+                                    os.path.join(root, member), member, recursive=False
+                                )
+            self._remove_tree(name)
+            _replace(tmp_fn, os.path.join(archives_dir, name + extension))
+            for other in [".tar.gz", ".tar.zst"]:
+                if other != extension and os.path.exists(
+                    os.path.join(archives_dir, name + other)
+                ):
+                    os.remove(os.path.join(archives_dir, name + other))
+        finally:
+            if os.path.exists(tmp_fn):
+                os.remove(tmp_fn)
+        logger.info("Saved cache %s with %d entries", key, len(members))
+
+        self.evict()
+        return True
+
+    def _extract(self, archive_fn, dest):
+        if archive_fn.endswith(".tar.gz"):
+            with tarfile.open(archive_fn, "r:gz") as tf:
+                _extractall(tf, dest)
+            return
+        if zstandard is None:
+            raise ImportError("zstandard is required to restore " + archive_fn)
+        with open(archive_fn, "rb") as fp:
+            with zstandard.ZstdDecompressor().stream_reader(fp) as reader:
+                with tarfile.open(fileobj=reader, mode="r|") as tf:
+                    _extractall(tf, dest)
+
+    def _unpacked_tree(self, key, archive_fn):
+        """Directory containing the extracted contents of archive_fn"""
+        tree_dir = os.path.join(self._path, "trees", self._name(key))
+        if not os.path.isdir(tree_dir):
+            tmp_dir = _tmp_name(os.path.dirname(tree_dir))
+            self._extract(archive_fn, tmp_dir)
+            # The files are shared by every restore so prevent modifying them
+            for dirpath, _, filenames in os.walk(tmp_dir):
+                for filename in filenames:
+                    filename = os.path.join(dirpath, filename)
+                    if not os.path.islink(filename):
+                        mode = os.stat(filename).st_mode
+                        os.chmod(
+                            filename,
+                            mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH),
+                        )
+            try:
+                os.rename(tmp_dir, tree_dir)
+            except OSError:
+                # Another process unpacked the archive first
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        return tree_dir
+
+    def _link_tree(self, tree_dir, dest):
+        for dirpath, _, filenames in os.walk(tree_dir):
+            target_dir = os.path.join(dest, os.path.relpath(dirpath, tree_dir))
+            if not os.path.isdir(target_dir):
+                os.makedirs(target_dir)
+            for filename in filenames:
+                src = os.path.join(dirpath, filename)
+                dst = os.path.join(target_dir, filename)
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                if os.path.islink(src):
+                    os.symlink(os.readlink(src), dst)
+                else:
+                    os.link(src, dst)
+
+    def restore(self, key, dest=".", hardlink=False):
+        """Restore files from the cache.
+
+        Parameters
+        ----------
+        key : :obj:`str`
+            Key of the cache
+        dest : :obj:`str`, optional
+            Directory to restore the files into
+        hardlink : :obj:`bool`, optional
+            Hard link read-only files into dest when possible instead of
+            extracting a copy of them
+
+        Returns
+        -------
+        :obj:`bool`
+            True if the cache was found and restored
+        """
+        archive_fn = self._archive_fn(key)
+        if archive_fn is None:
+            logger.info("Cache %s not found", key)
+            return False
+        try:
+            # Mark as recently used for the eviction policy
+            os.utime(archive_fn, None)
+        except OSError:
+            # The archive was removed by another process
+            return False
+
+        if hardlink:
+            try:
+                self._link_tree(self._unpacked_tree(key, archive_fn), dest)
+                logger.info("Restored cache %s using hard links", key)
+                return True
+            except OSError as e:
+                logger.debug("Failed to hard link cache %s, extracting: %r", key, e)
+        self._extract(archive_fn, dest)
+        logger.info("Restored cache %s", key)
+        return True
+
+    def evict(self, max_size=None):
+        """Remove the least recently used caches until the store is small enough.
+
+        Each cache's unpacked tree counts towards its size and is removed
+        along with its archive.
+
+        Parameters
+        ----------
+        max_size : :obj:`int`, optional
+            Size to shrink the store to, defaults to the store's ``max_size``
+        """
+        if max_size is None:
+            max_size = self.max_size
+        archives_dir = os.path.join(self._path, "archives")
+        trees_dir = os.path.join(self._path, "trees")
+        with _file_lock(os.path.join(self._path, "lock")):
+            archives = []
+            names = set()
+            for filename in os.listdir(archives_dir):
+                if filename.startswith("."):
+                    continue
+                try:
+                    info = os.stat(os.path.join(archives_dir, filename))
+                except OSError:
+                    continue
+                name = filename.split(".")[0]
+                names.add(name)
+                size = info.st_size + self._tree_size(name)
+                archives.append((info.st_mtime, size, filename))
+            # Trees can't be restored once their archive has gone
+            for name in os.listdir(trees_dir):
+                if not name.startswith(".") and name not in names:
+                    self._remove_tree(name)
+            total_size = sum(size for _, size, _ in archives)
+            for _, size, filename in sorted(archives):
+                if total_size <= max_size:
+                    break
+                logger.debug("Evicting %s from %r", filename, self)
+                try:
+                    os.remove(os.path.join(archives_dir, filename))
+                except OSError:
+                    continue
+                self._remove_tree(filename.split(".")[0])
+                total_size -= size
@@ -5,6 +5,7 @@ from __future__ import print_function
 import argparse
 
 import gitlab_runner_api
+from .logging import configure
 
 __all__ = ["register_runner"]
 
@@ -24,8 +25,13 @@ def register_runner():
         type=int,
         help="Maximum timeout set when this Runner will handle the job (in seconds)",
     )
+    parser.add_argument(
+        "--json-logs", action="store_true", help="Write log messages as JSON"
+    )
     args = parser.parse_args()
 
+    configure(json_format=args.json_logs)
+
     if not args.output_fn.endswith(".json"):
         parser.error("Requested output filename must end in .json")
 
@@ -5,10 +5,12 @@ from __future__ import print_function
 __all__ = [
     "AlreadyFinishedExcpetion",
     "APIExcpetion",
+    "ArtifactIntegrityException",
     "AuthException",
     "ImagePullException",
     "JobTimeoutException",
     "JobCancelledException",
+    "MissingArtifactsException",
 ]
 
 
@@ -20,6 +22,10 @@ class APIExcpetion(Exception):
     pass
 
 
+class ArtifactIntegrityException(Exception):
+    pass
+
+
 class AuthException(Exception):
     pass
 
@@ -34,3 +40,7 @@ class JobTimeoutException(Exception):
 
 class JobCancelledException(Exception):
     pass
+
+
+class MissingArtifactsException(Exception):
+    pass
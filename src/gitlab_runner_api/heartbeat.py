@@ -0,0 +1,98 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["HeartbeatMonitor", "monitor"]
+
+import heapq
+import itertools
+import threading
+import time
+
+from .exceptions import JobCancelledException
+from .logging import logger
+
+
+class HeartbeatMonitor(object):
+    """Periodically touch running jobs to detect when they are cancelled.
+
+    A single background thread is shared by every job registered with the
+    monitor, sleeping until the next job is due. When GitLab reports that a
+    job has been cancelled its cancellation callback is called from the
+    background thread and the job is unregistered.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queue = []
+        self._jobs = {}
+        self._counter = itertools.count()
+        self._thread = None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._jobs)
+
+    def register(self, job, interval):
+        """Start touching job every interval seconds.
+
+        Parameters
+        ----------
+        job : :py:class:`Job <gitlab_runner_api.Job>`
+            Job to monitor
+        interval : :obj:`float`
+            Number of seconds between checks
+        """
+        with self._condition:
+            generation = next(self._counter)
+            self._jobs[id(job)] = (job, interval, generation)
+            self._schedule(job, interval, generation)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="gitlab-runner-api-heartbeat"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+
+    def unregister(self, job):
+        """Stop monitoring job"""
+        with self._condition:
+            self._jobs.pop(id(job), None)
+
+    def _schedule(self, job, interval, generation):
+        heapq.heappush(self._queue, (time.time() + interval, generation, id(job), job))
+        self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                due, generation, key, job = self._queue[0]
+                delay = due - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+                # Skip jobs which have been unregistered or re-registered
+                if key not in self._jobs or self._jobs[key][2] != generation:
+                    continue
+                interval = self._jobs[key][1]
+
+            self._touch(job)
+
+            with self._condition:
+                if key in self._jobs and self._jobs[key][2] == generation:
+                    self._schedule(job, interval, generation)
+
+    def _touch(self, job):
+        try:
+            job.auth()
+        except JobCancelledException:
+            logger.info("Job %d: Heartbeat found the job was cancelled", job.id)
+        except Exception as e:
+            logger.warning("Job %d: Heartbeat failed with %r", job.id, e)
+
+
+monitor = HeartbeatMonitor()
@@ -4,50 +4,86 @@ from __future__ import print_function
 
 __all__ = ["Job"]
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import json
+import logging
+import os
 import re
+import tempfile
+import threading
+import time
 from traceback import format_exc
 
-try:
-    # Python 3
-    from urllib.parse import urlparse
-except ImportError:
-    # Python 2
-    from urlparse import urlparse
-
-import requests
-
-from .exceptions import AlreadyFinishedExcpetion, AuthException, JobCancelledException
+from .artifacts import (
+    _MultipartBody,
+    build_archive,
+    collect_paths,
+    download_file,
+    extract_archive,
+)
+from . import heartbeat
+from . import metrics
+from . import tracing
+from .cache import CacheSpec
+from .exceptions import (
+    AlreadyFinishedExcpetion,
+    APIExcpetion,
+    AuthException,
+    JobCancelledException,
+)
 from .failure_reasons import _FailureReason, RunnerSystemFailure, UnknownFailure
-from .logging import logger
+from .logging import logger, truncate
+from .utils import ansi, compression
+from .utils.masking import SecretMasker
 from .version import CURRENT_DATA_VERSION, package_version
 
+# Values of the Job-Status header for jobs which should stop running
+CANCELLED_STATUSES = ["canceled", "canceling"]
+# Fragments of the error message of a 400 caused by the Content-Encoding
+ENCODING_ERRORS = ["encod", "decod", "compress"]
+
+
+def _encoding_rejected(response):
+    """Check if a response means the server couldn't decode the request body"""
+    if response.status_code == 415:
+        return True
+    if response.status_code != 400:
+        return False
+    text = response.text.lower()
+    return any(fragment in text for fragment in ENCODING_ERRORS)
+
 
 class Job(object):
     @classmethod
-    def load(cls, filename):
+    def load(cls, filename, transport=None):
         """Serialise this job as a file which can be loaded with `Job.load`.
 
         Parameters
         ----------
         filename : :obj:`str`
             Path to file that represents the job to initialise.
+        transport : `gitlab_runner_api.transport.Transport`, optional
+            Transport to send the job's requests with
 
         Returns
         -------
         :py:class:`Job <gitlab_runner_api.Job>`
         """
         with open(filename, "rt") as fp:
-            return cls.loads(fp.read())
+            return cls.loads(fp.read(), transport=transport)
 
     @classmethod
-    def loads(cls, data):
+    def loads(cls, data, transport=None):
         """Serialise this job as a file which can be loaded with `Job.load`.
 
         Parameters
         ----------
         data : :obj:`str`
             String representing the job to initialise
+        transport : `gitlab_runner_api.transport.Transport`, optional
+            Transport to send the job's requests with
 
         Returns
         -------
@@ -58,14 +94,18 @@ class Job(object):
         if version == 1:
             from .runner import Runner
 
-            runner_info, job_info, state, log = data
-            return cls(
-                Runner.loads(runner_info),
+            runner_info, job_info, state, log = data[:4]
+            job = cls(
+                Runner.loads(runner_info, transport=transport),
                 job_info,
                 fail_on_error=False,
                 state=state,
                 log=log,
             )
+            if len(data) > 4:
+                # Masked again when the next text is appended
+                job._log._buffered = data[4]
+            return job
         else:
             raise ValueError("Unrecognised data version: " + str(version))
 
@@ -74,15 +114,23 @@ class Job(object):
         self._state = "running"  # All jobs start as running
         self.state = state
         self._log = JobLog(self, log)
+        self._dependency_futures = {}
+        self._cancelled = False
+        self._on_cancel = None
+        # Guards state which is also changed by other threads
+        self._lock = threading.Lock()
+        self._content_encoding = None
+        self._span = tracing.start_span("gitlab_runner_api.job")
         # TODO Create and validate a schema for the job_info dict
         self._job_info = job_info
         try:
             self._parse_job_info()
+            self._span.set_attribute("gitlab.job.id", self.id)
         except Exception:
             exception_string = format_exc()
             logger.fatal(
                 "%s: Failed to parse job %d's description\n%s",
-                urlparse(self._runner.api_url).netloc,
+                self._runner.netloc,
                 self.id,
                 exception_string,
             )
@@ -92,6 +140,7 @@ class Job(object):
                 self.set_failed(RunnerSystemFailure())
             raise
 
+    @tracing.traced("gitlab_runner_api.parse_job_info")
     def _parse_job_info(self):
         self._id = self._job_info["id"]
 
@@ -100,10 +149,10 @@ class Job(object):
         self._variables = {}
         for var_info in self._job_info["variables"]:
             logger.debug(
-                "%s: Parsing environment variable from job %d (%s)",
-                urlparse(self._runner.api_url).netloc,
+                "%s: Parsing environment variable %s from job %d",
+                self._runner.netloc,
+                var_info.get("key"),
                 self.id,
-                repr(var_info),
             )
             var = EnvVar(**var_info)
             self._variables[var.key] = var
@@ -122,7 +171,7 @@ class Job(object):
         )
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return dict(self.__dict__, _lock=None) == dict(other.__dict__, _lock=None)
 
     def dump(self, filename):
         """Serialise this job as a file which can be loaded with `Job.load`.
@@ -144,25 +193,33 @@ class Job(object):
             String representation of the job that can be loaded with
             `Job.loads`
         """
-        return json.dumps(
-            [
-                CURRENT_DATA_VERSION,
-                self._runner.dumps(),
-                self._job_info,
-                self.state,
-                str(self.log),
-            ]
-        )
+        data = [
+            CURRENT_DATA_VERSION,
+            self._runner.dumps(),
+            self._job_info,
+            self.state,
+            str(self.log),
+        ]
+        pending = self._log._pending
+        if pending:
+            data.append(pending)
+        return json.dumps(data)
 
     def auth(self):
-        response = requests.put(
+        response = metrics.request(
+            "PUT",
             self._runner.api_url + "/api/v4/jobs/" + str(self.id),
+            "jobs/:id",
+            transport=self._runner.transport,
             json={"token": self.token},
         )
         if response.status_code == 200:
-            pass
+            # The job is still accepting updates while it is being cancelled
+            if response.headers.get("Job-Status") in CANCELLED_STATUSES:
+                self._set_cancelled()
         elif response.status_code == 403:
-            if response.headers["Job-Status"] == "canceled":
+            if response.headers.get("Job-Status") in CANCELLED_STATUSES:
+                self._set_cancelled()
                 raise JobCancelledException()
             else:
                 raise AuthException()
@@ -172,11 +229,32 @@ class Job(object):
             )
 
     def set_success(self, artifacts=None):
+        """Mark the job as having succeeded.
+
+        Parameters
+        ----------
+        artifacts : :obj:`str` or :obj:`list` of :obj:`str`, optional
+            Path to a zip archive to upload as the job's artifacts, such as
+            one created by `Job.build_artifacts`, or a list of paths to
+            archive and upload
+        """
         self._update_state("success", artifacts)
 
     def set_failed(self, failure_reason=None, artifacts=None):
+        """Mark the job as having failed.
+
+        Parameters
+        ----------
+        failure_reason : :py:class:`_FailureReason`, optional
+            Reason for the failure, see :py:mod:`gitlab_runner_api.failure_reasons`
+        artifacts : :obj:`str` or :obj:`list` of :obj:`str`, optional
+            Path to a zip archive to upload as the job's artifacts, such as
+            one created by `Job.build_artifacts`, or a list of paths to
+            archive and upload
+        """
         self._update_state("failed", artifacts, failure_reason)
 
+    @tracing.traced("gitlab_runner_api.update_state")
     def _update_state(self, state=None, artifacts=None, failure_reason=None):
         if self.state != "running":
             raise AlreadyFinishedExcpetion(
@@ -187,6 +265,8 @@ class Job(object):
 
         data = {"token": self.token}
 
+        if state is not None:
+            self._log._flush()
         data["trace"] = str(self.log)
 
         if state is not None:
@@ -202,30 +282,35 @@ class Job(object):
         if artifacts is not None:
             self._upload_artifacts(artifacts)
 
-        response = requests.put(
-            self._runner.api_url + "/api/v4/jobs/" + str(self.id), json=data
+        response = self._send(
+            "PUT",
+            self._runner.api_url + "/api/v4/jobs/" + str(self.id),
+            "jobs/:id",
+            json.dumps(data),
+            {"Content-Type": "application/json"},
         )
 
         if response.status_code == 200:
             if state is None:
                 logger.info(
-                    "%s: Updated log for job %d", urlparse(response.url).netloc, self.id
+                    "%s: Updated log for job %d", self._runner.netloc, self.id
                 )
             else:
                 logger.info(
                     "%s: Set job %d as %s",
-                    urlparse(response.url).netloc,
+                    self._runner.netloc,
                     self.id,
                     state,
                 )
         elif response.status_code == 403:
             logger.error(
                 "%s: Failed to authenticate job %d with token %s",
-                urlparse(response.url).netloc,
+                self._runner.netloc,
                 self.id,
                 self.token,
             )
-            if response.headers.get("Job-Status") == "canceled":
+            if response.headers.get("Job-Status") in CANCELLED_STATUSES:
+                self._set_cancelled()
                 raise JobCancelledException()
             else:
                 raise AuthException()
@@ -236,9 +321,382 @@ class Job(object):
 
         if state is not None:
             self.state = state
+            self.stop_heartbeat()
+            self._span.set_attribute("gitlab.job.state", state)
+            self._span.end()
+
+    def _send(self, method, url, endpoint, body, headers):
+        """Send a request with the body compressed using `Job.content_encoding`.
+
+        If the server rejects the encoding of the compressed body, compression
+        is disabled for this job and the request is sent again uncompressed.
+        Other errors are returned to the caller as they would be for an
+        uncompressed request.
+        """
+        encoding = self.content_encoding
+        if encoding is not None:
+            compressed_headers = dict(headers)
+            compressed_headers["Content-Encoding"] = encoding
+            response = metrics.request(
+                method,
+                url,
+                endpoint,
+                transport=self._runner.transport,
+                data=compression.compress(body, encoding),
+                headers=compressed_headers,
+            )
+            if not _encoding_rejected(response):
+                return response
+            logger.warning(
+                "%s: Server rejected %s encoded request for job %d, "
+                "disabling compression",
+                self._runner.netloc,
+                encoding,
+                self.id,
+            )
+            self._content_encoding = None
+            metrics.retry(endpoint)
+        return metrics.request(
+            method,
+            url,
+            endpoint,
+            transport=self._runner.transport,
+            data=body,
+            headers=headers,
+        )
 
+    def start_heartbeat(self, interval=30, on_cancel=None):
+        """Periodically check whether the job has been cancelled.
+
+        Checks are made from a single background thread which is shared by
+        all jobs in the process. The heartbeat stops once the job finishes.
+
+        Parameters
+        ----------
+        interval : :obj:`float`, optional
+            Number of seconds between checks
+        on_cancel : callable, optional
+            Called with the job as soon as it is found to have been cancelled,
+            see `Job.on_cancel`
+        """
+        if on_cancel is not None:
+            self.on_cancel = on_cancel
+        heartbeat.monitor.register(self, interval)
+
+    def stop_heartbeat(self):
+        """Stop checking whether the job has been cancelled."""
+        heartbeat.monitor.unregister(self)
+
+    def _set_cancelled(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+        self.stop_heartbeat()
+        logger.warning(
+            "%s: Job %d has been cancelled",
+            self._runner.netloc,
+            self.id,
+        )
+        if self.on_cancel is not None:
+            self.on_cancel(self)
+
+    @property
+    def _artifact_specs(self):
+        return [
+            spec
+            for spec in self._job_info.get("artifacts") or []
+            if spec and spec.get("artifact_type", "archive") == "archive"
+        ]
+
+    def build_artifacts(self, dest, root=".", state="success", max_workers=None):
+        """Create the artifacts archive defined in the job's configuration.
+
+        Parameters
+        ----------
+        dest : :obj:`str`
+            Path to write the zip archive to
+        root : :obj:`str`, optional
+            Directory the artifact paths are relative to
+        state : :obj:`str`, optional
+            Result of the job, used to select artifacts based on their ``when``
+        max_workers : :obj:`int`, optional
+            Number of files to compress in parallel, defaults to the number of CPUs
+
+        Returns
+        -------
+        :obj:`str` or None
+            ``dest`` or None if there are no artifacts to upload
+        """
+        patterns = []
+        untracked = False
+        for spec in self._artifact_specs:
+            when = spec.get("when") or "on_success"
+            expected_when = "on_success" if state == "success" else "on_failure"
+            if when not in ["always", expected_when]:
+                continue
+            patterns.extend(spec.get("paths") or [])
+            untracked = untracked or bool(spec.get("untracked"))
+
+        paths = collect_paths(root, patterns, untracked=untracked)
+        if not paths:
+            logger.info("Job %d: No artifacts found for state %s", self.id, state)
+            return None
+        with open(dest, "wb") as fp:
+            n_entries = build_archive(fp, paths, root, max_workers=max_workers)
+        logger.info("Job %d: Created %s with %d entries", self.id, dest, n_entries)
+        return dest
+
+    def _expand_variables(self, string):
+        def replace(match):
+            var = self._variables.get(match.group(1) or match.group(2))
+            return "" if var is None else var.value
+
+        return re.sub(r"\$(?:\{(\w+)\}|(\w+))", replace, string)
+
+    @tracing.traced("gitlab_runner_api.upload_artifacts")
     def _upload_artifacts(self, artifacts):
-        raise NotImplementedError()
+        if isinstance(artifacts, list):
+            paths = collect_paths(".", artifacts)
+            if not paths:
+                logger.info("Job %d: No artifacts to upload", self.id)
+                return
+            fd, archive_fn = tempfile.mkstemp(suffix=".zip")
+            try:
+                with os.fdopen(fd, "wb") as fp:
+                    build_archive(fp, paths)
+                self._upload_artifacts(archive_fn)
+            finally:
+                os.remove(archive_fn)
+            return
+
+        spec = (self._artifact_specs or [{}])[0]
+        fields = {}
+        if spec.get("expire_in"):
+            fields["expire_in"] = spec["expire_in"]
+        filename = self._expand_variables(spec.get("name") or "artifacts") + ".zip"
+
+        with open(artifacts, "rb") as fp:
+            body = _MultipartBody(fields, "file", filename, fp)
+            response = metrics.request(
+                "POST",
+                self._runner.api_url + "/api/v4/jobs/" + str(self.id) + "/artifacts",
+                "jobs/:id/artifacts",
+                transport=self._runner.transport,
+                data=body,
+                headers={"JOB-TOKEN": self.token, "Content-Type": body.content_type},
+            )
+
+        if response.status_code == 201:
+            logger.info(
+                "%s: Uploaded %d bytes of artifacts for job %d",
+                self._runner.netloc,
+                len(body),
+                self.id,
+            )
+        elif response.status_code == 403:
+            logger.error(
+                "%s: Failed to authenticate job %d with token %s",
+                self._runner.netloc,
+                self.id,
+                self.token,
+            )
+            if response.headers.get("Job-Status") in CANCELLED_STATUSES:
+                self._set_cancelled()
+                raise JobCancelledException()
+            else:
+                raise AuthException()
+        elif response.status_code == 413:
+            logger.error(
+                "%s: Artifacts for job %d are too large",
+                self._runner.netloc,
+                self.id,
+            )
+            raise APIExcpetion("Artifacts are too large")
+        else:
+            raise NotImplementedError(
+                "Unrecognised status code from request", response, response.content
+            )
+
+    def download_artifacts(self, job_id, token, dest, sha256=None, cache=None):
+        """Download the artifacts archive of another job to disk.
+
+        The archive is streamed to disk in chunks and interrupted downloads
+        are resumed where they left off. If a cache is given it is checked
+        before downloading and newly downloaded archives are added to it.
+
+        Parameters
+        ----------
+        job_id : :obj:`int`
+            ID of the job to download the artifacts of, typically taken from
+            the job's dependencies
+        token : :obj:`str`
+            Token of the job to download the artifacts of
+        dest : :obj:`str`
+            Path to write the artifacts archive to
+        sha256 : :obj:`str`, optional
+            Expected SHA-256 hex digest of the archive
+        cache : :py:class:`ArtifactCache <gitlab_runner_api.ArtifactCache>`, optional
+            Local cache of artifacts archives
+
+        Returns
+        -------
+        :obj:`str`
+            SHA-256 hex digest of the downloaded archive
+        """
+        if cache is not None:
+            cached_sha256 = cache.get(job_id, dest, sha256=sha256)
+            if cached_sha256 is not None:
+                return cached_sha256
+
+        sha256 = download_file(
+            self._runner.api_url + "/api/v4/jobs/" + str(job_id) + "/artifacts",
+            {"JOB-TOKEN": token},
+            dest,
+            sha256=sha256,
+            transport=self._runner.transport,
+        )
+
+        if cache is not None:
+            cache.put(job_id, dest, sha256=sha256)
+        return sha256
+
+    def fetch_dependencies(self, dest, max_workers=4, wait=True, cache=None):
+        """Download and extract the artifacts of this job's dependencies.
+
+        Archives are downloaded in parallel and extracted into ``dest`` in
+        the order the dependencies are listed, so later dependencies take
+        precedence if files overlap. If the dependencies are already being
+        fetched into ``dest`` (see `Runner.request_job`) the existing
+        transfer is reused. Failures are logged as well as being raised, so
+        they aren't lost if nothing waits for the result.
+
+        Parameters
+        ----------
+        dest : :obj:`str`
+            Directory to extract the artifacts into
+        max_workers : :obj:`int`, optional
+            Maximum number of archives to download concurrently
+        wait : :obj:`bool`, optional
+            If false, return immediately with a `concurrent.futures.Future`
+        cache : :py:class:`ArtifactCache <gitlab_runner_api.ArtifactCache>`, optional
+            Local cache of artifacts archives
+
+        Returns
+        -------
+        :obj:`dict`
+            Mapping of dependency name to the SHA-256 hex digest of its
+            artifacts archive
+
+        Raises
+        ------
+        MissingArtifactsException: A dependency's artifacts are not available
+        """
+        dest = os.path.abspath(dest)
+        with self._lock:
+            if dest not in self._dependency_futures:
+                executor = ThreadPoolExecutor(max_workers=1)
+                future = executor.submit(
+                    self._fetch_dependencies, dest, max_workers, cache
+                )
+                future.add_done_callback(
+                    lambda f: self._log_fetch_error(dest, f.exception())
+                )
+                self._dependency_futures[dest] = future
+                executor.shutdown(wait=False)
+            future = self._dependency_futures[dest]
+        return future.result() if wait else future
+
+    def _log_fetch_error(self, dest, exception):
+        if exception is not None:
+            logger.error(
+                "%s: Failed to fetch the dependencies of job %d into %s: %r",
+                self._runner.netloc,
+                self.id,
+                dest,
+                exception,
+            )
+
+    def _fetch_dependencies(self, dest, max_workers, cache):
+        dependencies = []
+        for dependency in self._job_info.get("dependencies") or []:
+            # GitLab omits the filename for dependencies without artifacts
+            artifacts_file = dependency.get("artifacts_file", {"filename": True})
+            if not (artifacts_file or {}).get("filename"):
+                logger.debug("Job %d: %r has no artifacts", self.id, dependency)
+                continue
+            dependencies.append(dependency)
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
+
+        def download(dependency):
+            archive_fn = os.path.join(
+                dest, ".artifacts-" + str(dependency["id"]) + ".zip"
+            )
+            sha256 = self.download_artifacts(
+                dependency["id"], dependency["token"], archive_fn, cache=cache
+            )
+            return archive_fn, sha256
+
+        results = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(download, d) for d in dependencies]
+            for i, dependency in enumerate(dependencies):
+                archive_fn, sha256 = futures[i].result()
+                extract_archive(archive_fn, dest)
+                os.remove(archive_fn)
+                logger.info(
+                    "%s: Fetched artifacts of %s (%d) for job %d",
+                    self._runner.netloc,
+                    dependency["name"],
+                    dependency["id"],
+                    self.id,
+                )
+                results[dependency["name"]] = sha256
+        finally:
+            executor.shutdown(wait=True)
+        return results
+
+    def restore_caches(self, store, root="."):
+        """Restore the caches defined in the job's configuration.
+
+        Parameters
+        ----------
+        store : :py:class:`LocalCacheStore <gitlab_runner_api.LocalCacheStore>`
+            Store to restore the caches from
+        root : :obj:`str`, optional
+            Directory to restore the caches into
+
+        Returns
+        -------
+        :obj:`list` of :obj:`str`
+            Keys of the caches which were restored
+        """
+        return [c.key for c in self.caches if c.pull and store.restore(c.key, root)]
+
+    def save_caches(self, store, root=".", state="success"):
+        """Save the caches defined in the job's configuration.
+
+        Parameters
+        ----------
+        store : :py:class:`LocalCacheStore <gitlab_runner_api.LocalCacheStore>`
+            Store to save the caches to
+        root : :obj:`str`, optional
+            Directory the cache paths are relative to
+        state : :obj:`str`, optional
+            Result of the job, used to select caches based on their ``when``
+
+        Returns
+        -------
+        :obj:`list` of :obj:`str`
+            Keys of the caches which were saved
+        """
+        return [
+            c.key
+            for c in self.caches
+            if c.push(state) and store.save(c.key, c.paths, root, c.untracked)
+        ]
 
     @property
     def id(self):
@@ -248,6 +706,41 @@ class Job(object):
     def token(self):
         return self._token
 
+    @property
+    def content_encoding(self):
+        """Encoding used to compress trace updates, either "gzip", "deflate" or None.
+
+        Compression is disabled automatically if the server rejects it.
+        """
+        return self._content_encoding
+
+    @content_encoding.setter
+    def content_encoding(self, content_encoding):
+        if (
+            content_encoding is not None
+            and content_encoding not in compression.SUPPORTED_ENCODINGS
+        ):
+            raise ValueError("Unsupported content encoding " + repr(content_encoding))
+        self._content_encoding = content_encoding
+
+    @property
+    def is_cancelled(self):
+        return self._cancelled
+
+    @property
+    def on_cancel(self):
+        """Callback to run with the job when it is found to have been cancelled.
+
+        This may be called from a background thread, see `Job.start_heartbeat`.
+        """
+        return self._on_cancel
+
+    @on_cancel.setter
+    def on_cancel(self, on_cancel):
+        if on_cancel is not None and not callable(on_cancel):
+            raise TypeError("on_cancel must be callable")
+        self._on_cancel = on_cancel
+
     @property
     def state(self):
         return self._state
@@ -345,6 +838,18 @@ class Job(object):
         if len(self._job_info["steps"]) >= 2:
             return self._job_info["steps"][1]["script"]
 
+    @property
+    def caches(self):
+        caches = []
+        for cache_info in self._job_info.get("cache") or []:
+            if not cache_info:
+                continue
+            cache_info = dict(cache_info)
+            if cache_info.get("key"):
+                cache_info["key"] = self._expand_variables(cache_info["key"])
+            caches.append(CacheSpec(**cache_info))
+        return caches
+
     def get_registry_credential(self, image_name):
         matched = []
         for credential in self._job_info["credentials"]:
@@ -422,14 +927,23 @@ class EnvVar(object):
 
 
 class JobLog(object):
+    # GitLab only allows variables of at least this length to be masked
+    min_masked_length = 8
+
     def __init__(self, job, log=None):
         self._job = job
+        self._masker = None
+        # Section markers which are sent with the next text to be appended
+        self._buffered = ""
+        self._section_durations = OrderedDict()
         if log is None:
             self._log = "Running with gitlab_runner_api " + package_version + "\n"
             self._remote_length = 0
         else:
             self._log = log
             self._remote_length = len(log)
+        # GitLab counts the trace's length in bytes rather than characters
+        self._remote_size = len(self._log[: self._remote_length].encode("utf-8"))
 
     def __str__(self):
         return self._log
@@ -446,43 +960,138 @@ class JobLog(object):
     def __add__(self, other):
         raise AttributeError("+ is not supported, use += instead")
 
+    @property
+    def masker(self):
+        """`SecretMasker` for the values of the job's masked variables"""
+        if not hasattr(self._job, "_variables"):
+            # The job's description hasn't been parsed yet
+            return SecretMasker([])
+        if self._masker is None:
+            self._masker = SecretMasker(
+                [
+                    var.value
+                    for var in self._job._variables.values()
+                    if var.is_masked
+                    and not var.is_public
+                    and len(var.value) >= self.min_masked_length
+                ]
+            )
+        return self._masker
+
+    @property
+    def _pending(self):
+        """Text and section markers which haven't been added to the log yet"""
+        held_back = "" if self._masker is None else self._masker.pending
+        return held_back + self._buffered
+
+    def _flush(self):
+        """Append any text which was held back for masking or as section markers"""
+        if self._buffered or self._masker is not None:
+            self._log += self.masker.mask(self._buffered) + self.masker.flush()
+            self._buffered = ""
+
+    @property
+    def section_durations(self):
+        """Time spent in each section of the log in seconds, see `JobLog.section`"""
+        return OrderedDict(self._section_durations)
+
+    @contextmanager
+    def section(self, name, header=None, collapsed=False):
+        """Context manager to wrap output in a collapsible section of the log.
+
+        The section markers are sent to GitLab along with the next text which
+        is appended to the log.
+
+        Parameters
+        ----------
+        name : :obj:`str`
+            Identifier of the section, may only contain letters, digits, "_",
+            "." and "-"
+        header : :obj:`str`, optional
+            Text shown for the section in GitLab, defaults to name
+        collapsed : :obj:`bool`, optional
+            Collapse the section by default
+        """
+        if not re.match(r"^[a-zA-Z0-9_.-]+$", name):
+            raise ValueError("Section names must match /^[a-zA-Z0-9_.-]+$/")
+        start = time.time()
+        self._buffered += (
+            "{clear}section_start:{ts}:{name}{options}\r{clear}{header}\n".format(
+                clear=ansi.CLEAR,
+                ts=int(start),
+                name=name,
+                options="[collapsed=true]" if collapsed else "",
+                header=name if header is None else header,
+            )
+        )
+        try:
+            yield self
+        finally:
+            end = time.time()
+            self._buffered += "{clear}section_end:{ts}:{name}\r{clear}".format(
+                clear=ansi.CLEAR, ts=int(end), name=name
+            )
+            self._section_durations[name] = (
+                self._section_durations.get(name, 0) + end - start
+            )
+            logger.debug(
+                "Job %d: Section %s took %.3f seconds", self._job.id, name, end - start
+            )
+
+    @property
+    def _span(self):
+        return self._job._span
+
+    @tracing.traced("gitlab_runner_api.trace_patch")
     def __iadd__(self, other):
         if other == "":
             logger.debug("Job %d: Skipping empty log patch", self._job.id)
             return self
 
-        logger.debug("Job %d: Appending to log: %s", self._job.id, other)
-        self._log += str(other)
+        text = self.masker.mask(self._buffered + str(other))
+        self._buffered = ""
+        if text == "":
+            logger.debug("Job %d: Holding back possible secret", self._job.id)
+            return self
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Job %d: Appending to log: %s", self._job.id, truncate(text))
+        self._log += text
 
         # Update the log on GitLab
+        patch = self._log[self._remote_length :].encode("utf-8")
         headers = {
             "JOB-TOKEN": self._job.token,
-            "Content-Range": str(self._remote_length)
-            + "-"
-            + str(len(self) - self._remote_length),
+            "Content-Range": str(self._remote_size) + "-" + str(len(patch)),
         }
-        response = requests.patch(
+        response = self._job._send(
+            "PATCH",
             self._job._runner.api_url + "/api/v4/jobs/" + str(self._job.id) + "/trace",
-            str(self)[self._remote_length :],
-            headers=headers,
+            "jobs/:id/trace",
+            patch,
+            headers,
         )
 
         if response.status_code == 202:
             logger.info(
                 "%s: Patched %d characters to Job %d",
-                urlparse(response.url).netloc,
+                self._job._runner.netloc,
                 len(other),
                 self._job.id,
             )
-            self._remote_length += len(other)
+            self._remote_length = len(self._log)
+            self._remote_size += len(patch)
+            if response.headers.get("Job-Status") in CANCELLED_STATUSES:
+                self._job._set_cancelled()
         elif response.status_code == 403:
             logger.error(
                 "%s: Failed to authenticate job %d with token %s",
-                urlparse(response.url).netloc,
+                self._job._runner.netloc,
                 self._job.id,
                 self._job.token,
             )
-            if response.headers["Job-Status"] == "canceled":
+            if response.headers.get("Job-Status") in CANCELLED_STATUSES:
+                self._job._set_cancelled()
                 raise JobCancelledException()
             else:
                 raise AuthException()
@@ -490,17 +1099,18 @@ class JobLog(object):
             logger.warning(
                 "%s: Failed to patch Job %d's log with %s due to "
                 "invalid content range, resetting...",
-                urlparse(response.url).netloc,
+                self._job._runner.netloc,
                 self._job.id,
                 headers,
             )
             self._job._update_state()
             self._remote_length = len(self._log)
+            self._remote_size = len(self._log.encode("utf-8"))
         else:
             logger.warning(
                 "%s: Failed apply log patch to Job %d for unknown"
                 "reason. Status code: %d Content: %s",
-                urlparse(response.url).netloc,
+                self._job._runner.netloc,
                 self._job.id,
                 response.status_code,
                 response.content,
@@ -2,17 +2,75 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import json
 import logging
 
-import colorlog
 
+__all__ = ["JSONFormatter", "configure", "logger", "truncate"]
 
-__all__ = ["logger"]
-
-handler = colorlog.StreamHandler()
-handler.setFormatter(
-    colorlog.ColoredFormatter("%(log_color)s%(levelname)s:%(name)s:%(message)s")
-)
-logger = colorlog.getLogger("gitlab_runner_api")
-logger.addHandler(handler)
+# No handler is installed by default so applications control the formatting,
+# see `configure` for adding the handler used by the command line tools
+logger = logging.getLogger("gitlab_runner_api")
+logger.addHandler(logging.NullHandler())
 logger.setLevel(logging.INFO)
+
+_handler = None
+
+
+class JSONFormatter(logging.Formatter):
+    """Format each record as a single line JSON object"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data)
+
+
+def configure(level=logging.INFO, json_format=False, stream=None):
+    """Print the package's log messages.
+
+    Calling this function again replaces the previously configured handler.
+
+    Parameters
+    ----------
+    level : :obj:`int`, optional
+        Minimum level of messages to show
+    json_format : :obj:`bool`, optional
+        Write each message as a JSON object instead of coloured text
+    stream : file-like, optional
+        Stream to write to, defaults to ``sys.stderr``
+
+    Returns
+    -------
+    :py:class:`logging.Handler`
+    """
+    global _handler
+    if _handler is not None:
+        logger.removeHandler(_handler)
+
+    if json_format:
+        _handler = logging.StreamHandler(stream)
+        _handler.setFormatter(JSONFormatter())
+    else:
+        import colorlog
+
+        _handler = colorlog.StreamHandler(stream)
+        _handler.setFormatter(
+            colorlog.ColoredFormatter("%(log_color)s%(levelname)s:%(name)s:%(message)s")
+        )
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    return _handler
+
+
+def truncate(text, length=200):
+    """Shorten text for including in debug messages"""
+    if len(text) <= length:
+        return text
+    return text[:length] + "... ({n} more characters)".format(n=len(text) - length)
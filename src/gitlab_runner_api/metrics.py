@@ -0,0 +1,312 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = [
+    "Collector",
+    "HistogramCollector",
+    "add_collector",
+    "remove_collector",
+    "request",
+    "retry",
+]
+
+from bisect import bisect_left
+import threading
+import time
+
+from . import tracing
+from .transport import send
+from .logging import logger
+
+# The same default buckets as the Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_timer = getattr(time, "perf_counter", time.time)
+
+_collectors = []
+
+
+class Collector(object):
+    """Base class for receiving measurements of calls to the GitLab API.
+
+    Subclasses are registered using `add_collector` and are called from the
+    thread which made the request, so must be thread safe.
+    """
+
+    def observe(
+        self, endpoint, method, status_code, duration, request_size, response_size
+    ):
+        """Record a completed request.
+
+        Parameters
+        ----------
+        endpoint : :obj:`str`
+            Name of the API endpoint, such as ``jobs/:id/trace``
+        method : :obj:`str`
+            HTTP method of the request
+        status_code : :obj:`int` or None
+            Status code of the response or None if the request failed
+        duration : :obj:`float`
+            Time taken for the request in seconds
+        request_size : :obj:`int`
+            Size of the request body in bytes
+        response_size : :obj:`int`
+            Size of the response body in bytes, if known
+        """
+        pass
+
+    def retry(self, endpoint):
+        """Record that a request to endpoint is being retried.
+
+        Parameters
+        ----------
+        endpoint : :obj:`str`
+            Name of the API endpoint, such as ``jobs/:id/trace``
+        """
+        pass
+
+
+def add_collector(collector):
+    """Report all future API calls to collector"""
+    if not isinstance(collector, Collector):
+        raise TypeError("Expected Collector but got " + type(collector).__name__)
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def remove_collector(collector):
+    """Stop reporting API calls to collector"""
+    if collector in _collectors:
+        _collectors.remove(collector)
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+def _notify(method_name, *args):
+    for collector in list(_collectors):
+        try:
+            getattr(collector, method_name)(*args)
+        except Exception as e:
+            logger.warning("Metrics collector %r failed with %r", collector, e)
+
+
+def request(method, url, endpoint, transport=None, **kwargs):
+    """Make a request using transport, reporting it to the collectors.
+
+    Parameters
+    ----------
+    method : :obj:`str`
+        HTTP method of the request
+    url : :obj:`str`
+        URL to request
+    endpoint : :obj:`str`
+        Name of the endpoint for labelling the measurements
+    transport : `gitlab_runner_api.transport.Transport`, optional
+        Transport to send the request with, defaults to the current transport
+    **kwargs
+        Passed to `gitlab_runner_api.transport.Transport.request`
+
+    Returns
+    -------
+    :py:class:`requests.Response`
+    """
+    if not _collectors and tracing.get_tracer() is None:
+        return send(method, url, transport, **kwargs)
+
+    attributes = {"http.method": method, "http.url": url, "gitlab.endpoint": endpoint}
+    with tracing.span("HTTP " + method, **attributes) as span:
+        start = _timer()
+        try:
+            response = send(method, url, transport, **kwargs)
+        except Exception:
+            _notify("observe", endpoint, method, None, _timer() - start, 0, 0)
+            raise
+        duration = _timer() - start
+        span.set_attribute("http.status_code", response.status_code)
+
+    if _collectors:
+        if kwargs.get("stream"):
+            # Reading the content would consume the stream
+            response_size = int(response.headers.get("Content-Length", 0))
+        else:
+            response_size = len(response.content)
+        _notify(
+            "observe",
+            endpoint,
+            method,
+            response.status_code,
+            duration,
+            _body_size(response.request.body),
+            response_size,
+        )
+    return response
+
+
+def retry(endpoint):
+    """Report that a request to endpoint is being retried"""
+    if _collectors:
+        _notify("retry", endpoint)
+
+
+def _format_labels(labels):
+    return ",".join(
+        '{0}="{1}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+
+
+class HistogramCollector(Collector):
+    """In-memory collector of request latencies, sizes and retries.
+
+    Parameters
+    ----------
+    buckets : :obj:`tuple` of :obj:`float`, optional
+        Upper bounds of the latency histogram's buckets in seconds
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Discard all measurements"""
+        with self._lock:
+            # (endpoint, method, status) -> [bucket counts..., count, sum]
+            self._durations = {}
+            # (endpoint, method) -> [request bytes, response bytes]
+            self._sizes = {}
+            # endpoint -> count
+            self._retries = {}
+
+    def observe(
+        self, endpoint, method, status_code, duration, request_size, response_size
+    ):
+        status = "error" if status_code is None else str(status_code)
+        index = bisect_left(self._buckets, duration)
+        with self._lock:
+            key = (endpoint, method, status)
+            if key not in self._durations:
+                self._durations[key] = [0] * len(self._buckets) + [0, 0.0]
+            values = self._durations[key]
+            if index < len(self._buckets):
+                values[index] += 1
+            values[-2] += 1
+            values[-1] += duration
+
+            sizes = self._sizes.setdefault((endpoint, method), [0, 0])
+            sizes[0] += request_size
+            sizes[1] += response_size
+
+    def retry(self, endpoint):
+        with self._lock:
+            self._retries[endpoint] = self._retries.get(endpoint, 0) + 1
+
+    def count(self, endpoint, method=None, status_code=None):
+        """Number of requests made to endpoint"""
+        with self._lock:
+            return sum(
+                values[-2]
+                for (e, m, s), values in self._durations.items()
+                if e == endpoint
+                and (method is None or m == method)
+                and (status_code is None or s == str(status_code))
+            )
+
+    def retries(self, endpoint):
+        """Number of retries of requests to endpoint"""
+        with self._lock:
+            return self._retries.get(endpoint, 0)
+
+    def bytes_sent(self, endpoint):
+        """Total size of the bodies of requests to endpoint"""
+        with self._lock:
+            return sum(s[0] for (e, _), s in self._sizes.items() if e == endpoint)
+
+    def bytes_received(self, endpoint):
+        """Total size of the bodies of responses from endpoint"""
+        with self._lock:
+            return sum(s[1] for (e, _), s in self._sizes.items() if e == endpoint)
+
+    def to_prometheus(self, prefix="gitlab_runner_api"):
+        """Export the measurements in the Prometheus text format.
+
+        Parameters
+        ----------
+        prefix : :obj:`str`, optional
+            Prefix for the name of each metric
+
+        Returns
+        -------
+        :obj:`str`
+        """
+        lines = []
+        with self._lock:
+            name = prefix + "_request_duration_seconds"
+            lines.append("# HELP " + name + " Duration of GitLab API requests")
+            lines.append("# TYPE " + name + " histogram")
+            for (endpoint, method, status), values in sorted(self._durations.items()):
+                labels = [
+                    ("endpoint", endpoint),
+                    ("method", method),
+                    ("status", status),
+                ]
+                cumulative = 0
+                for i, bound in enumerate(self._buckets):
+                    cumulative += values[i]
+                    lines.append(
+                        "{0}_bucket{{{1}}} {2}".format(
+                            name,
+                            _format_labels(labels + [("le", repr(float(bound)))]),
+                            cumulative,
+                        )
+                    )
+                lines.append(
+                    "{0}_bucket{{{1}}} {2}".format(
+                        name, _format_labels(labels + [("le", "+Inf")]), values[-2]
+                    )
+                )
+                lines.append(
+                    "{0}_sum{{{1}}} {2!r}".format(
+                        name, _format_labels(labels), values[-1]
+                    )
+                )
+                lines.append(
+                    "{0}_count{{{1}}} {2}".format(
+                        name, _format_labels(labels), values[-2]
+                    )
+                )
+
+            for index, suffix, description in [
+                (0, "_request_bytes_total", "Bytes sent to the GitLab API"),
+                (1, "_response_bytes_total", "Bytes received from the GitLab API"),
+            ]:
+                name = prefix + suffix
+                lines.append("# HELP " + name + " " + description)
+                lines.append("# TYPE " + name + " counter")
+                for (endpoint, method), sizes in sorted(self._sizes.items()):
+                    labels = [("endpoint", endpoint), ("method", method)]
+                    lines.append(
+                        "{0}{{{1}}} {2}".format(
+                            name, _format_labels(labels), sizes[index]
+                        )
+                    )
+
+            name = prefix + "_retries_total"
+            lines.append("# HELP " + name + " Retried GitLab API requests")
+            lines.append("# TYPE " + name + " counter")
+            for endpoint, value in sorted(self._retries.items()):
+                lines.append(
+                    "{0}{{{1}}} {2}".format(
+                        name, _format_labels([("endpoint", endpoint)]), value
+                    )
+                )
+        return "\n".join(lines) + "\n"
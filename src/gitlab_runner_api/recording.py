@@ -0,0 +1,302 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["RecordingTransport", "ReplayTransport", "record", "replay"]
+
+import base64
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import gzip
+import json
+import threading
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import six
+from six.moves.urllib.parse import parse_qsl, urlparse
+
+from . import transport
+from .logging import logger
+from .utils import compression
+
+_timer = getattr(time, "perf_counter", time.time)
+
+# Headers which carry credentials
+_SECRET_HEADERS = ["JOB-TOKEN", "PRIVATE-TOKEN", "Authorization"]
+# Headers which describe how the body was sent rather than the body itself
+_TRANSFER_HEADERS = ["Content-Encoding", "Content-Length", "Transfer-Encoding"]
+# Shorter values are not redacted to avoid mangling unrelated text
+_MIN_SECRET_LENGTH = 8
+
+
+def _body_text(body):
+    """Get body as text and whether it had to be base64 encoded"""
+    if body is None or isinstance(body, six.text_type):
+        return body, False
+    try:
+        return body.decode("utf-8"), False
+    except UnicodeDecodeError:
+        return base64.b64encode(body).decode("ascii"), True
+
+
+def _find_secrets(data, secrets):
+    """Collect the credentials in a decoded JSON document"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in ["token", "password"] and isinstance(value, six.string_types):
+                secrets.add(value)
+            else:
+                _find_secrets(value, secrets)
+        # Values of variables which are not public are secrets
+        if data.get("public") is False or data.get("masked") is True:
+            if isinstance(data.get("value"), six.string_types):
+                secrets.add(data["value"])
+    elif isinstance(data, list):
+        for value in data:
+            _find_secrets(value, secrets)
+
+
+def _find_json_secrets(text, secrets):
+    try:
+        _find_secrets(json.loads(text), secrets)
+    except (TypeError, ValueError):
+        pass
+
+
+class RecordingTransport(transport.Transport):
+    """Record every request and response to a gzip compressed file.
+
+    Each exchange is written as a line of JSON. Compressed request bodies are
+    recorded uncompressed and the bodies of streamed responses are not
+    recorded, only their size if it is known. Tokens, passwords and the
+    values of secret variables are replaced with placeholders, consistently
+    throughout the file, so the recording can be replayed with
+    `ReplayTransport` without containing any credentials.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        File to write the recording to
+    transport : `gitlab_runner_api.transport.Transport`, optional
+        Transport used to send the requests, defaults to the current transport
+    redact : :obj:`bool`, optional
+        Replace credentials with placeholders
+    """
+
+    def __init__(self, path, transport=None, redact=True):
+        self._transport = transport
+        self._redact = redact
+        self._fp = gzip.open(path, "wb")
+        self._lock = threading.Lock()
+        self._secrets = {}
+        self._start = _timer()
+
+    def _placeholder(self, secret):
+        if secret not in self._secrets:
+            self._secrets[secret] = "REDACTED" + str(len(self._secrets) + 1)
+        return self._secrets[secret]
+
+    def request(self, method, url, **kwargs):
+        inner = self._transport
+        if inner is None:
+            inner = transport.get_transport()
+        start = _timer()
+        response = inner.request(method, url, **kwargs)
+        if kwargs.get("stream"):
+            # Leave the body for the caller, only its size is recorded
+            content = None
+        else:
+            content = response.content
+        duration = _timer() - start
+        self._write(method, url, kwargs, response, content, start, duration)
+        return response
+
+    def _write(self, method, url, kwargs, response, content, start, duration):
+        request_headers = dict(kwargs.get("headers") or {})
+        request = getattr(response, "request", None)
+        data = kwargs.get("data")
+        if kwargs.get("json") is not None:
+            request_body = json.dumps(kwargs["json"])
+        elif isinstance(data, (six.binary_type, six.text_type)):
+            # Use the body which was sent as the transport may have changed
+            # request.body and compressed bodies can't be redacted
+            request_body = data
+            encoding = request_headers.get("Content-Encoding")
+            if encoding is not None:
+                try:
+                    request_body = compression.decompress(data, encoding)
+                except (ValueError, zlib.error):
+                    pass
+                else:
+                    del request_headers["Content-Encoding"]
+        elif request is not None and not hasattr(request.body, "read"):
+            request_body = request.body
+        else:
+            # Streamed uploads are not recorded
+            request_body = None
+        request_body, request_base64 = _body_text(request_body)
+
+        headers = {
+            k: v for k, v in response.headers.items() if k not in _TRANSFER_HEADERS
+        }
+        if content is None:
+            body, body_base64 = None, False
+            size = response.headers.get("Content-Length")
+            size = None if size is None else int(size)
+        else:
+            body, body_base64 = _body_text(content)
+            size = len(content)
+            headers["Content-Length"] = str(size)
+
+        entry = {
+            "start": start - self._start,
+            "duration": duration,
+            "method": method,
+            "url": url,
+            "request": {
+                "headers": request_headers,
+                "body": request_body,
+                "base64": request_base64,
+            },
+            "status": response.status_code,
+            "headers": headers,
+            "body": body,
+            "base64": body_base64,
+            "size": size,
+        }
+
+        with self._lock:
+            line = json.dumps(entry, sort_keys=True)
+            if self._redact:
+                secrets = set()
+                for header in _SECRET_HEADERS:
+                    if header in request_headers:
+                        secrets.add(request_headers[header])
+                secrets.update(
+                    v for k, v in parse_qsl(urlparse(url).query) if k == "token"
+                )
+                for text in [request_body, body]:
+                    if text is not None:
+                        _find_json_secrets(text, secrets)
+                for secret in secrets:
+                    if len(secret) >= _MIN_SECRET_LENGTH:
+                        self._placeholder(secret)
+                # Replace the longest first in case one contains another
+                for secret in sorted(self._secrets, key=len, reverse=True):
+                    line = line.replace(json.dumps(secret)[1:-1], self._secrets[secret])
+            self._fp.write((line + "\n").encode("utf-8"))
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+
+class ReplayTransport(transport.Transport):
+    """Respond to requests with those saved by `RecordingTransport`.
+
+    Responses are matched to requests by their method and path, in the order
+    they were recorded.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        File containing the recording
+    speed : :obj:`float` or None, optional
+        Wait for the recorded duration of each request divided by speed before
+        responding, or None to respond immediately
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._responses = defaultdict(deque)
+        with gzip.open(path, "rb") as fp:
+            for line in fp:
+                entry = json.loads(line.decode("utf-8"))
+                key = (entry["method"], urlparse(entry["url"]).path)
+                self._responses[key].append(entry)
+
+    def __len__(self):
+        """Number of recorded responses which haven't been used"""
+        return sum(len(v) for v in self._responses.values())
+
+    def request(self, method, url, **kwargs):
+        key = (method, urlparse(url).path)
+        with self._lock:
+            if not self._responses[key]:
+                raise requests.ConnectionError(
+                    "No recorded response for " + method + " " + url
+                )
+            entry = self._responses[key].popleft()
+
+        if self.speed is not None:
+            time.sleep(entry["duration"] / self.speed)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = url
+        if entry["base64"]:
+            response._content = base64.b64decode(entry["body"])
+        elif entry["body"] is None:
+            response._content = b""
+        else:
+            response._content = entry["body"].encode("utf-8")
+        response._content_consumed = True
+        response.request = requests.Request(
+            method,
+            url,
+            headers=kwargs.get("headers"),
+            params=kwargs.get("params"),
+            data=kwargs.get("data"),
+            json=kwargs.get("json"),
+        ).prepare()
+        return response
+
+
+@contextmanager
+def record(path, redact=True):
+    """Record all requests to the GitLab API made inside the context.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        File to write the recording to
+    redact : :obj:`bool`, optional
+        Replace credentials with placeholders
+    """
+    previous = transport.get_transport()
+    recorder = RecordingTransport(path, previous, redact)
+    transport.set_transport(recorder)
+    try:
+        yield recorder
+    finally:
+        transport.set_transport(previous)
+        recorder.close()
+        logger.debug("Wrote recording of GitLab API requests to %s", path)
+
+
+@contextmanager
+def replay(path, speed=1.0):
+    """Respond to requests to the GitLab API made inside the context from path.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        File containing the recording
+    speed : :obj:`float` or None, optional
+        Factor to speed up the recorded response times by, None to respond
+        immediately
+    """
+    previous = transport.get_transport()
+    replayer = ReplayTransport(path, speed)
+    transport.set_transport(replayer)
+    try:
+        yield replayer
+    finally:
+        transport.set_transport(previous)
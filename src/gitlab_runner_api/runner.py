@@ -11,9 +11,10 @@ except ImportError:
     # Python 2
     from urlparse import urlparse
 
-import requests
 import six
 
+from . import metrics
+from . import tracing
 from .exceptions import AuthException
 from .job import Job
 from .logging import logger
@@ -39,6 +40,7 @@ class Runner(object):
         architecture=None,
         executor=None,
         access_level=None,
+        transport=None,
     ):
         """Register a new runner in GitLab.
 
@@ -74,6 +76,9 @@ class Runner(object):
             The runner's executor
         access_level : :obj:`str`, optional
             Limit the jobs which will be sent to the runner (for security)
+        transport : `gitlab_runner_api.transport.Transport`, optional
+            Transport to send this runner's requests with, defaults to the
+            current transport
 
         Returns
         -------
@@ -142,7 +147,13 @@ class Runner(object):
                 raise ValueError("access_level must be one of %r" % valid_values)
             data["info"]["access_level"] = access_level
 
-        request = requests.post(api_url + "/api/v4/runners/", json=data)
+        request = metrics.request(
+            "POST",
+            api_url + "/api/v4/runners/",
+            "runners",
+            transport=transport,
+            json=data,
+        )
         if request.status_code == 201:
             runner_id = int(request.json()["id"])
             runner_token = request.json()["token"]
@@ -169,32 +180,36 @@ class Runner(object):
         if "active" in data:
             del data["active"]
 
-        return cls(api_url, runner_id, runner_token, data)
+        return cls(api_url, runner_id, runner_token, data, transport=transport)
 
     @classmethod
-    def load(cls, filename):
+    def load(cls, filename, transport=None):
         """Serialise this runner as a file which can be loaded with `Runner.load`.
 
         Parameters
         ----------
         filename : :obj:`str`
             Path to file that represents the runner to initialise.
+        transport : `gitlab_runner_api.transport.Transport`, optional
+            Transport to send this runner's requests with
 
         Returns
         -------
         :py:class:`Runner <gitlab_runner_api.Runner>`
         """
         with open(filename, "rt") as fp:
-            return cls.loads(fp.read())
+            return cls.loads(fp.read(), transport=transport)
 
     @classmethod
-    def loads(cls, data):
+    def loads(cls, data, transport=None):
         """Serialise this runner as a file which can be loaded with `Runner.load`.
 
         Parameters
         ----------
         data : :obj:`str`
             String representing the runner to initialise
+        transport : `gitlab_runner_api.transport.Transport`, optional
+            Transport to send this runner's requests with
 
         Returns
         -------
@@ -203,31 +218,39 @@ class Runner(object):
         data = json.loads(data)
         version, data = data[0], data[1:]
         if version == 1:
-            return cls(*data)
+            return cls(*data, transport=transport)
         else:
             raise ValueError("Unrecognised data version: " + str(version))
 
-    def __init__(self, api_url, runner_id, runner_token, data):
+    def __init__(self, api_url, runner_id, runner_token, data, transport=None):
         self._api_url = api_url
+        # Cached as it is included in most log messages
+        self._netloc = urlparse(api_url).netloc
         self._id = runner_id
         self._token = runner_token
         self._data = data
+        # Not serialised as it only applies to this process
+        self._transport = transport
         self.check_auth()
 
     def check_auth(self):
-        request = requests.post(
-            self.api_url + "/api/v4/runners/verify", json={"token": self.token}
+        request = metrics.request(
+            "POST",
+            self.api_url + "/api/v4/runners/verify",
+            "runners/verify",
+            transport=self.transport,
+            json={"token": self.token},
         )
         if request.status_code == 200:
             logger.info(
                 "%s: Successfully initialised runner %d",
-                urlparse(request.url).netloc,
+                self.netloc,
                 self.id,
             )
         elif request.status_code == 403:
             logger.error(
                 "%s: Failed to authenticate runner %d with token %s",
-                urlparse(request.url).netloc,
+                self.netloc,
                 self.id,
                 self.token,
             )
@@ -261,30 +284,46 @@ class Runner(object):
             [CURRENT_DATA_VERSION, self.api_url, self.id, self.token, self._data]
         )
 
-    def request_job(self):
+    @tracing.traced("gitlab_runner_api.request_job")
+    def request_job(self, prefetch_dependencies=None, artifact_cache=None):
         """Request a new job to run.
 
+        Parameters
+        ----------
+        prefetch_dependencies : :obj:`str`, optional
+            Directory into which the artifacts of the job's dependencies
+            should be fetched in the background, see `Job.fetch_dependencies`
+        artifact_cache : :py:class:`gitlab_runner_api.ArtifactCache`, optional
+            Local cache to use when prefetching artifacts
+
         Returns
         -------
         :py:class:`Job <gitlab_runner_api.Job>` or None
         """
-        request = requests.post(
+        request = metrics.request(
+            "POST",
             self.api_url + "/api/v4/jobs/request",
+            "jobs/request",
+            transport=self.transport,
             json={"token": self.token, "info": self._info},
         )
         if request.status_code == 201:
             job = Job(self, request.json())
             logger.info(
                 "%s: Got a job %s for runner %d",
-                urlparse(request.url).netloc,
+                self.netloc,
                 job.job_url,
                 self.id,
             )
+            if prefetch_dependencies is not None:
+                job.fetch_dependencies(
+                    prefetch_dependencies, wait=False, cache=artifact_cache
+                )
             return job
         elif request.status_code == 204:
             logger.info(
                 "%s: No jobs available %d with token %s",
-                urlparse(request.url).netloc,
+                self.netloc,
                 self.id,
                 self.token,
             )
@@ -292,7 +331,7 @@ class Runner(object):
         elif request.status_code == 403:
             logger.error(
                 "%s: Failed to authenticate runner %d with token %s",
-                urlparse(request.url).netloc,
+                self.netloc,
                 self.id,
                 self.token,
             )
@@ -300,7 +339,7 @@ class Runner(object):
         elif request.status_code == 409:
             logger.error(
                 "%s: Received 409 conflict for runner %d with token %s",
-                urlparse(request.url).netloc,
+                self.netloc,
                 self.id,
                 self.token,
             )
@@ -314,7 +353,10 @@ class Runner(object):
         return "Runner(id={id}, token={token})".format(id=self.id, token=self.token)
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        # Runners are the same regardless of how their requests are sent
+        return dict(self.__dict__, _transport=None) == dict(
+            other.__dict__, _transport=None
+        )
 
     @property
     def _info(self):
@@ -324,6 +366,16 @@ class Runner(object):
     def api_url(self):
         return self._api_url
 
+    @property
+    def netloc(self):
+        """Host name and port of the GitLab instance"""
+        return self._netloc
+
+    @property
+    def transport(self):
+        """Transport for this runner's requests, None to use the current one"""
+        return self._transport
+
     @property
     def id(self):
         return self._id
@@ -2,24 +2,45 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import deque, OrderedDict
 import inspect
 import json
+import re
+import shutil
 import string
+import tempfile
+import threading
+import time
 
 import six
 
+from .faults import FaultInjector
 from .job import Job
 from .runner import Runner
+from .server import FakeGitlabServer
+from .transport import InProcessTransport
+from .workload import Workload
 from .utils import (
     check_token,
     random_string,
     run_test_with_artifact,
+    run_test_with_tmpdir,
     validate_runner_info,
 )
 
 API_ENDPOINT = "https://gitlab.cern.ch/api/v4"
 
-__all__ = ["API_ENDPOINT", "FakeGitlabAPI", "test_log", "run_test_with_artifact"]
+__all__ = [
+    "API_ENDPOINT",
+    "FakeGitlabAPI",
+    "FakeGitlabServer",
+    "FaultInjector",
+    "InProcessTransport",
+    "Workload",
+    "test_log",
+    "run_test_with_artifact",
+    "run_test_with_tmpdir",
+]
 
 if six.PY2:
     getfullargspec = inspect.getargspec
@@ -36,6 +57,9 @@ class FakeGitlabAPI(object):
         n_success=0,
         n_failed=0,
         n_with_artifacts=0,
+        serve=False,
+        faults=None,
+        in_process=False,
     ):
         self.n_runners = n_runners
         self.n_pending = n_pending
@@ -43,9 +67,18 @@ class FakeGitlabAPI(object):
         self.n_success = n_success
         self.n_failed = n_failed
         self.n_with_artifacts = n_with_artifacts
+        # Serve the API over HTTP on localhost instead of patching requests
+        self.serve = serve
+        # Call the callbacks directly instead of patching requests
+        self.in_process = in_process
+        # Optional FaultInjector for making requests fail or be slow
+        self.faults = faults
 
         self._next_runner_id = 0
         self._next_job_id = 0
+        # Held by callbacks while they change the API's state, as they can be
+        # called concurrently when serving
+        self._lock = threading.Lock()
 
         self.do_init()
 
@@ -54,31 +87,51 @@ class FakeGitlabAPI(object):
 
         self._runners = {}
 
-        self._jobs = []
+        # Jobs indexed by state, the job status setter moves jobs between
+        # the running and completed indexes
+        self._pending_jobs = deque()
+        self._running_jobs = OrderedDict()
+        self._completed_jobs = OrderedDict()
+
+        # Values of Content-Encoding which are accepted for request bodies
+        self.supported_encodings = ["gzip", "deflate"]
 
     @property
     def token(self):
         return self._token
 
+    @property
+    def url(self):
+        """URL of the GitLab instance to pass to `Runner.register`"""
+        if self.serve:
+            return self._rsps.url
+        return API_ENDPOINT[: -len("/api/v4")]
+
     @property
     def runners(self):
         return self._runners
 
     @property
     def pending_jobs(self):
-        return [j for j in self._jobs if isinstance(j, dict)]
+        return list(self._pending_jobs)
 
     @property
     def running_jobs(self):
-        return [
-            j for j in self._jobs if not isinstance(j, dict) and j.status == "running"
-        ]
+        return list(self._running_jobs.values())
 
     @property
     def completed_jobs(self):
-        return [
-            j for j in self._jobs if not isinstance(j, dict) and j.status != "running"
-        ]
+        return list(self._completed_jobs.values())
+
+    def add_pending_job(self, job_info):
+        """Queue a job to be given to the next runner which requests one.
+
+        Parameters
+        ----------
+        job_info : :obj:`dict`
+            Description of the job, must contain at least ``name``
+        """
+        self._pending_jobs.append(job_info)
 
     @property
     def next_runner_id(self):
@@ -93,33 +146,72 @@ class FakeGitlabAPI(object):
     def __enter__(self):
         import responses
 
+        # Validate before starting to mock so nothing is left running
+        if self.n_with_artifacts > self.n_success + self.n_failed:
+            raise ValueError(
+                "n_with_artifacts must be smaller than n_success + n_failed"
+            )
+        if self.serve and self.in_process:
+            raise ValueError("serve and in_process cannot both be used")
+
         self.do_init()
-        self._rsps = responses.RequestsMock(assert_all_requests_are_fired=False)
+        # Uploaded artifacts are stored on disk until the API is exited
+        self._artifacts_dir = tempfile.mkdtemp(prefix="fake-gitlab-artifacts-")
+        if self.faults is not None:
+            self.faults.reset()
+        # Delays are applied before dispatching so requests are still handled
+        # concurrently
+        delay = None if self.faults is None else self.faults.delay
+        if self.serve:
+            self._rsps = FakeGitlabServer(delay=delay)
+        elif self.in_process:
+            self._rsps = InProcessTransport(delay=delay)
+        else:
+            self._rsps = responses.RequestsMock(assert_all_requests_are_fired=False)
         self._rsps.__enter__()
 
         # Register callbacks
         self._rsps.add_callback(
             responses.POST,
             API_ENDPOINT + "/runners/",
-            callback=self._register_runner_callback,
+            callback=self._callback("runners", self._register_runner_callback),
         )
         self._rsps.add_callback(
             responses.POST,
             API_ENDPOINT + "/runners/verify",
-            callback=self._verify_runner_callback,
+            callback=self._callback("runners/verify", self._verify_runner_callback),
         )
         self._rsps.add_callback(
             responses.POST,
             API_ENDPOINT + "/jobs/request",
-            callback=self._request_job_callback,
+            callback=self._callback("jobs/request", self._request_job_callback),
         )
+        # Requests for a specific job are routed by the id in the URL
+        job_routes = [
+            (responses.PUT, "", "_update_job_callback", True),
+            (responses.PATCH, "/trace", "_update_log_callback", True),
+            (responses.POST, "/artifacts", "_upload_artifacts_callback", False),
+            (responses.GET, "/artifacts", "_download_artifacts_callback", True),
+        ]
+        for method, suffix, name, locked in job_routes:
+            pattern = re.compile(
+                re.escape(self.url + "/api/v4/jobs/")
+                + r"(\d+)"
+                + re.escape(suffix)
+                + r"(?:\?.*)?$"
+            )
+            self._rsps.add_callback(
+                method,
+                pattern,
+                callback=self._job_callback("jobs/:id" + suffix, pattern, name, locked),
+            )
 
         # Add fake data to the API
         for _ in range(self.n_runners):
             _, runner = self.register_runner()
 
         for i in range(self.n_pending):
-            self._jobs.append({"name": "MyJob" + str(i)})
+            self.add_pending_job({"name": "MyJob" + str(i)})
 
         for i in range(self.n_running):
             assert self.n_runners > 0
@@ -127,26 +219,23 @@ class FakeGitlabAPI(object):
 
         for i in range(self.n_success):
             assert self.n_runners > 0
-            Job(self.next_job_id, {"name": "MyGoodJob" + str(i)}, self, runner)
-            self.running_jobs[-1].status = "success"
+            job = Job(self.next_job_id, {"name": "MyGoodJob" + str(i)}, self, runner)
+            job.status = "success"
 
         for i in range(self.n_failed):
             assert self.n_runners > 0
-            Job(self.next_job_id, {"name": "MyBadJob" + str(i)}, self, runner)
-            self.running_jobs[-1].status = "failed"
+            job = Job(self.next_job_id, {"name": "MyBadJob" + str(i)}, self, runner)
+            job.status = "failed"
 
-        if self.n_with_artifacts > self.n_success + self.n_failed:
-            raise ValueError(
-                "n_with_artifacts must be smaller than n_success + n_failed"
-            )
-        for i in range(self.n_with_artifacts):
-            self.completed_jobs[i].upload_artifacts("archive.zip", b"some_data")
+        for job in self.completed_jobs[: self.n_with_artifacts]:
+            job.upload_artifacts("archive.zip", b"some_data")
 
         return self
 
     def __exit__(self, exception_type, exception_value, traceback):
         self._rsps.__exit__(exception_type, exception_value, traceback)
         del self._rsps
+        shutil.rmtree(self._artifacts_dir, ignore_errors=True)
 
     def use(
         self,
@@ -156,6 +245,9 @@ class FakeGitlabAPI(object):
         n_success=0,
         n_failed=0,
         n_with_artifacts=0,
+        serve=False,
+        faults=None,
+        in_process=False,
     ):
         def decorator(func):
             """Decorator to active the mocking for this API"""
@@ -167,6 +259,9 @@ class FakeGitlabAPI(object):
                 self.n_success = n_success
                 self.n_failed = n_failed
                 self.n_with_artifacts = n_with_artifacts
+                self.serve = serve
+                self.faults = faults
+                self.in_process = in_process
 
                 with self:
                     if "caplog" in getfullargspec(func).args:
@@ -185,6 +280,58 @@ class FakeGitlabAPI(object):
         self._runners[token] = runner
         return token, runner
 
+    def _get_job(self, job_id):
+        job = self._running_jobs.get(job_id)
+        if job is None:
+            job = self._completed_jobs.get(job_id)
+        return job
+
+    def _inject_delay(self):
+        # The server and in-process transport delay requests before dispatching
+        if self.faults is not None and not (self.serve or self.in_process):
+            time.sleep(self.faults.delay())
+
+    def _inject_faults(self, endpoint, job=None):
+        if self.faults is None:
+            return None
+        return self.faults.apply(endpoint, job)
+
+    def _callback(self, endpoint, func):
+        """Make a callback which can be disrupted by `faults`"""
+
+        def callback(request):
+            self._inject_delay()
+            with self._lock:
+                response = self._inject_faults(endpoint)
+                if response is not None:
+                    return response
+                return func(request)
+
+        return callback
+
+    def _job_callback(self, endpoint, pattern, name, locked=True):
+        """Make a callback which passes requests on to the job in the URL
+
+        If locked is False the job's callback is called without holding the
+        lock, so that it can read a streamed body without blocking other
+        requests, and must take the lock itself to change any state.
+        """
+
+        def callback(request):
+            self._inject_delay()
+            with self._lock:
+                job = self._get_job(pattern.match(request.url).group(1))
+                if job is None:
+                    return (404, {}, json.dumps({"message": "404 Not Found"}))
+                response = self._inject_faults(endpoint, job)
+                if response is not None:
+                    return response
+                if locked:
+                    return getattr(job, name)(request)
+            return getattr(job, name)(request)
+
+        return callback
+
     def _register_runner_callback(self, request):
         payload, response = check_token(request, self.token)
         if response is not None:
@@ -225,7 +372,7 @@ class FakeGitlabAPI(object):
         return (201, headers, json.dumps(response))
 
     def _verify_runner_callback(self, request):
-        payload, response = check_token(request, list(self._runners.keys()))
+        payload, response = check_token(request, self._runners)
         if response is not None:
             return response
 
@@ -234,7 +381,7 @@ class FakeGitlabAPI(object):
         return (200, headers, json.dumps(response))
 
     def _request_job_callback(self, request):
-        payload, response = check_token(request, list(self._runners.keys()))
+        payload, response = check_token(request, self._runners)
         if response is not None:
             return response
         runner = self._runners[payload["token"]]
@@ -245,10 +392,10 @@ class FakeGitlabAPI(object):
                 return response
             runner.update(**response)
 
-        if len(self.pending_jobs) == 0:
+        if not self._pending_jobs:
             return (204, {}, json.dumps({}))
 
-        job = Job(self.next_job_id, self.pending_jobs.pop(0), self, runner)
+        job = Job(self.next_job_id, self._pending_jobs.popleft(), self, runner)
 
         headers = {}
         response = job.as_dict()
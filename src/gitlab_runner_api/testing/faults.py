@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["FaultInjector"]
+
+from collections import Counter
+import json
+import numbers
+import random
+import threading
+
+
+class FaultInjector(object):
+    """Make the fake API misbehave in a reproducible way.
+
+    Each probability is checked independently for every request using a
+    random number generator seeded with ``seed``, so the same sequence of
+    requests always sees the same faults.
+
+    Parameters
+    ----------
+    seed : :obj:`int`, optional
+        Seed for the random number generator
+    latency : :obj:`float` or callable, optional
+        Seconds to wait before responding to each request. If callable it is
+        called with the :py:class:`random.Random` instance and must return
+        the latency, e.g. ``lambda rng: rng.expovariate(100)``
+    error_rate : :obj:`float`, optional
+        Probability of responding to any request with an error
+    error_codes : :obj:`list` of :obj:`int`, optional
+        Status codes to choose from when responding with an error
+    retry_after : :obj:`int`, optional
+        Value of the ``Retry-After`` header of error responses, or None to
+        omit it
+    conflict_rate : :obj:`float`, optional
+        Probability of responding to ``jobs/request`` with ``409 Conflict``
+    range_error_rate : :obj:`float`, optional
+        Probability of rejecting a trace patch with ``416 Range Not Satisfiable``
+    cancel_rate : :obj:`float`, optional
+        Probability of cancelling a running job when a request is made for it
+    """
+
+    def __init__(
+        self,
+        seed=None,
+        latency=None,
+        error_rate=0,
+        error_codes=(500, 502, 503, 429),
+        retry_after=1,
+        conflict_rate=0,
+        range_error_rate=0,
+        cancel_rate=0,
+    ):
+        self.seed = seed
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.retry_after = retry_after
+        self.conflict_rate = conflict_rate
+        self.range_error_rate = range_error_rate
+        self.cancel_rate = cancel_rate
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reseed the random number generator and clear the injected counts"""
+        with self._lock:
+            self._random = random.Random(self.seed)
+            # Number of times each kind of fault has been injected
+            self.injected = Counter()
+
+    def delay(self):
+        """Get the number of seconds to wait before the next response
+
+        Returns
+        -------
+        :obj:`float`
+        """
+        if self.latency is None:
+            return 0
+        with self._lock:
+            if isinstance(self.latency, numbers.Number):
+                delay = self.latency
+            else:
+                delay = self.latency(self._random)
+            if delay > 0:
+                self.injected["latency"] += 1
+        return max(delay, 0)
+
+    def _happens(self, kind, probability):
+        # Avoid consuming random numbers for disabled faults so enabling one
+        # kind of fault doesn't change when the others occur
+        if probability <= 0:
+            return False
+        if self._random.random() >= probability:
+            return False
+        self.injected[kind] += 1
+        return True
+
+    def apply(self, endpoint, job=None):
+        """Decide whether the next request should fail.
+
+        Parameters
+        ----------
+        endpoint : :obj:`str`
+            Name of the API endpoint, such as ``jobs/:id/trace``
+        job : :py:class:`gitlab_runner_api.testing.job.Job`, optional
+            The job the request is for, if any
+
+        Returns
+        -------
+        :obj:`tuple` or None
+            The response to send instead of calling the normal callback
+        """
+        with self._lock:
+            if self._happens("error", self.error_rate):
+                status_code = self._random.choice(self.error_codes)
+                headers = {}
+                if self.retry_after is not None:
+                    headers["Retry-After"] = str(self.retry_after)
+                message = {"message": str(status_code) + " Injected fault"}
+                return (status_code, headers, json.dumps(message))
+
+            if endpoint == "jobs/request" and self._happens(
+                "conflict", self.conflict_rate
+            ):
+                return (409, {}, json.dumps({"message": "409 Conflict"}))
+
+            if job is not None and job.status == "running":
+                if self._happens("cancel", self.cancel_rate):
+                    job.status = "canceled"
+
+            if (
+                endpoint == "jobs/:id/trace"
+                and job is not None
+                and self._happens("range_error", self.range_error_rate)
+            ):
+                headers = {"Range": "0-" + str(job.log_size)}
+                return (416, headers, json.dumps({"error": "Range Not Satisfiable"}))
+
+        return None
@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["serve_http2"]
+
+import threading
+import time
+
+import six
+
+from .server import _Request
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:
+    h2 = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Connection(object):
+    """Serve the requests of one HTTP/2 connection, each in its own thread"""
+
+    def __init__(self, handler):
+        self._handler = handler
+        self._fake_server = handler.server.fake_server
+        config = h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        self._conn = h2.connection.H2Connection(config=config)
+        # Guards the connection state, notified when flow control windows open
+        self._condition = threading.Condition()
+        self._streams = {}
+        self._closed = False
+
+    def _flush(self):
+        data = self._conn.data_to_send()
+        if data:
+            self._handler.wfile.write(data)
+            self._handler.wfile.flush()
+
+    def serve(self, data):
+        with self._condition:
+            self._conn.initiate_connection()
+            self._flush()
+        try:
+            while data:
+                with self._condition:
+                    for event in self._conn.receive_data(data):
+                        self._handle_event(event)
+                    self._flush()
+                    self._condition.notify_all()
+                data = self._handler.rfile.read1(CHUNK_SIZE)
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+
+    def _handle_event(self, event):
+        if isinstance(event, h2.events.RequestReceived):
+            self._streams[event.stream_id] = (dict(event.headers), [])
+        elif isinstance(event, h2.events.DataReceived):
+            self._streams[event.stream_id][1].append(event.data)
+            self._conn.acknowledge_received_data(
+                event.flow_controlled_length, event.stream_id
+            )
+        elif isinstance(event, h2.events.StreamEnded):
+            headers, body = self._streams.pop(event.stream_id)
+            thread = threading.Thread(
+                target=self._respond, args=(event.stream_id, headers, b"".join(body))
+            )
+            thread.daemon = True
+            thread.start()
+        elif isinstance(event, h2.events.StreamReset):
+            self._streams.pop(event.stream_id, None)
+
+    def _respond(self, stream_id, headers, body):
+        if self._fake_server.delay is not None:
+            time.sleep(self._fake_server.delay())
+        path = headers.pop(":path")
+        method = headers.pop(":method")
+        headers = {k: v for k, v in headers.items() if not k.startswith(":")}
+        request = _Request(
+            method, self._fake_server.url + path, path, headers, body or None
+        )
+        status, response_headers, content = self._fake_server.dispatch(request)
+
+        if isinstance(content, six.text_type):
+            content = content.encode("utf-8")
+        if hasattr(content, "read"):
+            with content:
+                content = content.read()
+        if status in [204, 304]:
+            content = b""
+        # HTTP/2 header names must be lower case
+        response_headers = {k.lower(): v for k, v in response_headers.items()}
+        response_headers.setdefault("content-type", "text/plain")
+        response_headers["content-length"] = str(len(content))
+
+        with self._condition:
+            if self._closed:
+                return
+            self._conn.send_headers(
+                stream_id,
+                [(":status", str(status))] + list(response_headers.items()),
+                end_stream=not content,
+            )
+            self._flush()
+        while content:
+            with self._condition:
+                window = self._wait_for_window(stream_id)
+                if window is None:
+                    return
+                chunk, content = content[:window], content[window:]
+                self._conn.send_data(stream_id, chunk, end_stream=not content)
+                self._flush()
+
+    def _wait_for_window(self, stream_id):
+        """Wait until data can be sent on stream_id and return how much"""
+        while not self._closed:
+            window = min(
+                self._conn.local_flow_control_window(stream_id),
+                self._conn.max_outbound_frame_size,
+            )
+            if window > 0:
+                return window
+            self._condition.wait()
+        return None
+
+
+def serve_http2(handler):
+    """Serve a connection which started with the HTTP/2 preface.
+
+    Parameters
+    ----------
+    handler : :py:class:`BaseHTTPServer.BaseHTTPRequestHandler`
+        Handler which has already read the first line of the preface into
+        ``handler.raw_requestline``
+    """
+    if h2 is None:
+        raise ImportError("h2 is required to serve HTTP/2")
+    _Connection(handler).serve(handler.raw_requestline)
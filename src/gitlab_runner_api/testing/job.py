@@ -4,24 +4,34 @@ from __future__ import print_function
 
 import hashlib
 import json
+import os
 import re
 import string
+import tempfile
+import time
 
-from .utils import check_token, random_string, validate_runner_info
+import six
 
-API_ENDPOINT = "https://gitlab.cern.ch/api/v4"
+from .multipart import parse_multipart, UploadedFile
+from .utils import check_token, decode_body, random_string, validate_runner_info
 
 __all__ = ["Job"]
 
 
 class JobVariable:
-    def __init__(self, key, value, public=True):
+    def __init__(self, key, value, public=True, masked=False):
         self.key = key
         self.public = public
         self.value = value
+        self.masked = masked
 
     def as_dict(self):
-        return {"key": self.key, "public": self.public, "value": self.value}
+        return {
+            "key": self.key,
+            "public": self.public,
+            "value": self.value,
+            "masked": self.masked,
+        }
 
 
 class Job(object):
@@ -55,38 +65,23 @@ class Job(object):
             JobVariable("CI_JOB_NAME", "example_job"),
             JobVariable("CI_JOB_ID", "1234567"),
         ]
-        self.log = ""
+        # Additional variables, such as secrets, defined for this job
+        self._variables += [JobVariable(**v) for v in job_info.get("variables", [])]
+        # The trace is stored as a list of chunks which are only joined when
+        # it is read, with its size in bytes counted as they are appended
+        self._log_chunks = []
+        self._log_size = 0
         self._status = "running"
         self._failure_reason = None
-        self._file_data = None
+        # Artifacts are stored on disk and hashed when they are uploaded
+        self._artifact = None
         self._api = api
         self._runner = runner
+        # When the job was given to a runner
+        self.started_at = time.time()
 
-        if job_info in self._api._jobs:
-            self._api._jobs.pop(self._api._jobs.index(job_info))
-        self._api._jobs.append(self)
-
-        # Resister additional callbacks
-        import responses
-
-        # Update a job's status
-        self._api._rsps.add_callback(
-            responses.PUT,
-            API_ENDPOINT + "/jobs/" + self.id,
-            callback=self._update_job_callback,
-        )
-        # Append to the job's log
-        self._api._rsps.add_callback(
-            responses.PATCH,
-            API_ENDPOINT + "/jobs/" + self.id + "/trace",
-            callback=self._update_log_callback,
-        )
-        # Upload job artefacts
-        self._api._rsps.add_callback(
-            responses.POST,
-            API_ENDPOINT + "/jobs/" + self.id + "/artifacts",
-            callback=self._upload_artifacts_callback,
-        )
+        # Requests are routed to the job's callbacks by FakeGitlabAPI
+        self._api._running_jobs[self.id] = self
 
     def __repr__(self):
         return "gitlab_runner_api.testing.Job(id={id}, status={status})".format(
@@ -109,17 +104,41 @@ class Job(object):
     def status(self):
         return self._status
 
+    @property
+    def log(self):
+        if len(self._log_chunks) > 1:
+            self._log_chunks = ["".join(self._log_chunks)]
+        return self._log_chunks[0] if self._log_chunks else ""
+
+    @log.setter
+    def log(self, new_log):
+        self._log_chunks = [new_log] if new_log else []
+        self._log_size = len(new_log.encode("utf-8"))
+
+    @property
+    def log_size(self):
+        """Size of the trace in bytes"""
+        return self._log_size
+
     @property
     def file_data(self):
-        return self._file_data
+        """Contents of the artifacts archive, which is read from disk"""
+        if self._artifact is None:
+            return None
+        with open(self._artifact.path, "rb") as fp:
+            return fp.read()
+
+    @property
+    def file_size(self):
+        if self._artifact is None:
+            return None
+        return self._artifact.size
 
     @property
     def artifact_sha_hash(self):
-        if self.file_data is None:
+        if self._artifact is None:
             return None
-        hasher = hashlib.sha256()
-        hasher.update(self.file_data)
-        return hasher.hexdigest()
+        return self._artifact.sha256
 
     @status.setter
     def status(self, new_status):
@@ -131,6 +150,7 @@ class Job(object):
             "pending",
             "running",
             "manual",
+            "canceling",
             "canceled",
             "success",
             "skipped",
@@ -138,6 +158,14 @@ class Job(object):
         ]
 
         assert new_status in ordered_statuses, new_status
+        # Keep the API's indexes of running and completed jobs up to date
+        was_running = self._status == "running"
+        if was_running and new_status != "running":
+            del self._api._running_jobs[self.id]
+            self._api._completed_jobs[self.id] = self
+        elif not was_running and new_status == "running":
+            del self._api._completed_jobs[self.id]
+            self._api._running_jobs[self.id] = self
         self._status = new_status
 
     @property
@@ -154,6 +182,10 @@ class Job(object):
         self._failure_reason = new_failure_reason
 
     def _update_job_callback(self, request):
+        response = decode_body(request, self._api.supported_encodings)
+        if response is not None:
+            return response
+
         payload = json.loads(request.body)
         if (
             "failure_reason" in payload
@@ -175,10 +207,10 @@ class Job(object):
         if response is not None:
             return response
 
-        if self.status != "running":
+        if self.status not in ["running", "canceling"]:
             return (
                 403,
-                {},
+                {"Job-Status": self.status},
                 json.dumps({"message": "403 Forbidden  - Job is not running"}),
             )
 
@@ -190,14 +222,14 @@ class Job(object):
                 self.status = payload["state"]
                 if "failure_reason" in payload and payload["state"] == "failed":
                     self.failure_reason = payload["failure_reason"]
-                return (200, {}, json.dumps(True))
+                return (200, {"Job-Status": self.status}, json.dumps(True))
             else:
                 print(
                     "API ignores this but an invalid job state was received:",
                     payload["state"],
                 )
 
-        return (200, {}, json.dumps(None))
+        return (200, {"Job-Status": self.status}, json.dumps(None))
 
     def _update_log_callback(self, request):
         if (
@@ -206,68 +238,88 @@ class Job(object):
         ):
             return (403, {}, json.dumps({"message": "403 Forbidden"}))
 
-        if self.status != "running":
+        if self.status not in ["running", "canceling"]:
             return (
                 403,
-                {},
+                {"Job-Status": self.status},
                 json.dumps({"message": "403 Forbidden  - Job is not running"}),
             )
 
-        headers = {"Range": "0-" + str(len(self.log))}
+        response = decode_body(request, self._api.supported_encodings)
+        if response is not None:
+            return response
+
+        headers = {"Range": "0-" + str(self.log_size)}
 
         if "Content-Range" not in request.headers:
             return (400, headers, json.dumps({"error": "Missing header Content-Range"}))
         content_range = request.headers["Content-Range"].split("-")
 
+        # Offsets are in bytes, like GitLab
+        body = request.body or ""
+        if isinstance(body, six.text_type):
+            size = len(body.encode("utf-8"))
+        else:
+            size = len(body)
+            body = body.decode("utf-8")
+
         try:
             if len(content_range) != 2:
                 raise ValueError()
             content_start = int(content_range[0])
             content_length = int(content_range[1])
-            if content_start != len(self.log):
+            if content_start != self.log_size:
                 raise ValueError()
-            if content_length != len(request.body):
+            if content_length != size:
                 raise ValueError()
         except ValueError:
             return (416, headers, json.dumps({"error": "Range Not Satisfiable"}))
 
-        self.log += request.body
+        if body:
+            self._log_chunks.append(body)
+            self._log_size += size
 
-        headers["Range"] = "0-" + str(len(self.log))
+        headers["Range"] = "0-" + str(self.log_size)
         headers["Job-Status"] = self.status
 
         return (202, headers, headers["Range"])
 
     def upload_artifacts(self, filename, data):
+        """Store the job's artifacts.
+
+        Parameters
+        ----------
+        filename : :obj:`str`
+            Name of the uploaded file
+        data : :obj:`bytes` or `UploadedFile`
+            Contents of the archive or the file it has already been written to
+        """
+        if not isinstance(data, UploadedFile):
+            fd, path = tempfile.mkstemp(dir=self._api._artifacts_dir)
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            data = UploadedFile(
+                filename, path, len(data), hashlib.sha256(data).hexdigest()
+            )
         self._filename = filename
-        self._file_data = data
-
-        # Register callback for downloading
-        import responses
-
-        self._api._rsps.add_callback(
-            responses.GET,
-            API_ENDPOINT + "/jobs/" + self.id + "/artifacts",
-            callback=self._download_artifacts_callback,
-        )
-
-    def _upload_artifacts_callback(self, request):
-        # TODO We should authorise the artifacts first
+        self._artifact = data
 
+    def _check_upload(self, request):
+        """Get the error response for an artifacts upload, if any"""
         if (
             "JOB-TOKEN" not in request.headers
             or request.headers["JOB-TOKEN"] != self.token
         ):
             return (403, {}, json.dumps({"message": "403 Forbidden"}))
 
-        if self.status != "running":
+        if self.status not in ["running", "canceling"]:
             return (
                 403,
-                {},
+                {"Job-Status": self.status},
                 json.dumps({"message": "403 Forbidden  - Job is not running"}),
             )
 
-        if self.file_data is not None:
+        if self._artifact is not None:
             return (
                 400,
                 {},
@@ -275,40 +327,47 @@ class Job(object):
                     {"message": '400 (Bad request) "Already uploaded" not given'}
                 ),
             )
+        return None
 
-        from requests_toolbelt.multipart import decoder
+    def _upload_artifacts_callback(self, request):
+        # TODO We should authorise the artifacts first
 
-        payload = {}
-        for part in decoder.MultipartDecoder(
-            request.body, request.headers["Content-Type"]
-        ).parts:
-            header = (
-                part.headers[b"Content-Disposition"].decode(part.encoding).split("; ")
-            )
-            assert header[0] == "form-data"
-            header = {h.split("=")[0]: h.split("=")[1][1:-1] for h in header[1:]}
+        # Called without the API's lock so other requests can be handled
+        # while the body is received
+        with self._api._lock:
+            response = self._check_upload(request)
+        if response is not None:
+            return response
 
-            assert header["name"] not in payload
-            if header["name"] == "file":
-                assert len(header) == 2
-                payload[header["name"]] = (header["filename"], part.content)
-            else:
-                assert len(header) == 1
-                payload[header["name"]] = part.text
-        file_name, file_data = payload["file"]
+        # The body is streamed to disk so large artifacts aren't held in memory
+        payload = parse_multipart(
+            request.body,
+            request.headers["Content-Type"],
+            directory=self._api._artifacts_dir,
+        )
+        uploaded = payload["file"]
+        assert isinstance(uploaded, UploadedFile)
 
         if "artifact_type" in payload or "artifact_format" in payload:
+            os.remove(uploaded.path)
             raise NotImplementedError("Not sure what this does")
 
         if "expire_in" in payload:
             pass
 
-        # TODO I think this should update the job's underlying job_info object
-        # https://gitlab.com/gitlab-org/gitlab-ce/blob/78b3eea7d248c6d3c48b615c9df24a95cb5fd1d8/lib/api/runner.rb#L292
-        self.upload_artifacts(file_name, file_data)
+        with self._api._lock:
+            # The job may have changed while the body was being received
+            response = self._check_upload(request)
+            if response is not None:
+                os.remove(uploaded.path)
+                return response
+
+            # TODO I think this should update the job's underlying job_info object
+            # https://gitlab.com/gitlab-org/gitlab-ce/blob/78b3eea7d248c6d3c48b615c9df24a95cb5fd1d8/lib/api/runner.rb#L292
+            self.upload_artifacts(uploaded.filename, uploaded)
 
-        headers = {}
-        response = self.as_dict()
+            headers = {}
+            response = self.as_dict()
         return (201, headers, json.dumps(response))
 
     def _download_artifacts_callback(self, request):
@@ -329,8 +388,28 @@ class Job(object):
         if recieved_token != self.token:
             return (403, {}, json.dumps({"message": "403 Forbidden"}))
 
+        if self._artifact is None:
+            return (404, {}, json.dumps({"message": "404 Not Found"}))
+
+        # Responses are streamed from the file on disk
+        range_match = re.match(r"bytes=(\d+)-$", request.headers.get("Range", ""))
+        if range_match:
+            start = int(range_match.groups()[0])
+            size = self._artifact.size
+            if start >= size:
+                headers = {"Content-Range": "bytes */" + str(size)}
+                return (416, headers, json.dumps({"error": "Range Not Satisfiable"}))
+            headers = {"Content-Range": "bytes %d-%d/%d" % (start, size - 1, size)}
+            fp = open(self._artifact.path, "rb")
+            fp.seek(start)
+            return (206, headers, fp)
+
         headers = {}
-        return (200, headers, self.file_data)
+        return (200, headers, open(self._artifact.path, "rb"))
+
+    def as_dependency(self):
+        """Reference to this job in the format used by dependant jobs"""
+        return {"id": int(self.id), "name": self.job_info["name"], "token": self.token}
 
     def as_dict(self):
         return {
@@ -345,19 +424,25 @@ class Job(object):
                     "expire_in": None,
                 }
             ],
-            "cache": [None],
-            "credentials": [
-                {
-                    "password": self.token,
-                    "type": "registry",
-                    "url": "gitlab-registry.cern.ch",
-                    "username": "gitlab-ci-token",
-                }
-            ],
-            "dependencies": [
-                # {"id": some_job_id, "name": "some_job_name", "token": "some_job_token"},
-                # {"id": some_job_id, "name": "some_job_name", "token": "some_job_token"},
-            ],
+            "cache": self.job_info.get("cache", [None]),
+            "credentials": self.job_info.get(
+                "credentials",
+                [
+                    {
+                        "password": self.token,
+                        "type": "registry",
+                        "url": "gitlab-registry.cern.ch",
+                        "username": "gitlab-ci-token",
+                    }
+                ],
+            ),
+            "dependencies": self.job_info.get(
+                "dependencies",
+                [
+                    # {"id": some_job_id, "name": "some_job_name", "token": "some_job_token"},
+                    # {"id": some_job_id, "name": "some_job_name", "token": "some_job_token"},
+                ],
+            ),
             "features": {"trace_sections": True},
             "git_info": {
                 "before_sha": "0000000000000000000000000000000000000000",
@@ -379,15 +464,18 @@ class Job(object):
             },
             "runner_info": {"runner_session_url": None, "timeout": 3600},
             "services": [],
-            "steps": [
-                {
-                    "allow_failure": False,
-                    "name": "script",
-                    "script": ["pwd", "ls", "env"],
-                    "timeout": 3600,
-                    "when": "on_success",
-                }
-            ],
+            "steps": self.job_info.get(
+                "steps",
+                [
+                    {
+                        "allow_failure": False,
+                        "name": "script",
+                        "script": ["pwd", "ls", "env"],
+                        "timeout": 3600,
+                        "when": "on_success",
+                    }
+                ],
+            ),
             "token": self.token,
             "variables": [v.as_dict() for v in self._variables],
         }
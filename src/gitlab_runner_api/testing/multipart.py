@@ -0,0 +1,150 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["UploadedFile", "parse_multipart"]
+
+from collections import namedtuple
+import hashlib
+from io import BytesIO
+import os
+import re
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+# A file from a multipart/form-data body which has been written to disk
+UploadedFile = namedtuple("UploadedFile", ["filename", "path", "size", "sha256"])
+
+
+class _HashingWriter(object):
+    """Write to a file while counting and hashing the data"""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        self._fp.write(data)
+
+
+class _Buffer(object):
+    """Buffered reader for finding delimiters in a stream"""
+
+    def __init__(self, stream, chunk_size):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._data = b""
+
+    def _fill(self):
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            raise ValueError("Unexpected end of multipart body")
+        self._data += chunk
+
+    def read(self, size):
+        while len(self._data) < size:
+            self._fill()
+        data, self._data = self._data[:size], self._data[size:]
+        return data
+
+    def read_until(self, delimiter):
+        """Read and return everything before delimiter, consuming both"""
+        chunks = []
+        self.copy_until(delimiter, chunks.append)
+        return b"".join(chunks)
+
+    def copy_until(self, delimiter, write):
+        """Pass everything before delimiter to write, consuming both.
+
+        At most one chunk of the stream is held in memory at a time.
+        """
+        while True:
+            index = self._data.find(delimiter)
+            if index >= 0:
+                write(self._data[:index])
+                self._data = self._data[index + len(delimiter) :]
+                return
+            # Keep enough to find a delimiter which spans two chunks
+            keep = len(delimiter) - 1
+            if len(self._data) > keep:
+                write(self._data[: len(self._data) - keep])
+                self._data = self._data[len(self._data) - keep :]
+            self._fill()
+
+
+def _parse_disposition(headers):
+    """Get the name and filename from the headers of a part"""
+    for line in headers.decode("utf-8").split("\r\n"):
+        key, _, value = line.partition(":")
+        if key.strip().lower() == "content-disposition":
+            params = dict(re.findall(r';\s*(\w+)="([^"]*)"', value))
+            if "name" not in params:
+                raise ValueError("Part is missing a name")
+            return params["name"], params.get("filename")
+    raise ValueError("Part is missing Content-Disposition")
+
+
+def parse_multipart(body, content_type, directory=None, chunk_size=CHUNK_SIZE):
+    """Parse a multipart/form-data body without holding files in memory.
+
+    Files are written to temporary files and hashed as they are read.
+
+    Parameters
+    ----------
+    body : :obj:`bytes` or file-like
+        Body of the request
+    content_type : :obj:`str`
+        Value of the request's Content-Type header
+    directory : :obj:`str`, optional
+        Directory to write files to
+    chunk_size : :obj:`int`, optional
+        Number of bytes to read from body at a time
+
+    Returns
+    -------
+    :obj:`dict`
+        Maps the name of each part to its value as :obj:`str`, or to an
+        `UploadedFile` for files
+    """
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if match is None:
+        raise ValueError("Content-Type has no boundary: " + content_type)
+    delimiter = b"--" + match.group(1).encode("utf-8")
+
+    if isinstance(body, bytes):
+        body = BytesIO(body)
+    buffer = _Buffer(body, chunk_size)
+
+    # Skip the preamble
+    buffer.read_until(delimiter)
+    parts = {}
+    while True:
+        ending = buffer.read(2)
+        if ending == b"--":
+            return parts
+        if ending != b"\r\n":
+            raise ValueError("Invalid multipart delimiter")
+
+        name, filename = _parse_disposition(buffer.read_until(b"\r\n\r\n"))
+        if name in parts:
+            raise ValueError("Duplicate part " + name)
+        if filename is None:
+            parts[name] = buffer.read_until(b"\r\n" + delimiter).decode("utf-8")
+            continue
+
+        fd, path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                writer = _HashingWriter(fp)
+                buffer.copy_until(b"\r\n" + delimiter, writer.write)
+        except Exception:
+            os.remove(path)
+            raise
+        parts[name] = UploadedFile(
+            filename, path, writer.size, writer.hasher.hexdigest()
+        )
@@ -0,0 +1,227 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["FakeGitlabServer"]
+
+import os
+import re
+import shutil
+import threading
+import time
+from traceback import format_exc
+
+from requests.structures import CaseInsensitiveDict
+import six
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse
+
+_pattern_type = type(re.compile(""))
+# First line sent by HTTP/2 clients which use prior knowledge
+_HTTP2_PREFACE = b"PRI * HTTP/2.0\r\n"
+
+
+class _Request(object):
+    """The parts of `requests.PreparedRequest` which are used by the callbacks"""
+
+    def __init__(self, method, url, path_url, headers, body):
+        self.method = method
+        self.path_url = path_url
+        self.url = url
+        self.headers = CaseInsensitiveDict(headers)
+        content_type = self.headers.get("Content-Type", "")
+        if isinstance(body, bytes) and not (
+            "Content-Encoding" in self.headers or content_type.startswith("multipart/")
+        ):
+            try:
+                body = body.decode("utf-8")
+            except UnicodeDecodeError:
+                pass
+        self.body = body
+
+
+class _BodyReader(object):
+    """Read at most length bytes of a request body from a stream"""
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(size) if size else b""
+        self._remaining -= len(data)
+        return data
+
+    def drain(self):
+        """Discard anything which wasn't read so the connection can be reused"""
+        while self.read(64 * 1024):
+            pass
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    # Allow many clients to connect at once when load testing
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can reuse connections
+    protocol_version = "HTTP/1.1"
+    # The headers and body are written separately so avoid waiting for the
+    # client to acknowledge the first before sending the second
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.fake_server._lock:
+            self.server.fake_server.connections += 1
+
+    def parse_request(self):
+        if self.raw_requestline != _HTTP2_PREFACE:
+            return BaseHTTPServer.BaseHTTPRequestHandler.parse_request(self)
+        from .http2 import serve_http2
+
+        self.close_connection = True
+        serve_http2(self)
+        return False
+
+    def _handle(self):
+        if self.server.fake_server.delay is not None:
+            time.sleep(self.server.fake_server.delay())
+        length = int(self.headers.get("Content-Length") or 0)
+        if self.headers.get("Content-Type", "").startswith("multipart/"):
+            # Uploads are passed to the callback as a stream
+            body = _BodyReader(self.rfile, length)
+        else:
+            body = self.rfile.read(length) if length else None
+        request = _Request(
+            self.command,
+            self.server.fake_server.url + self.path,
+            self.path,
+            dict(self.headers.items()),
+            body,
+        )
+        status, headers, content = self.server.fake_server.dispatch(request)
+        if isinstance(body, _BodyReader):
+            body.drain()
+
+        if isinstance(content, six.text_type):
+            content = content.encode("utf-8")
+        if status in [204, 304]:
+            # These responses must not have a body
+            content = b""
+        if hasattr(content, "read"):
+            # Stream files from disk
+            length = os.fstat(content.fileno()).st_size - content.tell()
+        else:
+            length = len(content)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if "Content-Type" not in headers:
+            self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+        if hasattr(content, "read"):
+            with content:
+                shutil.copyfileobj(content, self.wfile, 64 * 1024)
+        else:
+            self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+
+class _Router(object):
+    """Route requests to callbacks without going through `responses`.
+
+    Callbacks are registered in the same way as with
+    `responses.RequestsMock.add_callback` but are routed by their path, so
+    the same callbacks can be used with either. URLs may also be compiled
+    regular expressions, which are matched against the full URL of requests
+    that have no exact route. Callbacks may be called concurrently and are
+    responsible for locking any state which they share.
+    """
+
+    def __init__(self, delay=None):
+        self.delay = delay
+        self._callbacks = {}
+        self._patterns = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, method, url, callback, **kwargs):
+        with self._lock:
+            if isinstance(url, _pattern_type):
+                self._patterns.append((method, url, callback))
+            else:
+                self._callbacks[(method, urlparse(url).path)] = callback
+
+    def dispatch(self, request):
+        """Call the callback for request and return its response"""
+        path = urlparse(request.path_url).path
+        with self._lock:
+            callback = self._callbacks.get((request.method, path))
+            if callback is None:
+                for method, pattern, pattern_callback in self._patterns:
+                    if method == request.method and pattern.match(request.url):
+                        callback = pattern_callback
+                        break
+                else:
+                    return (404, {}, '{"message": "404 Not Found"}')
+        try:
+            return callback(request)
+        except Exception:
+            return (500, {}, format_exc())
+
+
+class FakeGitlabServer(_Router):
+    """Serve the fake API's callbacks over HTTP on localhost.
+
+    Callbacks are routed as described in `_Router` and are called from the
+    server's threads. Clients which connect using HTTP/2 with prior knowledge
+    are also served if the ``h2`` package is available.
+
+    Parameters
+    ----------
+    host : :obj:`str`, optional
+        Address to listen on
+    port : :obj:`int`, optional
+        Port to listen on, defaults to a free port
+    delay : callable, optional
+        Returns the number of seconds to wait before handling each request,
+        requests are delayed concurrently
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=None):
+        super(FakeGitlabServer, self).__init__(delay)
+        # Number of connections which have been accepted
+        self.connections = 0
+        self._address = (host, port)
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the running server"""
+        host, port = self._server.server_address[:2]
+        return "http://" + host + ":" + str(port)
+
+    def __enter__(self):
+        self._server = _ThreadingHTTPServer(self._address, _Handler)
+        self._server.fake_server = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-gitlab-server"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
@@ -0,0 +1,96 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["InProcessTransport"]
+
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import six
+
+from ..transport import get_transport, set_transport, Transport
+from .server import _Request, _Router
+
+
+class _FileStream(object):
+    """Close files which were streamed as responses once they are released"""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self.read = fp.read
+
+    def close(self):
+        self._fp.close()
+
+    release_conn = close
+
+
+class InProcessTransport(_Router, Transport):
+    """Call the fake API's callbacks directly instead of making HTTP requests.
+
+    Requests are prepared with `requests` so their bodies are encoded as
+    they would be when sent, but no connection is made and nothing is
+    parsed on the way back. Entering the context makes this the current
+    transport.
+
+    Parameters
+    ----------
+    delay : callable, optional
+        Returns the number of seconds to wait before handling each request,
+        requests are delayed concurrently
+    """
+
+    def __init__(self, delay=None):
+        super(InProcessTransport, self).__init__(delay)
+        self._previous = None
+
+    def request(self, method, url, **kwargs):
+        if self.delay is not None:
+            time.sleep(self.delay())
+        prepared = requests.Request(
+            method,
+            url,
+            headers=kwargs.get("headers"),
+            params=kwargs.get("params"),
+            data=kwargs.get("data"),
+            json=kwargs.get("json"),
+        ).prepare()
+        status, headers, content = self.dispatch(
+            _Request(
+                prepared.method,
+                prepared.url,
+                prepared.path_url,
+                dict(prepared.headers),
+                prepared.body,
+            )
+        )
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = prepared.url
+        response.request = prepared
+        if isinstance(content, six.text_type):
+            content = content.encode("utf-8")
+        if hasattr(content, "read") and kwargs.get("stream"):
+            response.raw = _FileStream(content)
+            return response
+        if hasattr(content, "read"):
+            with content:
+                content = content.read()
+        response._content = content
+        response._content_consumed = True
+        return response
+
+    def __enter__(self):
+        self._previous = get_transport()
+        set_transport(self)
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        set_transport(self._previous)
+        self._previous = None
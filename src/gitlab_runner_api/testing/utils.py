@@ -4,26 +4,66 @@ from __future__ import print_function
 
 import json
 import random
+import shutil
 import six
 import tempfile
+import zlib
+
+from ..utils.compression import decompress
 
 
 def random_string(characters, length):
     return "".join([random.choice(characters).lower() for i in range(length)])
 
 
+def decode_body(request, supported_encodings):
+    """Decompress the body of request in place according to its Content-Encoding
+
+    Returns
+    -------
+    :obj:`tuple` or None
+        Error response if the body could not be decoded
+    """
+    encoding = request.headers.get("Content-Encoding")
+    if encoding is None:
+        return None
+    if encoding not in supported_encodings:
+        return (
+            415,
+            {},
+            json.dumps({"error": "Unsupported Content-Encoding " + encoding}),
+        )
+    try:
+        request.body = decompress(request.body, encoding).decode("utf-8")
+    except (zlib.error, UnicodeDecodeError):
+        return (400, {}, json.dumps({"error": "Failed to decode request body"}))
+    del request.headers["Content-Encoding"]
+    return None
+
+
 def check_token(request, valid_tokens):
-    if not isinstance(valid_tokens, list):
-        valid_tokens = [valid_tokens]
+    """Check the token in the JSON body of request
+
+    Parameters
+    ----------
+    request : :obj:`requests.PreparedRequest`
+    valid_tokens : :obj:`str` or container
+        A single token or a set/mapping of tokens which are accepted
+
+    Returns
+    -------
+    :obj:`tuple`
+        The decoded payload and the error response, or None if the token is valid
+    """
+    if isinstance(valid_tokens, six.string_types):
+        valid_tokens = {valid_tokens}
     payload = json.loads(request.body)
 
     if "token" not in payload:
         return payload, (400, {}, json.dumps({"error": "token is missing"}))
 
-    for valid_token in valid_tokens:
-        if payload["token"] == valid_token:
-            break
-    else:
+    token = payload["token"]
+    if not isinstance(token, six.string_types) or token not in valid_tokens:
         return payload, (403, {}, json.dumps({"message": "403 Forbidden"}))
 
     return payload, None
@@ -87,6 +127,18 @@ def run_test_with_artifact(func):
     return new_func
 
 
+def run_test_with_tmpdir(func):
+    def new_func(*args, **kwargs):
+        assert "tmpdir" not in kwargs
+        tmpdir = tempfile.mkdtemp()
+        try:
+            return func(*args, tmpdir=tmpdir, **kwargs)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    return new_func
+
+
 def validate_runner_info(runner_info):
     if not isinstance(runner_info, dict):
         return (400, {}, json.dumps({"error": "info is invalid"}))
@@ -0,0 +1,232 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["Workload"]
+
+import numbers
+import random
+import string
+import threading
+import time
+
+
+def _sample(value, rng):
+    """Get a value which is either fixed or drawn from a distribution"""
+    if isinstance(value, numbers.Number):
+        return value
+    return value(rng)
+
+
+def _random_string(rng, length):
+    characters = string.ascii_letters + string.digits
+    return "".join([rng.choice(characters) for _ in range(length)])
+
+
+class Workload(object):
+    """Enqueue jobs in a `FakeGitlabAPI` over time.
+
+    Sizes can be fixed numbers or callables which are passed the seeded
+    :py:class:`random.Random` instance and return a value for each job, e.g.
+    ``lambda rng: int(rng.lognormvariate(3, 1))``.
+
+    Parameters
+    ----------
+    rate : :obj:`float`, optional
+        Mean number of jobs enqueued per second, None to enqueue all of the
+        jobs at once
+    n_jobs : :obj:`int`, optional
+        Number of jobs to enqueue, None to continue until `stop` is called
+    poisson : :obj:`bool`, optional
+        Enqueue jobs as a Poisson process instead of at regular intervals
+    seed : :obj:`int`, optional
+        Seed for the random number generator
+    n_variables : :obj:`int` or callable, optional
+        Number of additional variables for each job
+    variable_size : :obj:`int` or callable, optional
+        Length of each variable's value
+    n_steps : :obj:`int` or callable, optional
+        Number of steps in each job
+    n_script_lines : :obj:`int` or callable, optional
+        Number of lines in each step's script
+    n_dependencies : :obj:`int` or callable, optional
+        Number of previously completed jobs each job depends on
+    n_credentials : :obj:`int` or callable, optional
+        Number of registry credentials given to each job
+    log_size : :obj:`int` or callable, optional
+        Number of characters each job is expected to write to its log, given
+        to the job as the ``WORKLOAD_LOG_SIZE`` variable
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        n_jobs=None,
+        poisson=True,
+        seed=None,
+        n_variables=50,
+        variable_size=40,
+        n_steps=1,
+        n_script_lines=10,
+        n_dependencies=0,
+        n_credentials=1,
+        log_size=10 * 1024,
+    ):
+        if rate is None and n_jobs is None:
+            raise ValueError("n_jobs must be given if rate is None")
+        self.rate = rate
+        self.n_jobs = n_jobs
+        self.poisson = poisson
+        self.seed = seed
+        self.n_variables = n_variables
+        self.variable_size = variable_size
+        self.n_steps = n_steps
+        self.n_script_lines = n_script_lines
+        self.n_dependencies = n_dependencies
+        self.n_credentials = n_credentials
+        self.log_size = log_size
+
+        self._random = random.Random(seed)
+        self._stop = threading.Event()
+        self._thread = None
+        self.n_enqueued = 0
+
+    def job_info(self, api):
+        """Generate the description of the next job.
+
+        Parameters
+        ----------
+        api : :py:class:`FakeGitlabAPI <gitlab_runner_api.testing.FakeGitlabAPI>`
+            API to take dependencies from
+
+        Returns
+        -------
+        :obj:`dict`
+        """
+        rng = self._random
+        i = self.n_enqueued
+
+        log_size = int(_sample(self.log_size, rng))
+        variables = [
+            {"key": "WORKLOAD_LOG_SIZE", "value": str(log_size), "public": True}
+        ]
+        for j in range(int(_sample(self.n_variables, rng))):
+            variables.append(
+                {
+                    "key": "WORKLOAD_VAR_" + str(j),
+                    "value": _random_string(
+                        rng, int(_sample(self.variable_size, rng))
+                    ),
+                    "public": rng.random() < 0.8,
+                }
+            )
+
+        steps = []
+        for j in range(int(_sample(self.n_steps, rng))):
+            steps.append(
+                {
+                    "allow_failure": False,
+                    "name": "script" if j == 0 else "step_" + str(j),
+                    "script": [
+                        "echo " + _random_string(rng, 40)
+                        for _ in range(int(_sample(self.n_script_lines, rng)))
+                    ],
+                    "timeout": 3600,
+                    "when": "on_success",
+                }
+            )
+
+        credentials = [
+            {
+                "password": _random_string(rng, 20),
+                "type": "registry",
+                "url": "registry-" + str(j) + ".example.com",
+                "username": "gitlab-ci-token",
+            }
+            for j in range(int(_sample(self.n_credentials, rng)))
+        ]
+
+        # Depend on the most recently completed jobs with artifacts
+        n_dependencies = int(_sample(self.n_dependencies, rng))
+        dependencies = []
+        if n_dependencies:
+            candidates = [j for j in api.completed_jobs if j.file_size is not None]
+            dependencies = [j.as_dependency() for j in candidates[-n_dependencies:]]
+
+        return {
+            "name": "WorkloadJob" + str(i),
+            "variables": variables,
+            "steps": steps,
+            "credentials": credentials,
+            "dependencies": dependencies,
+            "log_size": log_size,
+            "queued_at": time.time(),
+        }
+
+    def _interval(self):
+        if self.poisson:
+            return self._random.expovariate(self.rate)
+        return 1 / self.rate
+
+    def _finished(self):
+        return self.n_jobs is not None and self.n_enqueued >= self.n_jobs
+
+    def _enqueue(self, api):
+        api.add_pending_job(self.job_info(api))
+        self.n_enqueued += 1
+
+    def run(self, api):
+        """Enqueue jobs in api until finished or `stop` is called.
+
+        Parameters
+        ----------
+        api : :py:class:`FakeGitlabAPI <gitlab_runner_api.testing.FakeGitlabAPI>`
+        """
+        if self.rate is None:
+            while not self._finished():
+                self._enqueue(api)
+            return
+
+        next_time = time.time()
+        while not self._finished():
+            next_time += self._interval()
+            if self._stop.wait(max(next_time - time.time(), 0)):
+                break
+            self._enqueue(api)
+
+    def start(self, api):
+        """Enqueue jobs in api from a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, args=(api,), name="fake-gitlab-workload"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop enqueuing jobs and wait for the background thread to exit"""
+        self._stop.set()
+        self.join()
+
+    def join(self, timeout=None):
+        """Wait for all of the jobs to be enqueued"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @staticmethod
+    def pickup_latencies(api):
+        """Time in seconds between each job being enqueued and requested.
+
+        Parameters
+        ----------
+        api : :py:class:`FakeGitlabAPI <gitlab_runner_api.testing.FakeGitlabAPI>`
+
+        Returns
+        -------
+        :obj:`list` of :obj:`float`
+        """
+        return [
+            job.started_at - job.job_info["queued_at"]
+            for job in api.running_jobs + api.completed_jobs
+            if "queued_at" in job.job_info
+        ]
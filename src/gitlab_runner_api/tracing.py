@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["NoOpSpan", "get_tracer", "set_tracer", "span", "start_span", "traced"]
+
+from contextlib import contextmanager
+import functools
+
+
+class NoOpSpan(object):
+    """Span which records nothing, used when tracing is disabled"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def record_exception(self, exception, attributes=None):
+        pass
+
+    def set_status(self, status, description=None):
+        pass
+
+    def end(self, end_time=None):
+        pass
+
+    def is_recording(self):
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        pass
+
+
+NOOP_SPAN = NoOpSpan()
+
+_tracer = None
+
+
+def set_tracer(tracer):
+    """Record spans for the phases of each job using tracer.
+
+    The tracer must implement the ``start_span`` and ``start_as_current_span``
+    methods of an OpenTelemetry ``Tracer``, for example the result of
+    ``opentelemetry.trace.get_tracer("gitlab_runner_api")``. Spans for each
+    phase of a job are children of a span covering the whole job. To link them
+    with tracers which are not from OpenTelemetry, the tracer can define a
+    ``context_for(span)`` method which returns the context to use as the
+    parent.
+
+    Parameters
+    ----------
+    tracer : OpenTelemetry compatible ``Tracer`` or None
+        Tracer to use, or None to disable tracing
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    """The tracer passed to `set_tracer` or None if tracing is disabled"""
+    return _tracer
+
+
+def _context_for(span):
+    if hasattr(_tracer, "context_for"):
+        return _tracer.context_for(span)
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        return None
+    return trace.set_span_in_context(span)
+
+
+def start_span(name, **attributes):
+    """Start a span which must be ended explicitly with ``span.end()``.
+
+    Returns
+    -------
+    OpenTelemetry compatible ``Span``
+    """
+    if _tracer is None:
+        return NOOP_SPAN
+    return _tracer.start_span(name, attributes=attributes)
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """Context manager to record a span.
+
+    Parameters
+    ----------
+    name : :obj:`str`
+        Name of the span
+    parent : OpenTelemetry compatible ``Span``, optional
+        Span to use as the parent, such as the span for the job, defaults to
+        the current span
+    **attributes
+        Attributes to set on the span
+    """
+    if _tracer is None:
+        yield NOOP_SPAN
+        return
+    context = None
+    if parent is not None and parent is not NOOP_SPAN:
+        context = _context_for(parent)
+    with _tracer.start_as_current_span(
+        name, context=context, attributes=attributes
+    ) as current_span:
+        yield current_span
+
+
+def traced(name):
+    """Decorator to record each call of a method as a span.
+
+    The span's parent is the ``_span`` attribute of the instance, if any.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def new_func(self, *args, **kwargs):
+            if _tracer is None:
+                return func(self, *args, **kwargs)
+            with span(name, parent=getattr(self, "_span", None)):
+                return func(self, *args, **kwargs)
+
+        return new_func
+
+    return decorator
@@ -0,0 +1,337 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = [
+    "HTTPXTransport",
+    "RequestsTransport",
+    "SessionTransport",
+    "Transport",
+    "get_transport",
+    "send",
+    "set_transport",
+]
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers, super_len
+import six
+
+from .logging import logger
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Transport(object):
+    """Sends the HTTP requests made to the GitLab API"""
+
+    def request(self, method, url, **kwargs):
+        """Send a request.
+
+        Parameters
+        ----------
+        method : :obj:`str`
+            HTTP method of the request
+        url : :obj:`str`
+            URL to request
+        **kwargs
+            Arguments accepted by `requests.request`
+
+        Returns
+        -------
+        :py:class:`requests.Response`
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Release any resources held by the transport"""
+
+
+class RequestsTransport(Transport):
+    """Send requests with `requests.request`, using a new connection for each"""
+
+    def request(self, method, url, **kwargs):
+        return requests.request(method, url, **kwargs)
+
+
+class SessionTransport(Transport):
+    """Send requests with a `requests.Session` so connections are reused.
+
+    Parameters
+    ----------
+    pool_connections : :obj:`int`, optional
+        Number of hosts to keep connections open to
+    pool_maxsize : :obj:`int`, optional
+        Maximum number of connections to keep open to each host, should be
+        at least the number of threads making requests
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10):
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        return self._session.request(method, url, **kwargs)
+
+    def close(self):
+        self._session.close()
+
+
+class _HTTPXStream(object):
+    """File-like access to a streamed httpx response for `requests.Response.raw`"""
+
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_bytes(CHUNK_SIZE)
+        self._buffered = b""
+
+    def read(self, size=-1):
+        try:
+            while size < 0 or len(self._buffered) < size:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buffered += chunk
+        except httpx.TransportError as e:
+            six.raise_from(requests.exceptions.ChunkedEncodingError(e), e)
+        if size < 0:
+            size = len(self._buffered)
+        data, self._buffered = self._buffered[:size], self._buffered[size:]
+        return data
+
+    def close(self):
+        self._response.close()
+
+
+class _HeadersSent(object):
+    """Hold a lock until httpcore reports that a request's headers were sent"""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._lock.acquire()
+        self._locked = True
+
+    def trace(self, name, info):
+        if name.endswith("send_request_headers.complete"):
+            self.release()
+
+    def release(self):
+        if self._locked:
+            self._locked = False
+            self._lock.release()
+
+
+class _OrderedConnection(object):
+    """Send the headers of a connection's requests in the order of their IDs.
+
+    httpcore chooses the ID of a new HTTP/2 stream before taking the lock
+    for writing to the connection, so when requests are made from several
+    threads their headers can be sent with the IDs out of order. Servers
+    treat this as a protocol error and drop the connection along with every
+    request which was multiplexed over it. Requests on the same connection
+    are therefore sent one at a time until their headers have been written,
+    while those on other connections are unaffected.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __repr__(self):
+        return repr(self._connection)
+
+    def handle_request(self, request):
+        headers_sent = _HeadersSent(self._lock)
+        trace = request.extensions.get("trace")
+
+        def on_trace(name, info):
+            headers_sent.trace(name, info)
+            if trace is not None:
+                trace(name, info)
+
+        request.extensions = dict(request.extensions, trace=on_trace)
+        try:
+            return self._connection.handle_request(request)
+        finally:
+            headers_sent.release()
+
+
+def _order_headers(transport):
+    """Wrap the connections made by an `httpx.HTTPTransport` in `_OrderedConnection`
+
+    Returns
+    -------
+    :obj:`bool`
+        False if the installed version of httpx doesn't support it
+    """
+    # httpx has no option for customising the connections of its pool so
+    # this relies on private attributes, see the versions pinned in setup.py
+    pool = getattr(transport, "_pool", None)
+    create_connection = getattr(pool, "create_connection", None)
+    if create_connection is None:
+        logger.warning(
+            "Unable to order HTTP/2 request headers with httpx %s, concurrent "
+            "requests may cause connections to be dropped",
+            httpx.__version__,
+        )
+        return False
+    pool.create_connection = lambda origin: _OrderedConnection(
+        create_connection(origin)
+    )
+    return True
+
+
+class HTTPXTransport(Transport):
+    """Send requests with a shared `httpx.Client`.
+
+    Responses are converted to `requests.Response` objects and errors to
+    the equivalent `requests` exceptions, so the rest of the package is
+    unaware of which transport is used. Requires the ``httpx`` package, and
+    the ``h2`` package for HTTP/2.
+
+    With HTTP/2 concurrent requests to the same host are multiplexed as
+    streams over a few connections instead of each using its own, so a
+    single instance should be shared by all of the runners for a GitLab
+    instance.
+
+    Parameters
+    ----------
+    http2 : :obj:`bool`, optional
+        Use HTTP/2 with servers which support it
+    http1 : :obj:`bool`, optional
+        Allow HTTP/1.1, if False HTTP/2 is used without negotiating it first
+        which is needed for servers that don't use TLS
+    max_connections : :obj:`int`, optional
+        Maximum number of concurrent connections
+    max_keepalive_connections : :obj:`int`, optional
+        Maximum number of idle connections to keep open
+    timeout : :obj:`float`, optional
+        Default timeout in seconds, or None to wait forever like `requests`
+    """
+
+    def __init__(
+        self,
+        http2=False,
+        http1=True,
+        max_connections=100,
+        max_keepalive_connections=20,
+        timeout=None,
+    ):
+        if httpx is None:
+            raise ImportError("httpx is required to use HTTPXTransport")
+        self.http2 = http2
+        transport = httpx.HTTPTransport(
+            http1=http1,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+        )
+        if http2:
+            _order_headers(transport)
+        self._client = httpx.Client(transport=transport, timeout=timeout)
+
+    def request(self, method, url, **kwargs):
+        headers = dict(kwargs.get("headers") or {})
+        options = {"params": kwargs.get("params"), "json": kwargs.get("json")}
+        data = kwargs.get("data")
+        if isinstance(data, dict):
+            options["data"] = data
+        elif hasattr(data, "read"):
+            # Stream file-like bodies with their length so they aren't chunked
+            if "Content-Length" not in headers:
+                headers["Content-Length"] = str(super_len(data))
+            options["content"] = iter(lambda: data.read(CHUNK_SIZE), b"")
+        elif data is not None:
+            options["content"] = data
+        if "timeout" in kwargs:
+            options["timeout"] = kwargs["timeout"]
+        stream = kwargs.get("stream", False)
+
+        try:
+            request = self._client.build_request(
+                method, url, headers=headers, **options
+            )
+            response = self._client.send(
+                request,
+                stream=stream,
+                follow_redirects=kwargs.get("allow_redirects", True),
+            )
+        except httpx.TimeoutException as e:
+            six.raise_from(requests.exceptions.Timeout(e), e)
+        except httpx.TransportError as e:
+            six.raise_from(requests.exceptions.ConnectionError(e), e)
+
+        converted = requests.Response()
+        converted.status_code = response.status_code
+        converted.reason = response.reason_phrase
+        converted.headers = CaseInsensitiveDict(response.headers.items())
+        converted.encoding = get_encoding_from_headers(converted.headers)
+        converted.url = str(response.url)
+        # Metrics and recording read the body from the request, streamed
+        # bodies have been consumed so the original object is used for them
+        prepared = requests.PreparedRequest()
+        prepared.method = request.method
+        prepared.url = str(request.url)
+        prepared.headers = CaseInsensitiveDict(request.headers.items())
+        if hasattr(data, "read"):
+            prepared.body = data
+        else:
+            prepared.body = request.content
+        converted.request = prepared
+        if stream:
+            converted.raw = _HTTPXStream(response)
+        else:
+            converted._content = response.content
+            converted._content_consumed = True
+        return converted
+
+    def close(self):
+        self._client.close()
+
+
+DEFAULT_TRANSPORT = RequestsTransport()
+
+_transport = None
+
+
+def set_transport(transport):
+    """Send all requests to the GitLab API using transport.
+
+    Runners which were given their own transport continue to use it.
+
+    Parameters
+    ----------
+    transport : `Transport` or None
+        Transport to use, or None to use `requests`
+    """
+    global _transport
+    _transport = transport
+
+
+def get_transport():
+    """The transport passed to `set_transport` or the default transport"""
+    return DEFAULT_TRANSPORT if _transport is None else _transport
+
+
+def send(method, url, transport=None, **kwargs):
+    """Send a request using transport, defaulting to the current transport"""
+    if transport is None:
+        transport = get_transport()
+    return transport.request(method, url, **kwargs)
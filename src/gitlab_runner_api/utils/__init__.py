@@ -2,12 +2,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-__all__ = ["ansi", "Retrier"]
+__all__ = ["ansi", "compression", "Retrier"]
 
 import time
 
 from ..logging import logger
 from . import ansi
+from . import compression
 
 
 class Retrier(object):
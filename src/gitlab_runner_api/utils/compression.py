@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["SUPPORTED_ENCODINGS", "compress", "decompress"]
+
+import zlib
+
+import six
+
+SUPPORTED_ENCODINGS = ["gzip", "deflate"]
+
+# zlib window bits for each content encoding, see zlib.compressobj
+_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def compress(data, encoding, level=6):
+    """Compress a request body.
+
+    Parameters
+    ----------
+    data : :obj:`str` or :obj:`bytes`
+        Data to compress, text is encoded as UTF-8
+    encoding : :obj:`str`
+        Value of the ``Content-Encoding`` header, one of `SUPPORTED_ENCODINGS`
+    level : :obj:`int`, optional
+        Compression level between 1 and 9
+
+    Returns
+    -------
+    :obj:`bytes`
+    """
+    if encoding not in _WBITS:
+        raise ValueError("Unsupported content encoding " + repr(encoding))
+    if isinstance(data, six.text_type):
+        data = data.encode("utf-8")
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data, encoding):
+    """Decompress a body which was compressed with `compress`.
+
+    Parameters
+    ----------
+    data : :obj:`bytes`
+        Compressed data
+    encoding : :obj:`str`
+        Value of the ``Content-Encoding`` header, one of `SUPPORTED_ENCODINGS`
+
+    Returns
+    -------
+    :obj:`bytes`
+    """
+    if encoding not in _WBITS:
+        raise ValueError("Unsupported content encoding " + repr(encoding))
+    return zlib.decompress(data, _WBITS[encoding])
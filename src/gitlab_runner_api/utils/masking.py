@@ -0,0 +1,151 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+__all__ = ["MASKED", "SecretMasker"]
+
+from collections import deque
+
+MASKED = "[MASKED]"
+
+
+class SecretMasker(object):
+    """Replace secrets in a stream of text with ``[MASKED]``.
+
+    All secrets are matched in a single pass using an Aho-Corasick automaton
+    so the cost of masking is linear in the length of the text, regardless of
+    the number of secrets. Text which might be the start of a secret is held
+    back until enough of the stream has been seen to decide, so secrets which
+    are split across chunks are still masked.
+
+    Parameters
+    ----------
+    secrets : :obj:`list` of :obj:`str`
+        Values to mask, empty strings are ignored
+    replacement : :obj:`str`, optional
+        String to replace each secret with
+    """
+
+    def __init__(self, secrets, replacement=MASKED):
+        self._replacement = replacement
+        # Each node of the trie is represented by its index into these lists
+        self._goto = [{}]
+        self._fail = [0]
+        self._depth = [0]
+        # Length of the longest secret which ends at each node
+        self._match = [0]
+
+        for secret in set(secrets):
+            if not secret:
+                continue
+            node = 0
+            for char in secret:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._depth.append(self._depth[node] + 1)
+                    self._match.append(0)
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._match[node] = len(secret)
+        self._build_failure_links()
+
+        self._state = 0
+        self._buffer = ""
+        # Sorted and non-overlapping (start, end) positions of secrets in buffer
+        self._matches = deque()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                # The longest secret ending here is either the full path to
+                # this node or the longest one ending at the failure node
+                if not self._match[child]:
+                    self._match[child] = self._match[fail]
+
+    def __bool__(self):
+        return len(self._goto) > 1
+
+    __nonzero__ = __bool__
+
+    def _step(self, char):
+        node = self._state
+        while node and char not in self._goto[node]:
+            node = self._fail[node]
+        self._state = self._goto[node].get(char, 0)
+        return self._match[self._state]
+
+    def _add_match(self, start, end):
+        while self._matches and start < self._matches[-1][1]:
+            start = min(start, self._matches.pop()[0])
+        self._matches.append((start, end))
+
+    def _emit(self, length):
+        """Remove the first length characters of the buffer with secrets masked"""
+        result = []
+        position = 0
+        while self._matches and self._matches[0][1] <= length:
+            start, end = self._matches.popleft()
+            result.append(self._buffer[position:start])
+            result.append(self._replacement)
+            position = end
+        result.append(self._buffer[position:length])
+        self._buffer = self._buffer[length:]
+        self._matches = deque((s - length, e - length) for s, e in self._matches)
+        return "".join(result)
+
+    @property
+    def pending(self):
+        """Text which has been held back, without any secrets masked"""
+        return self._buffer
+
+    def mask(self, text):
+        """Mask secrets in the next chunk of the stream.
+
+        Parameters
+        ----------
+        text : :obj:`str`
+            Next chunk of the stream
+
+        Returns
+        -------
+        :obj:`str`
+            Masked text which is safe to output, which may be shorter than
+            text if its end could be the start of a secret
+        """
+        if not self:
+            return text
+        offset = len(self._buffer)
+        self._buffer += text
+        for i, char in enumerate(text):
+            length = self._step(char)
+            if length:
+                end = offset + i + 1
+                self._add_match(end - length, end)
+
+        # Any secret which is still to be found must start in the last
+        # depth characters so everything before them can be output
+        safe = len(self._buffer) - self._depth[self._state]
+        for start, end in reversed(self._matches):
+            if end <= safe:
+                break
+            safe = min(safe, start)
+        return self._emit(safe)
+
+    def flush(self):
+        """Return the remainder of the stream once no more text is expected.
+
+        Returns
+        -------
+        :obj:`str`
+        """
+        self._state = 0
+        return self._emit(len(self._buffer))
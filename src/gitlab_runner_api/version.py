@@ -4,7 +4,18 @@ from __future__ import print_function
 
 __all__ = ["CURRENT_DATA_VERSION", "package_version"]
 
-import pkg_resources  # part of setuptools
+try:
+    from importlib.metadata import version
+except ImportError:
+    # Python < 3.8, avoid pkg_resources if possible as it is slow to import
+    try:
+        from importlib_metadata import version
+    except ImportError:
+        import pkg_resources  # part of setuptools
+
+        def version(name):
+            return pkg_resources.require(name)[0].version
+
 
 CURRENT_DATA_VERSION = 1
-package_version = pkg_resources.require("gitlab_runner_api")[0].version
+package_version = version("gitlab_runner_api")
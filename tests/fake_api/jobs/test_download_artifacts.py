@@ -85,3 +85,42 @@ def test_auth_error(gitlab_api):
     assert len(gitlab_api.pending_jobs) == 3
     assert len(gitlab_api.running_jobs) == 4
     assert len(gitlab_api.completed_jobs) == 1
+
+
+@gitlab_api.use(n_runners=2, n_pending=3, n_running=4, n_success=1, n_with_artifacts=1)
+def test_range(gitlab_api):
+    job = gitlab_api.completed_jobs[0]
+    size = len(job.file_data)
+
+    response = requests.get(
+        API_ENDPOINT + "/jobs/" + job.id + "/artifacts",
+        headers={"JOB-TOKEN": job.token, "Range": "bytes=2-"},
+    )
+    # Check the response
+    assert response.status_code == 206
+    assert response.content == job.file_data[2:]
+    assert response.headers["Content-Range"] == "bytes 2-%d/%d" % (size - 1, size)
+
+    response = requests.get(
+        API_ENDPOINT + "/jobs/" + job.id + "/artifacts",
+        headers={"JOB-TOKEN": job.token, "Range": "bytes=" + str(size) + "-"},
+    )
+    # Check the response
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */" + str(size)
+
+
+@gitlab_api.use(n_runners=1, n_success=2, n_with_artifacts=1)
+def test_not_found(gitlab_api):
+    job = gitlab_api.completed_jobs[1]
+    response = requests.get(
+        API_ENDPOINT + "/jobs/" + job.id + "/artifacts",
+        headers={"JOB-TOKEN": job.token},
+    )
+    assert response.status_code == 404
+
+    response = requests.get(
+        API_ENDPOINT + "/jobs/12345/artifacts", headers={"JOB-TOKEN": job.token}
+    )
+    assert response.status_code == 404
+    assert response.json()["message"] == "404 Not Found"
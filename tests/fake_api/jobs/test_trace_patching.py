@@ -166,3 +166,25 @@ def test_completed(gitlab_api):
     assert response.status_code == 403, response.json()
     assert response.json() == {"message": "403 Forbidden  - Job is not running"}
     assert "Range" not in response.headers
+
+
+@gitlab_api.use(n_runners=1, n_running=1)
+def test_byte_ranges(gitlab_api):
+    expected_job = gitlab_api.running_jobs[0]
+    url = API_ENDPOINT + "/jobs/" + expected_job.id + "/trace"
+    text = u"Café ✓\n"
+    data = text.encode("utf-8")
+
+    # The length is in bytes rather than characters
+    headers = {"JOB-TOKEN": expected_job.token, "Content-Range": "0-" + str(len(text))}
+    response = requests.patch(url, data, headers=headers)
+    assert response.status_code == 416
+    assert response.headers["Range"] == "0-0"
+
+    for i in range(100):
+        headers["Content-Range"] = str(i * len(data)) + "-" + str(len(data))
+        response = requests.patch(url, data, headers=headers)
+        assert response.status_code == 202
+        assert response.content.decode() == "0-" + str((i + 1) * len(data))
+    assert expected_job.log_size == 100 * len(data)
+    assert expected_job.log == text * 100
@@ -198,3 +198,22 @@ def test_verify_valid(gitlab_api):
     assert response.json() == 200
     # Check the API's internal state
     assert len(gitlab_api.runners) == 2
+
+
+@gitlab_api.use(n_runners=2)
+def test_verify_unhashable_token(gitlab_api):
+    runner_token = list(gitlab_api.runners.keys())[0]
+    response = requests.post(
+        API_ENDPOINT + "/runners/verify", json={"token": [runner_token]}
+    )
+    assert response.status_code == 403
+    assert response.json()["message"] == "403 Forbidden"
+
+
+@gitlab_api.use(n_runners=5000)
+def test_verify_many_runners(gitlab_api):
+    for runner_token in list(gitlab_api.runners.keys())[::500]:
+        response = requests.post(
+            API_ENDPOINT + "/runners/verify", json={"token": runner_token}
+        )
+        assert response.status_code == 200
@@ -0,0 +1,450 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import io
+import logging
+import os
+from os.path import exists, join
+import pytest
+import shutil
+import time
+import zipfile
+
+from gitlab_runner_api import (
+    ArtifactCache,
+    ArtifactIntegrityException,
+    AuthException,
+    MissingArtifactsException,
+    Runner,
+    transport,
+)
+from gitlab_runner_api.artifacts import _ZipWriter, build_archive, collect_paths
+from gitlab_runner_api.logging import logger
+from gitlab_runner_api.testing import FakeGitlabAPI, run_test_with_tmpdir
+
+gitlab_api = FakeGitlabAPI()
+
+
+class ResponseTransport(transport.RequestsTransport):
+    """Keep the responses to streamed requests"""
+
+    def __init__(self):
+        self.streamed = []
+
+    def request(self, method, url, **kwargs):
+        response = super(ResponseTransport, self).request(method, url, **kwargs)
+        if kwargs.get("stream"):
+            self.streamed.append(response)
+        return response
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=1, n_with_artifacts=1)
+@run_test_with_tmpdir
+def test_download_artifacts(gitlab_api, tmpdir):
+    upstream = gitlab_api.completed_jobs[0]
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    dest = join(tmpdir, "artifacts.zip")
+    sha256 = job.download_artifacts(upstream.id, upstream.token, dest)
+    assert sha256 == upstream.artifact_sha_hash
+    with open(dest, "rb") as fp:
+        assert fp.read() == upstream.file_data
+    assert not exists(dest + ".part")
+
+    # Downloading again should replace the existing file
+    job.download_artifacts(upstream.id, upstream.token, dest, sha256=sha256)
+    with open(dest, "rb") as fp:
+        assert fp.read() == upstream.file_data
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=1, n_with_artifacts=1)
+@run_test_with_tmpdir
+def test_download_artifacts_resume(gitlab_api, tmpdir):
+    upstream = gitlab_api.completed_jobs[0]
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    # Simulate a previously interrupted download
+    dest = join(tmpdir, "artifacts.zip")
+    with open(dest + ".part", "wb") as fp:
+        fp.write(upstream.file_data[:4])
+
+    sha256 = job.download_artifacts(
+        upstream.id, upstream.token, dest, sha256=upstream.artifact_sha_hash
+    )
+    assert sha256 == upstream.artifact_sha_hash
+    with open(dest, "rb") as fp:
+        assert fp.read() == upstream.file_data
+
+    # A partial file which is already complete
+    shutil.move(dest, dest + ".part")
+    sha256 = job.download_artifacts(upstream.id, upstream.token, dest)
+    assert sha256 == upstream.artifact_sha_hash
+    assert not exists(dest + ".part")
+
+    # A partial file which is longer than the real file
+    with open(dest + ".part", "wb") as fp:
+        fp.write(upstream.file_data + b"garbage")
+    sha256 = job.download_artifacts(upstream.id, upstream.token, dest)
+    assert sha256 == upstream.artifact_sha_hash
+    with open(dest, "rb") as fp:
+        assert fp.read() == upstream.file_data
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=1, n_with_artifacts=1)
+@run_test_with_tmpdir
+def test_download_artifacts_bad_hash(gitlab_api, tmpdir):
+    upstream = gitlab_api.completed_jobs[0]
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    dest = join(tmpdir, "artifacts.zip")
+    with pytest.raises(ArtifactIntegrityException):
+        job.download_artifacts(
+            upstream.id,
+            upstream.token,
+            dest,
+            sha256=hashlib.sha256(b"something else").hexdigest(),
+        )
+    assert not exists(dest)
+    assert not exists(dest + ".part")
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=1, n_with_artifacts=1)
+@run_test_with_tmpdir
+def test_download_artifacts_bad_auth(gitlab_api, tmpdir):
+    upstream = gitlab_api.completed_jobs[0]
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    dest = join(tmpdir, "artifacts.zip")
+    with pytest.raises(AuthException):
+        job.download_artifacts(upstream.id, "invalid_token", dest)
+    assert not exists(dest)
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=1, n_with_artifacts=1)
+@run_test_with_tmpdir
+def test_download_artifacts_error_closes(gitlab_api, tmpdir):
+    upstream = gitlab_api.completed_jobs[0]
+    responses = ResponseTransport()
+    runner = Runner.register(
+        "https://gitlab.cern.ch", gitlab_api.token, transport=responses
+    )
+    job = runner.request_job()
+
+    dest = join(tmpdir, "artifacts.zip")
+    with pytest.raises(AuthException):
+        job.download_artifacts(upstream.id, "invalid_token", dest)
+    with pytest.raises(MissingArtifactsException):
+        job.download_artifacts(job.id, job.token, dest)
+    assert len(responses.streamed) == 2
+    assert all(r.raw.closed for r in responses.streamed)
+
+
+def make_zip(files):
+    fp = io.BytesIO()
+    with zipfile.ZipFile(fp, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return fp.getvalue()
+
+
+def add_dependencies(gitlab_api):
+    dependencies = []
+    for i, job in enumerate(gitlab_api.completed_jobs):
+        files = {"shared.txt": "from job " + str(i), "job" + str(i) + ".txt": "data"}
+        job.upload_artifacts("artifacts.zip", make_zip(files))
+        dependencies.append(job.as_dependency())
+    gitlab_api.pending_jobs[0]["dependencies"] = dependencies
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=3)
+@run_test_with_tmpdir
+def test_fetch_dependencies(gitlab_api, tmpdir):
+    add_dependencies(gitlab_api)
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    results = job.fetch_dependencies(tmpdir, max_workers=2)
+    assert results == {
+        j.job_info["name"]: j.artifact_sha_hash for j in gitlab_api.completed_jobs
+    }
+    for i in range(3):
+        assert exists(join(tmpdir, "job" + str(i) + ".txt"))
+    # Dependencies are extracted in order so the last one wins
+    with open(join(tmpdir, "shared.txt"), "rt") as fp:
+        assert fp.read() == "from job 2"
+    assert sorted(os.listdir(tmpdir)) == [
+        "job0.txt",
+        "job1.txt",
+        "job2.txt",
+        "shared.txt",
+    ]
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=2)
+@run_test_with_tmpdir
+def test_prefetch_dependencies(gitlab_api, tmpdir):
+    add_dependencies(gitlab_api)
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job(prefetch_dependencies=tmpdir)
+
+    future = job.fetch_dependencies(tmpdir, wait=False)
+    assert future is job.fetch_dependencies(tmpdir, wait=False)
+    results = job.fetch_dependencies(tmpdir)
+    assert results == future.result()
+    assert len(results) == 2
+    assert exists(join(tmpdir, "job1.txt"))
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=2)
+@run_test_with_tmpdir
+def test_fetch_dependencies_without_artifacts(gitlab_api, tmpdir):
+    add_dependencies(gitlab_api)
+    dependencies = gitlab_api.pending_jobs[0]["dependencies"]
+    dependencies[0]["artifacts_file"] = {"filename": None, "size": None}
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    results = job.fetch_dependencies(tmpdir)
+    assert list(results) == [gitlab_api.completed_jobs[1].job_info["name"]]
+    assert not exists(join(tmpdir, "job0.txt"))
+    assert exists(join(tmpdir, "job1.txt"))
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=2)
+@run_test_with_tmpdir
+def test_fetch_dependencies_bad_auth(gitlab_api, tmpdir):
+    add_dependencies(gitlab_api)
+    gitlab_api.pending_jobs[0]["dependencies"][1]["token"] = "invalid_token"
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    with pytest.raises(AuthException):
+        job.fetch_dependencies(tmpdir)
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=1)
+@run_test_with_tmpdir
+def test_prefetch_dependencies_error_logged(gitlab_api, tmpdir):
+    add_dependencies(gitlab_api)
+    gitlab_api.pending_jobs[0]["dependencies"][0]["token"] = "invalid_token"
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    records = []
+    handler = logging.Handler(logging.ERROR)
+    handler.emit = records.append
+    logger.addHandler(handler)
+    try:
+        job = runner.request_job(prefetch_dependencies=tmpdir)
+        future = job.fetch_dependencies(tmpdir, wait=False)
+        assert isinstance(future.exception(), AuthException)
+        # Callbacks are called after waiters are woken up
+        for _ in range(100):
+            messages = [r.getMessage() for r in records]
+            if any("Failed to fetch the dependencies" in m for m in messages):
+                break
+            time.sleep(0.01)
+        else:
+            raise AssertionError("Error wasn't logged: " + repr(messages))
+    finally:
+        logger.removeHandler(handler)
+
+
+@run_test_with_tmpdir
+def test_artifact_cache(tmpdir):
+    cache = ArtifactCache(join(tmpdir, "cache"), max_size=25)
+    assert cache.path in repr(cache)
+
+    archives = {}
+    for i in range(3):
+        archives[i] = join(tmpdir, "archive" + str(i) + ".zip")
+        with open(archives[i], "wb") as fp:
+            fp.write(str(i).encode() * 10)
+
+    dest = join(tmpdir, "dest.zip")
+    assert cache.get(0, dest) is None
+    sha256 = cache.put(0, archives[0])
+    assert sha256 == hashlib.sha256(b"0" * 10).hexdigest()
+    assert cache.get(0, dest) == sha256
+    with open(dest, "rb") as fp:
+        assert fp.read() == b"0" * 10
+    assert cache.get(0, dest, sha256="wrong") is None
+
+    # Partial downloads are left to be resumed
+    with open(dest + ".part", "wb") as fp:
+        fp.write(b"partial")
+    assert cache.get(0, dest) == sha256
+    with open(dest + ".part", "rb") as fp:
+        assert fp.read() == b"partial"
+    os.remove(dest + ".part")
+
+    # Modifying the files which were copied in or out doesn't affect the cache
+    with open(dest, "ab") as fp:
+        fp.write(b"modified")
+    with open(archives[0], "ab") as fp:
+        fp.write(b"modified")
+    assert cache.get(0, dest) == sha256
+    with open(dest, "rb") as fp:
+        assert fp.read() == b"0" * 10
+    with open(archives[0], "wb") as fp:
+        fp.write(b"0" * 10)
+
+    # The same archive from another job is only stored once
+    assert cache.put(10, archives[0]) == sha256
+    assert len(os.listdir(join(cache.path, "blobs"))) == 1
+
+    # Make archive 0 the most recently used so archive 1 is evicted first
+    cache.put(1, archives[1])
+    past = time.time() - 100
+    os.utime(join(cache.path, "blobs", sha256), (past, past))
+    os.utime(join(cache.path, "blobs", cache.get(1, dest)), (past - 10, past - 10))
+    assert cache.get(0, dest) == sha256
+    cache.put(2, archives[2])
+    assert cache.get(1, dest) is None
+    assert "1" not in os.listdir(join(cache.path, "jobs"))
+    assert cache.get(0, dest) == sha256
+    assert cache.get(10, dest) == sha256
+    assert cache.get(2, dest) is not None
+
+    cache.evict(max_size=0)
+    assert os.listdir(join(cache.path, "blobs")) == []
+    assert os.listdir(join(cache.path, "jobs")) == []
+    assert cache.get(0, dest) is None
+
+
+@gitlab_api.use(n_runners=1, n_pending=1, n_success=1, n_with_artifacts=1)
+@run_test_with_tmpdir
+def test_download_artifacts_with_cache(gitlab_api, tmpdir):
+    upstream = gitlab_api.completed_jobs[0]
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    cache = ArtifactCache(join(tmpdir, "cache"))
+
+    dest = join(tmpdir, "artifacts.zip")
+    sha256 = job.download_artifacts(upstream.id, upstream.token, dest, cache=cache)
+    assert sha256 == upstream.artifact_sha_hash
+    os.remove(dest)
+
+    # The second download should not need to contact GitLab
+    sha256 = job.download_artifacts(upstream.id, "invalid_token", dest, cache=cache)
+    assert sha256 == upstream.artifact_sha_hash
+    with open(dest, "rb") as fp:
+        assert fp.read() == upstream.file_data
+
+
+def make_tree(root):
+    files = {
+        "binaries/a.bin": b"a" * 100000,
+        "binaries/nested/b.txt": b"some text\n" * 10,
+        "binaries/empty": b"",
+        ".config": b"setting = 1\n",
+        "ignored.txt": b"not an artifact",
+    }
+    for name, data in files.items():
+        filename = join(root, name)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, "wb") as fp:
+            fp.write(data)
+    return files
+
+
+@run_test_with_tmpdir
+def test_build_archive(tmpdir):
+    files = make_tree(tmpdir)
+    paths = collect_paths(tmpdir, ["binaries/", ".config", "missing/*"])
+    assert paths == [
+        "binaries",
+        "binaries/nested",
+        "binaries/a.bin",
+        "binaries/empty",
+        "binaries/nested/b.txt",
+        ".config",
+    ]
+    assert collect_paths(tmpdir, ["*.txt"]) == ["ignored.txt"]
+    assert collect_paths(join(tmpdir, "binaries"), ["../.config", "*.bin"]) == ["a.bin"]
+
+    fp = io.BytesIO()
+    assert build_archive(fp, paths, root=tmpdir, max_workers=2) == len(paths)
+    with zipfile.ZipFile(fp) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == [
+            "binaries/",
+            "binaries/nested/",
+            "binaries/a.bin",
+            "binaries/empty",
+            "binaries/nested/b.txt",
+            ".config",
+        ]
+        for name in paths[2:]:
+            assert zf.read(name) == files[name]
+        assert zf.getinfo("binaries/a.bin").compress_size < 1000
+
+
+@run_test_with_tmpdir
+def test_build_archive_zip64(tmpdir):
+    files = make_tree(tmpdir)
+    paths = collect_paths(tmpdir, ["binaries/"])
+
+    # Force the zip64 extensions to be used for every entry
+    limits = _ZipWriter.zip64_limit, _ZipWriter.count_limit
+    _ZipWriter.zip64_limit, _ZipWriter.count_limit = 0, 0
+    try:
+        fp = io.BytesIO()
+        build_archive(fp, paths, root=tmpdir)
+    finally:
+        _ZipWriter.zip64_limit, _ZipWriter.count_limit = limits
+
+    with zipfile.ZipFile(fp) as zf:
+        assert zf.testzip() is None
+        assert len(zf.namelist()) == len(paths)
+        assert zf.read("binaries/a.bin") == files["binaries/a.bin"]
+
+
+@gitlab_api.use(n_pending=2)
+@run_test_with_tmpdir
+def test_build_and_upload_artifacts(gitlab_api, tmpdir):
+    files = make_tree(join(tmpdir, "build"))
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    # The default artifacts are only uploaded on success
+    dest = join(tmpdir, "artifacts.zip")
+    assert job.build_artifacts(dest, root=join(tmpdir, "build"), state="failed") is None
+    assert job.build_artifacts(dest, root=join(tmpdir, "build")) == dest
+
+    job.set_success(artifacts=dest)
+    uploaded = gitlab_api.completed_jobs[0]
+    assert uploaded._filename == "artifacts.zip"
+    with zipfile.ZipFile(io.BytesIO(uploaded.file_data)) as zf:
+        assert zf.read("binaries/nested/b.txt") == files["binaries/nested/b.txt"]
+        assert zf.read(".config") == files[".config"]
+        assert "ignored.txt" not in zf.namelist()
+
+
+@gitlab_api.use(n_pending=2)
+@run_test_with_tmpdir
+def test_build_artifacts_when(gitlab_api, tmpdir):
+    make_tree(tmpdir)
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    dest = join(tmpdir, "artifacts.zip")
+
+    job._job_info["artifacts"] = [
+        {"paths": ["ignored.txt"], "when": "on_failure", "name": "$CI_JOB_NAME"},
+        {"paths": [".config"], "when": "always", "artifact_type": "archive"},
+        {"paths": ["binaries"], "artifact_type": "junit"},
+    ]
+    job.build_artifacts(dest, root=tmpdir, state="success")
+    with zipfile.ZipFile(dest) as zf:
+        assert zf.namelist() == [".config"]
+    job.build_artifacts(dest, root=tmpdir, state="failed")
+    with zipfile.ZipFile(dest) as zf:
+        assert zf.namelist() == ["ignored.txt", ".config"]
+
+    job.set_failed(artifacts=dest)
+    assert gitlab_api.completed_jobs[0]._filename == "example_job.zip"
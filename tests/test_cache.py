@@ -0,0 +1,179 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+from os.path import exists, join
+import stat
+import pytest
+
+from gitlab_runner_api import CacheSpec, LocalCacheStore, Runner
+from gitlab_runner_api import cache as cache_module
+from gitlab_runner_api.testing import FakeGitlabAPI, run_test_with_tmpdir
+
+gitlab_api = FakeGitlabAPI()
+
+
+def write_file(filename, data):
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    with open(filename, "wt") as fp:
+        fp.write(data)
+
+
+def read_file(filename):
+    with open(filename, "rt") as fp:
+        return fp.read()
+
+
+def test_cache_spec():
+    spec = CacheSpec(key="my-key", paths=["vendor/"], policy="pull", unknown=1)
+    assert spec.key == "my-key"
+    assert spec.paths == ["vendor/"]
+    assert spec.pull
+    assert not spec.push("success")
+    assert "my-key" in repr(spec)
+    assert spec == CacheSpec(key="my-key", paths=["vendor/"], policy="pull")
+
+    spec = CacheSpec(when="on_failure")
+    assert spec.key == "default"
+    assert not spec.push("success")
+    assert spec.push("failed")
+    assert CacheSpec(when="always").push("success")
+
+    with pytest.raises(ValueError):
+        CacheSpec(key="")
+    with pytest.raises(ValueError):
+        CacheSpec(policy="invalid")
+    with pytest.raises(ValueError):
+        CacheSpec(when="never")
+    with pytest.raises(ValueError):
+        CacheSpec(untracked="yes")
+
+
+def check_store(tmpdir, hardlink):
+    store = LocalCacheStore(join(tmpdir, "store"))
+    assert store.path in repr(store)
+    build = join(tmpdir, "build")
+    write_file(join(build, "vendor", "a.txt"), "a")
+    write_file(join(build, "vendor", "nested", "b.txt"), "b")
+    write_file(join(build, "other.txt"), "other")
+
+    assert not store.restore("key", join(tmpdir, "empty"))
+    assert not store.save("key", ["missing/"], root=build)
+    assert store.save("key", ["vendor/"], root=build)
+
+    dest = join(tmpdir, "dest")
+    assert store.restore("key", dest, hardlink=hardlink)
+    assert read_file(join(dest, "vendor", "a.txt")) == "a"
+    assert read_file(join(dest, "vendor", "nested", "b.txt")) == "b"
+    assert not exists(join(dest, "other.txt"))
+
+    # Saving again replaces the previous contents
+    write_file(join(build, "vendor", "a.txt"), "new a")
+    assert store.save("key", ["vendor/"], root=build)
+    assert store.restore("key", dest, hardlink=hardlink)
+    assert read_file(join(dest, "vendor", "a.txt")) == "new a"
+    return store
+
+
+@run_test_with_tmpdir
+def test_store(tmpdir):
+    store = check_store(tmpdir, hardlink=False)
+    assert os.listdir(join(store.path, "trees")) == []
+
+
+@run_test_with_tmpdir
+def test_store_hardlink(tmpdir):
+    store = check_store(tmpdir, hardlink=True)
+    assert len(os.listdir(join(store.path, "trees"))) == 1
+    assert os.stat(join(tmpdir, "dest", "vendor", "a.txt")).st_nlink == 2
+    # The shared files can't be modified in place
+    mode = os.stat(join(tmpdir, "dest", "vendor", "a.txt")).st_mode
+    assert not mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+@run_test_with_tmpdir
+def test_store_gzip(tmpdir):
+    zstandard, cache_module.zstandard = cache_module.zstandard, None
+    try:
+        store = check_store(tmpdir, hardlink=True)
+    finally:
+        cache_module.zstandard = zstandard
+    assert all(
+        fn.endswith(".tar.gz") for fn in os.listdir(join(store.path, "archives"))
+    )
+
+
+@run_test_with_tmpdir
+def test_store_eviction(tmpdir):
+    store = LocalCacheStore(join(tmpdir, "store"))
+    build = join(tmpdir, "build")
+    write_file(join(build, "data.txt"), "data")
+    for i in range(3):
+        store.save("key" + str(i), ["data.txt"], root=build)
+    archives = sorted(os.listdir(join(store.path, "archives")))
+    size = os.stat(join(store.path, "archives", archives[0])).st_size
+
+    # key0 is the least recently used once key1 and key2 have been restored
+    for i, key in enumerate(["key0", "key1", "key2"]):
+        assert store.restore(key, join(tmpdir, "dest"))
+        past = 1000000 + i
+        os.utime(store._archive_fn(key), (past, past))
+
+    store.evict(max_size=2 * size)
+    assert not store.restore("key0", join(tmpdir, "dest"))
+    assert store.restore("key1", join(tmpdir, "dest"))
+    assert store.restore("key2", join(tmpdir, "dest"))
+    store.evict(max_size=0)
+    assert os.listdir(join(store.path, "archives")) == []
+    assert os.listdir(join(store.path, "trees")) == []
+
+
+@run_test_with_tmpdir
+def test_store_eviction_trees(tmpdir):
+    store = LocalCacheStore(join(tmpdir, "store"))
+    build = join(tmpdir, "build")
+    write_file(join(build, "data.txt"), "data" * 1000)
+    store.save("key", ["data.txt"], root=build)
+    (archive,) = os.listdir(join(store.path, "archives"))
+    size = os.stat(join(store.path, "archives", archive)).st_size
+    assert store.restore("key", join(tmpdir, "dest"), hardlink=True)
+
+    # Trees without an archive are removed
+    os.makedirs(join(store.path, "trees", "orphan"))
+    store.evict(max_size=size + 4000)
+    assert os.listdir(join(store.path, "trees")) == [store._name("key")]
+
+    # The unpacked tree counts towards the size of the cache
+    store.evict(max_size=size + 3999)
+    assert os.listdir(join(store.path, "archives")) == []
+    assert os.listdir(join(store.path, "trees")) == []
+
+
+@gitlab_api.use(n_pending=2)
+@run_test_with_tmpdir
+def test_job_caches(gitlab_api, tmpdir):
+    gitlab_api.pending_jobs[0]["cache"] = [
+        {"key": "$CI_COMMIT_REF_NAME", "paths": ["vendor/"], "policy": "pull-push"},
+        {"key": "push-only", "paths": ["out/"], "policy": "push", "when": "always"},
+    ]
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    assert [c.key for c in job.caches] == ["master", "push-only"]
+    store = LocalCacheStore(join(tmpdir, "store"))
+
+    build = join(tmpdir, "build")
+    assert job.restore_caches(store, build) == []
+    write_file(join(build, "vendor", "a.txt"), "a")
+    write_file(join(build, "out", "b.txt"), "b")
+    assert job.save_caches(store, build, state="failed") == ["push-only"]
+    assert job.save_caches(store, build) == ["master", "push-only"]
+
+    dest = join(tmpdir, "dest")
+    assert job.restore_caches(store, dest) == ["master"]
+    assert read_file(join(dest, "vendor", "a.txt")) == "a"
+    assert not exists(join(dest, "out"))
+
+    # The fake API's default job has no caches
+    assert runner.request_job().caches == []
@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.utils.compression import compress, decompress
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate"])
+def test_roundtrip(encoding):
+    data = "Some log output\n" * 1000
+    compressed = compress(data, encoding)
+    assert len(compressed) < len(data) / 10
+    assert decompress(compressed, encoding) == data.encode("utf-8")
+
+
+def test_bad_encoding():
+    with pytest.raises(ValueError):
+        compress(b"data", "br")
+    with pytest.raises(ValueError):
+        decompress(b"data", "br")
+
+
+@gitlab_api.use(n_pending=2)
+def test_compressed_log(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    for encoding in ["gzip", "deflate"]:
+        job = runner.request_job()
+        job.content_encoding = encoding
+        fake_job = gitlab_api.running_jobs[-1]
+
+        job.log += "First line\n"
+        job.log += "Second line\n" * 100
+        assert job.content_encoding == encoding
+        assert fake_job.log == str(job.log)
+
+        job.log += "Finished\n"
+        job.set_success()
+        assert job.content_encoding == encoding
+        assert fake_job.log == str(job.log)
+        assert fake_job.status == "success"
+
+
+@gitlab_api.use(n_pending=1)
+def test_compression_fallback(gitlab_api):
+    gitlab_api.supported_encodings = []
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    job.content_encoding = "gzip"
+
+    job.log += "First line\n"
+    assert job.content_encoding is None
+    assert gitlab_api.running_jobs[0].log == str(job.log)
+
+    job.content_encoding = "deflate"
+    job.set_failed()
+    assert job.content_encoding is None
+    assert gitlab_api.completed_jobs[0].log == str(job.log)
+    assert gitlab_api.completed_jobs[0].status == "failed"
+
+
+@gitlab_api.use(n_pending=1)
+def test_invalid_content_encoding(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    with pytest.raises(ValueError):
+        job.content_encoding = "br"
+    assert job.content_encoding is None
+
+
+@gitlab_api.use(n_pending=1)
+def test_unrelated_error_keeps_compression(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    job.content_encoding = "gzip"
+    gitlab_api.running_jobs[0].valid_failure_reasons = []
+
+    with pytest.raises(NotImplementedError):
+        job.set_failed()
+    assert job.content_encoding == "gzip"
+    puts = [c for c in gitlab_api._rsps.calls if c.request.method == "PUT"]
+    assert len(puts) == 1
@@ -61,3 +61,21 @@ def test_request_init_with_artifacts(caplog):
             pass
 
         tmp(caplog)
+
+
+@gitlab_api.use(n_runners=1, n_pending=2, n_running=2, n_success=1)
+def test_job_indexes(gitlab_api):
+    assert [j["name"] for j in gitlab_api.pending_jobs] == ["MyJob0", "MyJob1"]
+    gitlab_api.add_pending_job({"name": "Extra"})
+    assert len(gitlab_api.pending_jobs) == 3
+
+    first, second = gitlab_api.running_jobs
+    (done,) = gitlab_api.completed_jobs
+    second.status = "canceled"
+    assert gitlab_api.running_jobs == [first]
+    assert gitlab_api.completed_jobs == [done, second]
+
+    # Jobs can be moved back to running
+    done.status = "running"
+    assert gitlab_api.running_jobs == [first, done]
+    assert gitlab_api.completed_jobs == [second]
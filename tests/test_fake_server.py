@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+import threading
+import time
+
+import requests
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.testing import FakeGitlabAPI, run_test_with_tmpdir
+
+gitlab_api = FakeGitlabAPI()
+
+
+class SlowBody(object):
+    """Request body which waits for resume to be set before it finishes"""
+
+    def __init__(self, data, resume):
+        self.len = len(data)
+        self._chunks = [data[:10], data[10:]]
+        self._resume = resume
+        self.started = threading.Event()
+        self.finished = False
+
+    def read(self, size=-1):
+        if len(self._chunks) == 1:
+            self.started.set()
+            self._resume.wait(5)
+            self.finished = True
+        return self._chunks.pop(0) if self._chunks else b""
+
+
+@gitlab_api.use(n_pending=2, serve=True)
+@run_test_with_tmpdir
+def test_job_lifecycle(gitlab_api, tmpdir):
+    assert gitlab_api.url.startswith("http://127.0.0.1:")
+    runner = Runner.register(gitlab_api.url, gitlab_api.token)
+    job = runner.request_job()
+    job.log += "Some output\n"
+    job.content_encoding = "gzip"
+    job.log += "More output\n"
+    assert gitlab_api.running_jobs[0].log == str(job.log)
+
+    artifact_fn = join(tmpdir, "artifacts.zip")
+    with open(artifact_fn, "wb") as fp:
+        fp.write(b"PK" + b"x" * 1000)
+    job.set_success(artifacts=artifact_fn)
+    completed = gitlab_api.completed_jobs[0]
+    assert completed.status == "success"
+    assert completed.log == str(job.log)
+    assert completed.file_data == b"PK" + b"x" * 1000
+
+    dest = join(tmpdir, "downloaded.zip")
+    assert job.download_artifacts(job.id, job.token, dest) == (
+        completed.artifact_sha_hash
+    )
+
+    # No jobs left
+    assert runner.request_job() is not None
+    assert runner.request_job() is None
+
+
+@gitlab_api.use(serve=True)
+def test_unknown_path(gitlab_api):
+    response = requests.get(gitlab_api.url + "/api/v4/unknown")
+    assert response.status_code == 404
+
+
+@gitlab_api.use(n_pending=200, serve=True)
+def test_concurrent_requests(gitlab_api):
+    runner = Runner.register(gitlab_api.url, gitlab_api.token)
+
+    def run_job(_):
+        job = runner.request_job()
+        job.log += "Running\n"
+        job.set_success()
+        return job.id
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        job_ids = list(executor.map(run_job, range(200)))
+    assert len(set(job_ids)) == 200
+    assert len(gitlab_api.completed_jobs) == 200
+    assert len(gitlab_api.pending_jobs) == 0
+
+
+@gitlab_api.use(n_runners=1, n_running=1, serve=True)
+def test_job_routes(gitlab_api):
+    (job,) = gitlab_api.running_jobs
+    url = gitlab_api.url + "/api/v4/jobs/" + job.id
+    response = requests.put(url, json={"token": job.token, "state": "success"})
+    assert response.status_code == 200
+    assert job.status == "success"
+
+    response = requests.put(url + "1", json={"token": job.token})
+    assert response.status_code == 404
+
+
+@gitlab_api.use(n_pending=1, serve=True)
+def test_slow_upload(gitlab_api):
+    runner = Runner.register(gitlab_api.url, gitlab_api.token)
+    job = runner.request_job()
+    prepared = requests.Request(
+        "POST", gitlab_api.url, files={"file": ("artifacts.zip", b"PK" * 1000)}
+    ).prepare()
+    resume = threading.Event()
+    body = SlowBody(prepared.body, resume)
+    responses = []
+
+    def upload():
+        responses.append(
+            requests.post(
+                gitlab_api.url + "/api/v4/jobs/" + str(job.id) + "/artifacts",
+                data=body,
+                headers={
+                    "Content-Type": prepared.headers["Content-Type"],
+                    "JOB-TOKEN": job.token,
+                },
+            )
+        )
+
+    thread = threading.Thread(target=upload)
+    thread.start()
+    try:
+        assert body.started.wait(5)
+        time.sleep(0.1)
+        # Other requests are handled while the upload is being received
+        job.log += "Still running\n"
+        assert not body.finished
+    finally:
+        resume.set()
+        thread.join()
+    assert responses[0].status_code == 201
+    assert gitlab_api.running_jobs[0].file_data == b"PK" * 1000
@@ -0,0 +1,103 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest
+import requests
+
+from gitlab_runner_api import JobCancelledException, Runner
+from gitlab_runner_api.testing import API_ENDPOINT, FakeGitlabAPI, FaultInjector
+
+
+def verify_status_codes(gitlab_api, n):
+    token = list(gitlab_api.runners.keys())[0]
+    status_codes = []
+    for _ in range(n):
+        response = requests.post(
+            API_ENDPOINT + "/runners/verify", json={"token": token}
+        )
+        status_codes.append(response.status_code)
+        if response.status_code != 200:
+            assert response.headers["Retry-After"] == "2"
+    return status_codes
+
+
+def test_errors_reproducible():
+    faults = FaultInjector(seed=42, error_rate=0.3, retry_after=2)
+    results = []
+    for _ in range(2):
+        with FakeGitlabAPI(n_runners=1, faults=faults) as gitlab_api:
+            results.append(verify_status_codes(gitlab_api, 50))
+    assert results[0] == results[1]
+    assert set(results[0]) - {200} <= {500, 502, 503, 429}
+    assert 5 < faults.injected["error"] < 30
+    assert faults.injected["error"] == sum(c != 200 for c in results[0])
+
+    faults.seed = 7
+    with FakeGitlabAPI(n_runners=1, faults=faults) as gitlab_api:
+        assert verify_status_codes(gitlab_api, 50) != results[0]
+
+
+def test_conflicts():
+    faults = FaultInjector(seed=1, conflict_rate=0.5)
+    with FakeGitlabAPI(n_pending=20, faults=faults) as gitlab_api:
+        runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+        jobs = [runner.request_job() for _ in range(20)]
+    n_conflicts = sum(job is None for job in jobs)
+    assert n_conflicts == faults.injected["conflict"]
+    assert 0 < n_conflicts < 20
+    assert len(gitlab_api.pending_jobs) == n_conflicts
+
+
+def test_range_errors():
+    faults = FaultInjector(seed=3, range_error_rate=0.5)
+    with FakeGitlabAPI(n_pending=1, faults=faults) as gitlab_api:
+        runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+        job = runner.request_job()
+        for i in range(10):
+            job.log += "Line " + str(i) + "\n"
+        # The client resends the full log after each rejected patch
+        assert gitlab_api.running_jobs[0].log == str(job.log)
+    assert faults.injected["range_error"] > 0
+
+
+def test_cancellation():
+    faults = FaultInjector(seed=5, cancel_rate=0.2)
+    with FakeGitlabAPI(n_pending=1, faults=faults) as gitlab_api:
+        runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+        job = runner.request_job()
+        with pytest.raises(JobCancelledException):
+            for _ in range(100):
+                job.log += "More output\n"
+        assert job.is_cancelled
+        assert gitlab_api.completed_jobs[0].status == "canceled"
+    assert faults.injected["cancel"] == 1
+
+
+def test_latency():
+    faults = FaultInjector(seed=0, latency=lambda rng: rng.uniform(0.01, 0.02))
+    with FakeGitlabAPI(n_runners=1, faults=faults) as gitlab_api:
+        start = time.time()
+        verify_status_codes(gitlab_api, 5)
+        assert time.time() - start >= 0.05
+    assert faults.injected["latency"] == 5
+
+
+def test_latency_served():
+    faults = FaultInjector(latency=0.2)
+    with FakeGitlabAPI(n_runners=1, serve=True, faults=faults) as gitlab_api:
+        token = list(gitlab_api.runners.keys())[0]
+
+        def verify(_):
+            return requests.post(
+                gitlab_api.url + "/api/v4/runners/verify", json={"token": token}
+            ).status_code
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            assert list(executor.map(verify, range(8))) == [200] * 8
+        # Requests are delayed concurrently
+        assert 0.2 <= time.time() - start < 1
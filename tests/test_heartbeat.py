@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+import threading
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.heartbeat import monitor
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+@gitlab_api.use(n_pending=1)
+def test_heartbeat_cancelled(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    cancelled = threading.Event()
+    job.start_heartbeat(interval=0.05, on_cancel=lambda j: cancelled.set())
+    try:
+        assert not cancelled.wait(0.2)
+        assert not job.is_cancelled
+
+        gitlab_api.running_jobs[0].status = "canceled"
+        assert cancelled.wait(5)
+        assert job.is_cancelled
+        assert len(monitor) == 0
+    finally:
+        job.stop_heartbeat()
+
+
+@gitlab_api.use(n_pending=1)
+def test_heartbeat_canceling(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    cancelled = threading.Event()
+    job.start_heartbeat(interval=0.05, on_cancel=lambda j: cancelled.set())
+    try:
+        gitlab_api.running_jobs[0].status = "canceling"
+        assert cancelled.wait(5)
+        assert job.is_cancelled
+        # Jobs which are being cancelled can still be authenticated
+        job.auth()
+    finally:
+        job.stop_heartbeat()
+
+
+@gitlab_api.use(n_pending=2)
+def test_heartbeat_shared_thread(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    jobs = [runner.request_job(), runner.request_job()]
+    try:
+        for job in jobs:
+            job.start_heartbeat(interval=60)
+        assert len(monitor) == 2
+        threads = [
+            t
+            for t in threading.enumerate()
+            if t.name == "gitlab-runner-api-heartbeat"
+        ]
+        assert len(threads) == 1
+
+        # Finishing a job stops its heartbeat
+        jobs[0].set_success()
+        assert len(monitor) == 1
+    finally:
+        for job in jobs:
+            job.stop_heartbeat()
+    assert len(monitor) == 0
+
+
+@gitlab_api.use(n_pending=1)
+def test_log_canceling(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    calls = []
+    job.on_cancel = calls.append
+
+    job.log += "Running\n"
+    assert not job.is_cancelled
+
+    gitlab_api.running_jobs[0].status = "canceling"
+    job.log += "Still running\n"
+    assert job.is_cancelled
+    assert calls == [job]
+
+    with pytest.raises(TypeError):
+        job.on_cancel = "not callable"
+
+
+@gitlab_api.use(n_pending=1)
+def test_cancelled_once(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    calls = []
+    job.on_cancel = calls.append
+
+    # The heartbeat and the main thread can both find the job was cancelled
+    threads = [threading.Thread(target=job._set_cancelled) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [job]
@@ -0,0 +1,42 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import subprocess
+import sys
+
+import pytest
+
+import gitlab_runner_api
+
+
+def imported_modules(statement):
+    output = subprocess.check_output(
+        [sys.executable, "-c", statement + "; import sys; print(sorted(sys.modules))"]
+    )
+    return output.decode()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="Requires PEP 562")
+def test_lazy_import():
+    modules = imported_modules("import gitlab_runner_api")
+    for name in ["requests", "colorlog", "pkg_resources", "gitlab_runner_api.job"]:
+        assert "'" + name + "'" not in modules
+
+
+def test_testing_not_imported():
+    modules = imported_modules("import gitlab_runner_api")
+    for name in ["responses", "gitlab_runner_api.testing", "gitlab_runner_api.cli"]:
+        assert "'" + name + "'" not in modules
+
+
+def test_lazy_attributes():
+    assert gitlab_runner_api.Job.__name__ == "Job"
+    assert gitlab_runner_api.utils.Retrier.__name__ == "Retrier"
+    assert gitlab_runner_api.__version__
+    assert "Runner" in dir(gitlab_runner_api)
+    with pytest.raises(AttributeError):
+        gitlab_runner_api.missing_attribute
+    namespace = {}
+    exec("from gitlab_runner_api import *", namespace)
+    assert set(gitlab_runner_api.__all__) <= set(namespace)
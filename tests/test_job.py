@@ -15,7 +15,7 @@ from gitlab_runner_api import (
     Runner,
     failure_reasons,
 )
-from gitlab_runner_api.testing import FakeGitlabAPI
+from gitlab_runner_api.testing import FakeGitlabAPI, run_test_with_artifact
 
 
 gitlab_api = FakeGitlabAPI()
@@ -207,6 +207,56 @@ def test_set_success_with_log(gitlab_api):
     check_finished(1, 0, 1, "success", "test log text", None)
 
 
+@gitlab_api.use(n_pending=2)
+def test_log_sections(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    with job.log.section("build", header="Building", collapsed=True):
+        job.log += "Compiling\n"
+        with job.log.section("tests"):
+            job.log += "Testing\n"
+    job.log += "Done\n"
+    with job.log.section("cleanup"):
+        pass
+    with pytest.raises(ValueError):
+        with job.log.section("bad name"):
+            pass
+
+    # Markers are sent with the text so each append is a single request
+    patches = [c for c in gitlab_api._rsps.calls if c.request.method == "PATCH"]
+    assert len(patches) == 3
+    assert list(job.log.section_durations) == ["tests", "build", "cleanup"]
+    assert all(d >= 0 for d in job.log.section_durations.values())
+
+    job.set_success()
+    log = gitlab_api.completed_jobs[0].log
+    lines = log.split("\n")
+    assert lines[1].startswith("\033[0Ksection_start:")
+    assert lines[1].endswith(":build[collapsed=true]\r\033[0KBuilding")
+    assert lines[3].endswith(":tests\r\033[0Ktests")
+    assert lines[5].startswith("\033[0Ksection_end:")
+    assert lines[5].endswith(":build\r\033[0KDone")
+    assert log.endswith(":cleanup\r\033[0K")
+    assert log.count("section_start:") == log.count("section_end:") == 3
+
+
+@gitlab_api.use(n_pending=1)
+def test_log_sections_dumps(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+
+    # Markers which haven't been sent yet are kept when the job is serialised
+    with job.log.section("build"):
+        loaded = Job.loads(job.dumps())
+    loaded.log += "Building\n"
+    assert gitlab_api.running_jobs[0].log.endswith(":build\r\033[0Kbuild\nBuilding\n")
+
+    loaded = Job.loads(job.dumps())
+    loaded.set_success()
+    assert gitlab_api.completed_jobs[0].log.endswith(":build\r\033[0K")
+
+
 @gitlab_api.use(n_pending=2)
 def test_bad_log(gitlab_api):
     runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
@@ -221,13 +271,28 @@ def test_bad_log(gitlab_api):
     assert len(gitlab_api.completed_jobs) == 0
 
 
-@pytest.mark.xfail(raises=NotImplementedError)
 @gitlab_api.use(n_pending=2)
-def test_set_success_with_artifacts(gitlab_api):
+def test_set_success_with_no_artifacts(gitlab_api):
     runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
     job = runner.request_job()
     job.set_success(artifacts=[])
 
+    # Check the API's internal state
+    check_finished(1, 0, 1, "success", "", None)
+    assert gitlab_api.completed_jobs[0].file_data is None
+
+
+@gitlab_api.use(n_pending=2)
+@run_test_with_artifact
+def test_set_success_with_artifacts(gitlab_api, artifact_fn, artifact_hash):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    job.set_success(artifacts=artifact_fn)
+
+    # Check the API's internal state
+    check_finished(1, 0, 1, "success", "", None)
+    assert gitlab_api.completed_jobs[0].artifact_sha_hash == artifact_hash
+
 
 # Test setting job status as failed
 @gitlab_api.use(n_pending=2)
@@ -281,13 +346,28 @@ def test_set_failed_with_log(gitlab_api):
     check_finished(1, 0, 1, "failed", "test log text", "unknown_failure")
 
 
-@pytest.mark.xfail(raises=NotImplementedError)
 @gitlab_api.use(n_pending=2)
-def test_set_failed_with_artifacts(gitlab_api):
+def test_set_failed_with_no_artifacts(gitlab_api):
     runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
     job = runner.request_job()
     job.set_failed(artifacts=[])
 
+    # Check the API's internal state
+    check_finished(1, 0, 1, "failed", "", "unknown_failure")
+    assert gitlab_api.completed_jobs[0].file_data is None
+
+
+@gitlab_api.use(n_pending=2)
+@run_test_with_artifact
+def test_set_failed_with_artifacts(gitlab_api, artifact_fn, artifact_hash):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    job.set_failed(artifacts=artifact_fn)
+
+    # Check the API's internal state
+    check_finished(1, 0, 1, "failed", "", "unknown_failure")
+    assert gitlab_api.completed_jobs[0].artifact_sha_hash == artifact_hash
+
 
 @gitlab_api.use(n_pending=10)
 def test_set_failed_reason(gitlab_api):
@@ -325,3 +405,17 @@ def test_set_failed_reason(gitlab_api):
     assert len(gitlab_api.pending_jobs) == 3
     assert len(gitlab_api.running_jobs) == 1
     assert len(gitlab_api.completed_jobs) == 6
+
+
+@gitlab_api.use(n_pending=1)
+def test_log_unicode(gitlab_api):
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    fake_job = gitlab_api.running_jobs[0]
+    for i in range(3):
+        job.log += u"é✓ line " + str(i) + "\n"
+        assert fake_job.log == str(job.log)
+    job.content_encoding = "gzip"
+    job.log += u"é compressed\n"
+    assert fake_job.log == str(job.log)
+    assert fake_job.log_size == len(str(job.log).encode("utf-8"))
@@ -68,3 +68,4 @@ def test_variables(gitlab_api):
         assert api_var["key"] == job_variable.key
         assert api_var["value"] == job_variable.value
         assert api_var["public"] is job_variable.is_public
+        assert api_var["masked"] is job_variable.is_masked
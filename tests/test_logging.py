@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import logging
+import subprocess
+import sys
+
+import six
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.logging import configure, logger, truncate
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+def test_no_handler_at_import():
+    handlers = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "import logging; from gitlab_runner_api import Job; "
+            "print([type(h).__name__ for h in "
+            "logging.getLogger('gitlab_runner_api').handlers])",
+        ]
+    )
+    assert handlers.decode().strip() == "['NullHandler']"
+
+
+def test_configure_json():
+    stream = six.StringIO()
+    handler = configure(level=logging.DEBUG, json_format=True, stream=stream)
+    try:
+        logger.debug("Job %d: Something happened", 123)
+        # Configuring again replaces the handler
+        handler = configure(json_format=True, stream=stream)
+        logger.debug("Not shown")
+        logger.warning("Shown")
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(logging.INFO)
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [r["message"] for r in records] == ["Job 123: Something happened", "Shown"]
+    assert [r["level"] for r in records] == ["DEBUG", "WARNING"]
+    assert records[0]["name"] == "gitlab_runner_api"
+
+
+def test_truncate():
+    assert truncate("short") == "short"
+    assert truncate("x" * 250) == "x" * 200 + "... (50 more characters)"
+    assert truncate("abcdef", length=3) == "abc... (3 more characters)"
+
+
+@gitlab_api.use(n_pending=1)
+def test_debug_log_truncated(gitlab_api):
+    stream = six.StringIO()
+    handler = configure(level=logging.DEBUG, json_format=True, stream=stream)
+    try:
+        runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+        assert runner.netloc == "gitlab.cern.ch"
+        job = runner.request_job()
+        job.log += "y" * 10000
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(logging.INFO)
+
+    messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+    (appended,) = [m for m in messages if "Appending to log" in m]
+    assert appended.endswith("... (9800 more characters)")
+    assert "Patched 10000 characters to Job" in "\n".join(messages)
@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from gitlab_runner_api import Job, Runner
+from gitlab_runner_api.job import EnvVar, JobLog
+from gitlab_runner_api.utils.masking import SecretMasker
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+def mask_chunks(secrets, chunks):
+    masker = SecretMasker(secrets)
+    return "".join(masker.mask(chunk) for chunk in chunks) + masker.flush()
+
+
+def test_no_secrets():
+    masker = SecretMasker([])
+    assert not masker
+    assert masker.mask("some text") == "some text"
+    assert masker.flush() == ""
+
+
+def test_mask():
+    secrets = ["password123", "s3cr3t-token"]
+    text = "login password123 and s3cr3t-token then password123\n"
+    expected = "login [MASKED] and [MASKED] then [MASKED]\n"
+    assert mask_chunks(secrets, [text]) == expected
+    # Split the text at every possible point
+    for i in range(len(text)):
+        assert mask_chunks(secrets, [text[:i], text[i:]]) == expected
+    assert mask_chunks(secrets, list(text)) == expected
+
+
+def test_overlapping():
+    assert mask_chunks(["abcd", "cdef"], ["xxabcdefxx"]) == "xx[MASKED]xx"
+    assert mask_chunks(["abcd", "bc"], ["abc", "xbcd"]) == "a[MASKED]x[MASKED]d"
+    assert mask_chunks(["aaab"], ["aa", "aa", "ab"]) == "aa[MASKED]"
+
+
+def test_hold_back():
+    masker = SecretMasker(["password123"])
+    assert masker.mask("login pass") == "login "
+    assert masker.mask("port") == "passport"
+    assert masker.mask(" password") == " "
+    assert masker.flush() == "password"
+
+
+@gitlab_api.use(n_pending=1)
+def test_job_log(gitlab_api):
+    gitlab_api.pending_jobs[0]["variables"] = [
+        {"key": "SECRET", "value": "hunter2hunter2", "public": False, "masked": True},
+        {"key": "SHORT", "value": "abc", "public": False, "masked": True},
+        {"key": "VISIBLE", "value": "not-a-secret", "public": False},
+    ]
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    fake_job = gitlab_api.running_jobs[0]
+
+    job.log += "Using hunter2"
+    assert "hunter2" not in fake_job.log
+    job.log += "hunter2 for not-a-secret and abc\n"
+    assert fake_job.log.endswith("Using [MASKED] for not-a-secret and abc\n")
+
+    job.log += "Ends with hunter2hunt"
+    job.set_success()
+    assert fake_job.log.endswith("Ends with hunter2hunt")
+    assert "hunter2hunter2" not in str(job.log)
+
+
+@gitlab_api.use(n_pending=1)
+def test_job_log_dumps(gitlab_api):
+    gitlab_api.pending_jobs[0]["variables"] = [
+        {"key": "SECRET", "value": "hunter2hunter2", "public": False, "masked": True},
+    ]
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    fake_job = gitlab_api.running_jobs[0]
+
+    # Text which is held back is kept when the job is serialised
+    job.log += "Using hunter2"
+    job = Job.loads(job.dumps())
+    assert job.log.masker
+    job.log += "hunter2 for the job\n"
+    assert fake_job.log.endswith("Using [MASKED] for the job\n")
+    assert "hunter2" not in fake_job.log
+
+    job.log += "Ends with hunter2"
+    job = Job.loads(job.dumps())
+    job.set_success()
+    assert fake_job.log.endswith("Ends with hunter2")
+
+
+def test_masker_before_parsing():
+    job = Job.__new__(Job)
+    log = JobLog(job, "")
+    assert not log.masker
+    # The masker is only cached once the job's variables are known
+    job._variables = {"SECRET": EnvVar("SECRET", "hunter2hunter2", masked=True)}
+    assert log.masker
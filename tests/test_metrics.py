@@ -0,0 +1,109 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+
+from gitlab_runner_api import Runner, metrics
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+@gitlab_api.use(n_pending=1)
+def test_histogram_collector(gitlab_api):
+    collector = metrics.HistogramCollector()
+    metrics.add_collector(collector)
+    try:
+        runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+        job = runner.request_job()
+        job.log += "Some output\n"
+        job.set_success()
+    finally:
+        metrics.remove_collector(collector)
+    # Requests are no longer recorded once the collector is removed
+    runner.check_auth()
+
+    assert collector.count("runners") == 1
+    assert collector.count("runners/verify") == 1
+    assert collector.count("jobs/request") == 1
+    assert collector.count("jobs/request", status_code=201) == 1
+    assert collector.count("jobs/:id/trace", method="PATCH") == 1
+    assert collector.count("jobs/:id", method="PUT", status_code=200) == 1
+    assert collector.bytes_sent("jobs/:id/trace") == len(str(job.log))
+    assert collector.bytes_received("jobs/request") > 0
+    assert collector.retries("jobs/:id/trace") == 0
+
+    text = collector.to_prometheus()
+    assert "# TYPE gitlab_runner_api_request_duration_seconds histogram" in text
+    assert (
+        'gitlab_runner_api_request_duration_seconds_count{endpoint="jobs/request",'
+        'method="POST",status="201"} 1\n'
+    ) in text
+    assert (
+        'gitlab_runner_api_request_duration_seconds_bucket{endpoint="runners",'
+        'method="POST",status="201",le="+Inf"} 1\n'
+    ) in text
+
+    collector.reset()
+    assert collector.count("runners") == 0
+
+
+@gitlab_api.use(n_pending=1)
+def test_retries(gitlab_api):
+    gitlab_api.supported_encodings = []
+    collector = metrics.HistogramCollector()
+    metrics.add_collector(collector)
+    try:
+        runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+        job = runner.request_job()
+        job.content_encoding = "gzip"
+        job.log += "Some output\n"
+    finally:
+        metrics.remove_collector(collector)
+
+    assert collector.retries("jobs/:id/trace") == 1
+    assert collector.count("jobs/:id/trace", status_code=415) == 1
+    assert collector.count("jobs/:id/trace", status_code=202) == 1
+    assert 'gitlab_runner_api_retries_total{endpoint="jobs/:id/trace"} 1\n' in (
+        collector.to_prometheus()
+    )
+
+
+def test_buckets():
+    collector = metrics.HistogramCollector(buckets=[1, 0.1])
+    for duration in [0.05, 0.5, 0.5, 5]:
+        collector.observe("jobs/:id", "PUT", 200, duration, 10, 20)
+    collector.observe("jobs/:id", "PUT", None, 0.01, 0, 0)
+
+    lines = collector.to_prometheus(prefix="test").splitlines()
+    labels = 'endpoint="jobs/:id",method="PUT",status="200"'
+    assert "test_request_duration_seconds_bucket{" + labels + ',le="0.1"} 1' in lines
+    assert "test_request_duration_seconds_bucket{" + labels + ',le="1.0"} 3' in lines
+    assert "test_request_duration_seconds_bucket{" + labels + ',le="+Inf"} 4' in lines
+    assert "test_request_duration_seconds_sum{" + labels + "} 6.05" in lines
+    assert collector.count("jobs/:id", status_code=200) == 4
+    assert collector.count("jobs/:id") == 5
+    assert 'test_request_bytes_total{endpoint="jobs/:id",method="PUT"} 40' in lines
+    assert 'test_response_bytes_total{endpoint="jobs/:id",method="PUT"} 80' in lines
+
+
+def test_add_collector():
+    with pytest.raises(TypeError):
+        metrics.add_collector(object())
+
+    class FailingCollector(metrics.Collector):
+        def observe(self, *args):
+            raise RuntimeError()
+
+    # Exceptions from collectors are logged rather than raised
+    collector = FailingCollector()
+    metrics.add_collector(collector)
+    metrics.add_collector(collector)
+    try:
+        metrics._notify("observe", "runners", "POST", 201, 0.1, 0, 0)
+        assert metrics._collectors == [collector]
+    finally:
+        metrics.remove_collector(collector)
+    assert metrics._collectors == []
@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import os
+from os.path import join
+import tracemalloc
+
+import pytest
+import requests
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.testing import FakeGitlabAPI, run_test_with_tmpdir
+from gitlab_runner_api.testing.multipart import parse_multipart, UploadedFile
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+def encode(fields, files):
+    request = requests.Request(
+        "POST", "https://example.com", data=fields, files=files
+    ).prepare()
+    return request.body, request.headers["Content-Type"]
+
+
+@run_test_with_tmpdir
+def test_parse(tmpdir):
+    data = os.urandom(10000) + b"\r\n--"
+    body, content_type = encode(
+        {"expire_in": "1 hour", "other": u"välue"}, {"file": ("a.zip", data)}
+    )
+    # Small chunks check delimiters which are split between reads
+    for chunk_size in [1, 7, 64, 100000]:
+        parts = parse_multipart(body, content_type, tmpdir, chunk_size=chunk_size)
+        assert parts["expire_in"] == "1 hour"
+        assert parts["other"] == u"välue"
+        uploaded = parts["file"]
+        assert isinstance(uploaded, UploadedFile)
+        assert uploaded.filename == "a.zip"
+        assert uploaded.size == len(data)
+        assert uploaded.sha256 == hashlib.sha256(data).hexdigest()
+        with open(uploaded.path, "rb") as fp:
+            assert fp.read() == data
+
+
+@run_test_with_tmpdir
+def test_parse_invalid(tmpdir):
+    body, content_type = encode({}, {"file": ("a.zip", b"data")})
+    with pytest.raises(ValueError):
+        parse_multipart(body, "multipart/form-data", tmpdir)
+    with pytest.raises(ValueError):
+        parse_multipart(body[:-10], content_type, tmpdir)
+    # Partially written files are removed
+    assert os.listdir(tmpdir) == []
+
+
+@gitlab_api.use(n_pending=1, serve=True)
+@run_test_with_tmpdir
+def test_large_upload(gitlab_api, tmpdir):
+    size = 32 * 1024**2
+    artifact_fn = join(tmpdir, "artifacts.zip")
+    hasher = hashlib.sha256()
+    with open(artifact_fn, "wb") as fp:
+        for _ in range(size // 1024**2):
+            chunk = os.urandom(1024**2)
+            hasher.update(chunk)
+            fp.write(chunk)
+
+    runner = Runner.register(gitlab_api.url, gitlab_api.token)
+    job = runner.request_job()
+    tracemalloc.start()
+    try:
+        job.set_success(artifacts=artifact_fn)
+        dest = join(tmpdir, "downloaded.zip")
+        assert job.download_artifacts(job.id, job.token, dest) == hasher.hexdigest()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < size // 4
+
+    (completed,) = gitlab_api.completed_jobs
+    assert completed.file_size == size
+    assert completed.artifact_sha_hash == hasher.hexdigest()
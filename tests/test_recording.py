@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+import json
+from os.path import join
+import time
+
+import pytest
+import requests
+
+from gitlab_runner_api import recording, Runner, transport
+from gitlab_runner_api.testing import FakeGitlabAPI, FaultInjector, run_test_with_tmpdir
+
+
+def run_job(url, token):
+    runner = Runner.register(url, token)
+    job = runner.request_job()
+    job.log += "Hello from the job\n"
+    job.set_success()
+    return runner, job
+
+
+@run_test_with_tmpdir
+def test_record_and_replay(tmpdir):
+    fn = join(tmpdir, "traffic.jsonl.gz")
+    with FakeGitlabAPI(n_pending=1) as gitlab_api:
+        with recording.record(fn) as recorder:
+            assert transport.get_transport() is recorder
+            runner, job = run_job(gitlab_api.url, gitlab_api.token)
+        assert transport.get_transport() is transport.DEFAULT_TRANSPORT
+
+    with gzip.open(fn, "rb") as fp:
+        text = fp.read().decode("utf-8")
+    entries = [json.loads(line) for line in text.splitlines()]
+    assert [e["method"] for e in entries] == ["POST", "POST", "POST", "PATCH", "PUT"]
+    for secret in [gitlab_api.token, runner.token, job.token]:
+        assert secret not in text
+    assert "REDACTED" in text
+    assert "Hello from the job" in text
+
+    # The API is no longer available so every response comes from the file
+    with recording.replay(fn, speed=None) as replayer:
+        assert len(replayer) == 5
+        replayed_runner, replayed_job = run_job("https://gitlab.invalid", "REDACTED1")
+        assert len(replayer) == 0
+        with pytest.raises(requests.ConnectionError):
+            replayed_runner.request_job()
+    assert replayed_job.id == job.id
+    assert replayed_job.state == "success"
+
+
+@run_test_with_tmpdir
+def test_replay_timing(tmpdir):
+    fn = join(tmpdir, "traffic.jsonl.gz")
+    faults = FaultInjector(latency=0.05)
+    with FakeGitlabAPI(n_pending=1, faults=faults) as gitlab_api:
+        with recording.record(fn):
+            run_job(gitlab_api.url, gitlab_api.token)
+
+    with gzip.open(fn, "rb") as fp:
+        entries = [json.loads(line.decode("utf-8")) for line in fp]
+    recorded = sum(e["duration"] for e in entries)
+    assert recorded >= 5 * 0.05
+
+    for speed in [1, 4]:
+        with recording.replay(fn, speed=speed):
+            start = time.time()
+            run_job("https://gitlab.invalid", "REDACTED1")
+            duration = time.time() - start
+        assert duration >= recorded / speed
+        assert duration < recorded / speed + 0.1
+
+
+@run_test_with_tmpdir
+def test_record_without_redaction(tmpdir):
+    fn = join(tmpdir, "traffic.jsonl.gz")
+    with FakeGitlabAPI(n_pending=1) as gitlab_api:
+        with recording.record(fn, redact=False):
+            runner, job = run_job(gitlab_api.url, gitlab_api.token)
+
+    with gzip.open(fn, "rb") as fp:
+        text = fp.read().decode("utf-8")
+    assert runner.token in text
+    assert job.token in text
+    assert "REDACTED" not in text
+
+
+@run_test_with_tmpdir
+def test_record_compressed(tmpdir):
+    for serve in [False, True]:
+        fn = join(tmpdir, "traffic-" + str(serve) + ".jsonl.gz")
+        with FakeGitlabAPI(n_pending=1, serve=serve) as gitlab_api:
+            with recording.record(fn):
+                runner = Runner.register(gitlab_api.url, gitlab_api.token)
+                job = runner.request_job()
+                job.content_encoding = "gzip"
+                job.log += "Hello from the job\n"
+                job.set_success()
+            assert job.content_encoding == "gzip"
+
+        with gzip.open(fn, "rb") as fp:
+            text = fp.read().decode("utf-8")
+        assert job.token not in text
+        lines = [line for line in text.splitlines() if '"PUT"' in line]
+        entry = json.loads(lines[0])
+        assert "Content-Encoding" not in entry["request"]["headers"]
+        assert not entry["request"]["base64"]
+        assert "Hello from the job" in entry["request"]["body"]
+        assert json.loads(entry["request"]["body"])["token"].startswith("REDACTED")
+
+
+@run_test_with_tmpdir
+def test_record_streamed(tmpdir):
+    fn = join(tmpdir, "traffic.jsonl.gz")
+    with FakeGitlabAPI(n_runners=1, n_success=1, n_with_artifacts=1) as gitlab_api:
+        fake_job = gitlab_api.completed_jobs[0]
+        url = gitlab_api.url + "/api/v4/jobs/" + fake_job.id + "/artifacts"
+        with recording.record(fn) as recorder:
+            response = recorder.request(
+                "GET", url, headers={"JOB-TOKEN": fake_job.token}, stream=True
+            )
+            assert not response._content_consumed
+            assert response.content == b"some_data"
+
+    with gzip.open(fn, "rb") as fp:
+        (entry,) = [json.loads(line.decode("utf-8")) for line in fp]
+    assert entry["status"] == 200
+    assert entry["body"] is None
+    assert entry["size"] in [None, len(b"some_data")]
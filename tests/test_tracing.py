@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from contextlib import contextmanager
+
+from gitlab_runner_api import Runner, tracing
+from gitlab_runner_api.testing import FakeGitlabAPI
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+class RecordingSpan(tracing.NoOpSpan):
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.ended = False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, end_time=None):
+        self.ended = True
+
+    def is_recording(self):
+        return True
+
+
+class RecordingTracer(object):
+    """Minimal tracer following the interface of OpenTelemetry's Tracer"""
+
+    def __init__(self):
+        self.spans = []
+        self._stack = []
+
+    def context_for(self, span):
+        return span
+
+    def start_span(self, name, context=None, attributes=None):
+        parent = context or (self._stack[-1] if self._stack else None)
+        span = RecordingSpan(name, parent, attributes)
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def start_as_current_span(self, name, context=None, attributes=None):
+        span = self.start_span(name, context, attributes)
+        self._stack.append(span)
+        try:
+            yield span
+        finally:
+            self._stack.pop()
+            span.end()
+
+    def find(self, name):
+        return [s for s in self.spans if s.name == name]
+
+
+def test_disabled():
+    assert tracing.get_tracer() is None
+    assert tracing.start_span("name") is tracing.NOOP_SPAN
+    with tracing.span("name", attribute=1) as span:
+        assert span is tracing.NOOP_SPAN
+        assert not span.is_recording()
+
+
+@gitlab_api.use(n_pending=1)
+def test_job_spans(gitlab_api):
+    tracer = RecordingTracer()
+    tracing.set_tracer(tracer)
+    try:
+        runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+        job = runner.request_job()
+        job.log += "Some output\n"
+        job.set_success()
+    finally:
+        tracing.set_tracer(None)
+
+    (request_span,) = tracer.find("gitlab_runner_api.request_job")
+    (job_span,) = tracer.find("gitlab_runner_api.job")
+    assert job_span.parent is request_span
+    assert job_span.attributes == {
+        "gitlab.job.id": job.id,
+        "gitlab.job.state": "success",
+    }
+    assert job_span.ended
+
+    for name in [
+        "gitlab_runner_api.parse_job_info",
+        "gitlab_runner_api.trace_patch",
+        "gitlab_runner_api.update_state",
+    ]:
+        (span,) = tracer.find(name)
+        assert span.parent is job_span
+        assert span.ended
+
+    # Each HTTP request is a child of the phase which made it
+    http_spans = [s for s in tracer.spans if s.name.startswith("HTTP ")]
+    assert len(http_spans) == 5
+    assert [s.parent.name if s.parent else None for s in http_spans] == [
+        None,
+        None,
+        "gitlab_runner_api.request_job",
+        "gitlab_runner_api.trace_patch",
+        "gitlab_runner_api.update_state",
+    ]
+    assert http_spans[-1].attributes["http.method"] == "PUT"
+    assert http_spans[-1].attributes["http.status_code"] == 200
+    assert http_spans[-1].attributes["gitlab.endpoint"] == "jobs/:id"
@@ -0,0 +1,252 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+from os.path import join
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from gitlab_runner_api import Job, metrics, Runner, transport
+from gitlab_runner_api.logging import logger
+from gitlab_runner_api.testing import (
+    FakeGitlabAPI,
+    InProcessTransport,
+    run_test_with_tmpdir,
+)
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+class CountingTransport(transport.RequestsTransport):
+    def __init__(self):
+        self.methods = Counter()
+
+    def request(self, method, url, **kwargs):
+        self.methods[method] += 1
+        return super(CountingTransport, self).request(method, url, **kwargs)
+
+
+def run_job(gitlab_api, tmpdir, transport=None):
+    """Run a job which uploads and downloads artifacts"""
+    data = b"some artifacts" * 10000
+    artifact_fn = join(tmpdir, "artifacts.zip")
+    with open(artifact_fn, "wb") as fp:
+        fp.write(data)
+
+    runner = Runner.register(gitlab_api.url, gitlab_api.token, transport=transport)
+    job = runner.request_job()
+    job.log += "Hello\n"
+    job.set_success(artifacts=artifact_fn)
+    dest = join(tmpdir, "downloaded.zip")
+    assert job.download_artifacts(job.id, job.token, dest) == (
+        hashlib.sha256(data).hexdigest()
+    )
+    with open(dest, "rb") as fp:
+        assert fp.read() == data
+    (completed,) = gitlab_api.completed_jobs
+    assert completed.status == "success"
+    assert completed.log.endswith("\nHello\n")
+    return runner, job
+
+
+@gitlab_api.use(n_pending=1)
+@run_test_with_tmpdir
+def test_runner_transport(gitlab_api, tmpdir):
+    counting = CountingTransport()
+    runner, job = run_job(gitlab_api, tmpdir, counting)
+    assert runner.transport is counting
+    assert counting.methods == {"POST": 4, "PATCH": 1, "PUT": 1, "GET": 1}
+
+    # The transport isn't serialised
+    loaded = Runner.loads(runner.dumps())
+    assert loaded.transport is None
+    assert loaded == runner
+    loaded_job = Job.loads(job.dumps(), transport=counting)
+    assert loaded_job._runner.transport is counting
+    assert counting.methods["POST"] == 5
+
+
+@gitlab_api.use(n_pending=1, in_process=True)
+@run_test_with_tmpdir
+def test_in_process(gitlab_api, tmpdir):
+    assert isinstance(transport.get_transport(), InProcessTransport)
+    run_job(gitlab_api, tmpdir)
+
+
+def test_in_process_restores_transport():
+    with FakeGitlabAPI(in_process=True):
+        assert isinstance(transport.get_transport(), InProcessTransport)
+    assert transport.get_transport() is transport.DEFAULT_TRANSPORT
+    with pytest.raises(ValueError):
+        with FakeGitlabAPI(serve=True, in_process=True):
+            pass
+
+
+@gitlab_api.use(n_pending=1, serve=True)
+@run_test_with_tmpdir
+def test_session(gitlab_api, tmpdir):
+    session = transport.SessionTransport()
+    try:
+        run_job(gitlab_api, tmpdir, session)
+    finally:
+        session.close()
+
+
+@gitlab_api.use(n_pending=1, serve=True)
+@run_test_with_tmpdir
+def test_httpx(gitlab_api, tmpdir):
+    pytest.importorskip("httpx")
+    client = transport.HTTPXTransport()
+    try:
+        run_job(gitlab_api, tmpdir, client)
+    finally:
+        client.close()
+
+
+@gitlab_api.use(n_pending=1, serve=True)
+@run_test_with_tmpdir
+def test_httpx_metrics(gitlab_api, tmpdir):
+    pytest.importorskip("httpx")
+    collector = metrics.HistogramCollector()
+    metrics.add_collector(collector)
+    client = transport.HTTPXTransport()
+    try:
+        runner, job = run_job(gitlab_api, tmpdir, client)
+    finally:
+        client.close()
+        metrics.remove_collector(collector)
+    assert collector.count("jobs/:id/trace", method="PATCH", status_code=202) == 1
+    assert collector.bytes_sent("jobs/:id/trace") == len(str(job.log))
+    assert collector.bytes_sent("jobs/request") > 0
+    assert collector.count("jobs/:id/artifacts", method="POST") == 1
+    assert collector.bytes_received("jobs/:id/artifacts") > 0
+
+
+def test_httpx_connection_error():
+    pytest.importorskip("httpx")
+    # Find a port which nothing is listening on
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    client = transport.HTTPXTransport()
+    try:
+        with pytest.raises(requests.ConnectionError):
+            Runner.register("http://127.0.0.1:" + str(port), "token", transport=client)
+    finally:
+        client.close()
+
+
+def test_http2_ordered_headers():
+    # Fails if the private httpcore API used to order the headers has changed
+    httpcore = pytest.importorskip("httpcore")
+    pytest.importorskip("h2")
+    client = transport.HTTPXTransport(http2=True)
+    try:
+        pool = client._client._transport._pool
+        origin = httpcore.URL("https://gitlab.invalid").origin
+        connection = pool.create_connection(origin)
+    finally:
+        client.close()
+    assert isinstance(connection, transport._OrderedConnection)
+
+
+def test_http2_ordered_headers_unsupported():
+    pytest.importorskip("httpx")
+    records = []
+    handler = logging.Handler(logging.WARNING)
+    handler.emit = records.append
+    logger.addHandler(handler)
+    try:
+        assert not transport._order_headers(object())
+    finally:
+        logger.removeHandler(handler)
+    assert "Unable to order HTTP/2 request headers" in records[0].getMessage()
+
+
+@gitlab_api.use(n_pending=1, serve=True)
+@run_test_with_tmpdir
+def test_http2(gitlab_api, tmpdir):
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    client = transport.HTTPXTransport(http2=True, http1=False)
+    try:
+        run_job(gitlab_api, tmpdir, client)
+    finally:
+        client.close()
+    assert gitlab_api._rsps.connections == 1
+
+
+@gitlab_api.use(serve=True)
+def test_http2_multiplexing(gitlab_api):
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    n_jobs = 40
+    for i in range(n_jobs):
+        gitlab_api.add_pending_job({"name": "MyJob" + str(i)})
+
+    def run(runner):
+        job = runner.request_job()
+        for i in range(5):
+            job.log += "Line " + str(i) + "\n"
+        job.set_success()
+
+    client = transport.HTTPXTransport(http2=True, http1=False)
+    try:
+        runners = [
+            Runner.register(gitlab_api.url, gitlab_api.token, transport=client)
+            for _ in range(4)
+        ]
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(run, runners * (n_jobs // len(runners))))
+    finally:
+        client.close()
+    assert len(gitlab_api.completed_jobs) == n_jobs
+    # Every request from every runner shared the same connection
+    assert gitlab_api._rsps.connections == 1
+
+
+@gitlab_api.use(n_pending=1, serve=True)
+@run_test_with_tmpdir
+def test_http2_slow_connect(gitlab_api, tmpdir):
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    # Connecting to a listener whose queue is full waits until the timeout
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    queued = socket.create_connection(listener.getsockname())
+    slow_url = "http://127.0.0.1:" + str(listener.getsockname()[1])
+
+    client = transport.HTTPXTransport(http2=True, http1=False)
+    errors = []
+
+    def slow_request():
+        try:
+            client.request("GET", slow_url, timeout=5)
+        except requests.RequestException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=slow_request)
+    try:
+        thread.start()
+        time.sleep(0.2)
+        # Requests to other servers don't wait for the connection to be made
+        run_job(gitlab_api, tmpdir, client)
+        assert thread.is_alive()
+        thread.join()
+    finally:
+        client.close()
+        queued.close()
+        listener.close()
+    assert isinstance(errors[0], requests.Timeout)
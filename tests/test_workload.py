@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import pytest
+
+from gitlab_runner_api import Runner
+from gitlab_runner_api.testing import FakeGitlabAPI, Workload
+
+
+gitlab_api = FakeGitlabAPI()
+
+
+def test_requires_limit():
+    with pytest.raises(ValueError):
+        Workload()
+
+
+@gitlab_api.use(n_runners=1, n_success=3, n_with_artifacts=2)
+def test_payload_sizes(gitlab_api):
+    workload = Workload(
+        n_jobs=5,
+        seed=1,
+        n_variables=lambda rng: rng.randint(10, 20),
+        variable_size=8,
+        n_steps=2,
+        n_script_lines=4,
+        n_dependencies=2,
+        n_credentials=3,
+        log_size=1000,
+    )
+    workload.run(gitlab_api)
+    assert workload.n_enqueued == 5
+    assert len(gitlab_api.pending_jobs) == 5
+
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    job = runner.request_job()
+    variables = {v.key: v.value for v in job.variables}
+    assert variables["WORKLOAD_LOG_SIZE"] == "1000"
+    workload_vars = [k for k in variables if k.startswith("WORKLOAD_VAR_")]
+    assert 10 <= len(workload_vars) <= 20
+    assert all(len(variables[k]) == 8 for k in workload_vars)
+    assert len(job._job_info["steps"]) == 2
+    assert len(job._job_info["steps"][1]["script"]) == 4
+    assert len(job._job_info["credentials"]) == 3
+    assert [d["id"] for d in job._job_info["dependencies"]] == [
+        int(j.id) for j in gitlab_api.completed_jobs[:2]
+    ]
+
+
+@gitlab_api.use()
+def test_reproducible(gitlab_api):
+    def variables(seed):
+        workload = Workload(
+            n_jobs=3, seed=seed, n_variables=lambda rng: rng.randint(0, 100)
+        )
+        return [workload.job_info(gitlab_api)["variables"] for _ in range(3)]
+
+    assert variables(1) == variables(1)
+    assert variables(1) != variables(2)
+
+
+@gitlab_api.use()
+def test_arrival_rate(gitlab_api):
+    workload = Workload(rate=200, n_jobs=20, poisson=False)
+    start = time.time()
+    workload.start(gitlab_api)
+    workload.join(10)
+    assert time.time() - start >= 0.09
+    assert len(gitlab_api.pending_jobs) == 20
+
+    runner = Runner.register("https://gitlab.cern.ch", gitlab_api.token)
+    for _ in range(20):
+        runner.request_job()
+    latencies = Workload.pickup_latencies(gitlab_api)
+    assert len(latencies) == 20
+    assert all(latency >= 0 for latency in latencies)
+
+
+@gitlab_api.use()
+def test_stop(gitlab_api):
+    workload = Workload(rate=1000, seed=3)
+    workload.start(gitlab_api)
+    time.sleep(0.05)
+    workload.stop()
+    n_enqueued = workload.n_enqueued
+    assert n_enqueued > 0
+    time.sleep(0.02)
+    assert workload.n_enqueued == n_enqueued == len(gitlab_api.pending_jobs)